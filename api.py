@@ -1,49 +1,83 @@
+import json
+import logging
 import os
-import io
+import re
+import zipfile
 from pathlib import Path
 from tempfile import NamedTemporaryFile
-import time
-from typing import Optional
+import threading
+from itertools import chain, islice
+from typing import Callable, Literal, Optional
 import uvicorn
-from fastapi import FastAPI, HTTPException, Body
+from fastapi import FastAPI, HTTPException, Body, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
-from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
 from dotenv import load_dotenv
-from openai import OpenAI
 from pydub import AudioSegment
-import requests
-import boto3
-from google import genai
+from audio_cache import CacheStats, segment_cache
+from audio_decode import stream_decoder
+from tts_clients import client_registry
+from audio_assembler import assemble_segments, harmonize_segments
+from script_parser import check_voice_map, parse_script
+from text_chunker import iter_plan_dialogue, iter_plan_segments
+from synthesis import (
+    SegmentSynthesisError,
+    get_concurrency,
+    get_download_concurrency,
+    get_worker_count,
+    iter_in_order,
+    iter_parts_in_order,
+)
+from rate_limit import limiter_info
+from providers import (
+    RenderSettings,
+    decode_segment_audio,
+    estimate_cost,
+    fetch_segment_audio,
+    get_provider,
+    list_providers,
+    provider_names,
+    submit_segment_audio,
+)
+from jobs import JobManager, JobQueueFull
+from batch import plan_batch
+import metrics
+from audio_encode import (
+    OUTPUT_FORMATS,
+    encode_audio,
+    encode_stream,
+    encode_to_file,
+    format_for_path,
+    get_output_format,
+    media_type,
+    resolve_bitrate,
+    wav_header,
+    wav_stream_header,
+)
+from audio_store import OutputWriter, audio_store, content_etag, etag_matches
+from loudness import combine_reports, needs_processing, normalize_audio
+from render_manifest import (
+    RenderManifest,
+    load_previous_render,
+    manifest_entry,
+    manifest_path,
+    plan_manifest,
+    record_offsets,
+    segment_reuser,
+)
 
 # 加載環境變量
 load_dotenv()
 
-# 獲取 API Keys
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
-AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
-AWS_REGION = os.getenv("AWS_REGION", "ap-northeast-1")
-
-# 標準音頻模型和聲音選項
-STANDARD_AUDIO_MODELS = [
-    "gpt-4o-mini-tts",
-    "gpt-4o-audio-preview",
-    "tts-1",
-    "tts-1-hd",
-]
-STANDARD_VOICES = [
-    "alloy", "echo", "fable", "onyx", 
-    "nova", "shimmer", "coral", "sage",
-]
-GEMINI_VOICES = [
-    "Puck", "Charon", "Kore", 
-    "Fenrir", "Aoede", "Alnilam", "Algieba"
-]
-POLLY_VOICES = ["Zhiyu"]
-TAI_TTS_MODELS = ["model6"]
-TAI_TTS_URL = "https://learn-language.tokyo/taiwanesettsapi/"
+logger = logging.getLogger(__name__)
+
+# 單次批次請求的腳本數上限
+BATCH_MAX_SCRIPTS = int(os.getenv("TTS_BATCH_MAX_SCRIPTS", "100"))
+# 未指定 render_mode 時的組裝方式：memory（整份音頻在記憶體中組裝）或 stream（依序編碼並直接寫入文件）
+RENDER_MODE = os.getenv("TTS_RENDER_MODE", "memory")
 
 # 創建 FastAPI 應用
 app = FastAPI(
@@ -59,352 +93,698 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # 允許所有方法
     allow_headers=["*"],  # 允許所有頭部
+    # 增量重新生成資訊，以及播放器拖曳 / 續傳所需的標頭
+    expose_headers=[
+        "X-Audio-File", "X-Segments-Reused", "X-Segments-Regenerated",
+        "ETag", "Accept-Ranges", "Content-Range", "Content-Length", "Server-Timing",
+    ],
 )
 
-# 優化腳本處理 - 合併相同說話者連續文本
-def optimize_script(script):
-    lines = [line.strip() for line in script.splitlines() if line.strip()]
-    optimized = []
-    current_speaker = None
-    current_text = ""
-    
-    for line in lines:
-        if line.lower().startswith("speaker-1:"):
-            speaker = "speaker-1"
-            text = line.split(":", 1)[1].strip()
-        elif line.lower().startswith("speaker-2:"):
-            speaker = "speaker-2"
-            text = line.split(":", 1)[1].strip()
-        else:
-            speaker = "speaker-1"  # 默認使用說話者1
-            text = line
-        
-        # 如果說話者變了，保存之前的文本並開始新的
-        if speaker != current_speaker and current_text:
-            optimized.append((current_speaker, current_text))
-            current_text = text
-            current_speaker = speaker
-        else:
-            # 相同說話者，合併文本（加空格）
-            if current_text:
-                current_text += " " + text
-            else:
-                current_text = text
-                current_speaker = speaker
-                
-    # 添加最後一個說話者的文本
-    if current_text:
-        optimized.append((current_speaker, current_text))
-        
-    return optimized
+def iter_plan_script(script, provider: str, multi_speaker: bool = False, voice_map: dict = None):
+    """
+    逐行解析腳本，依句子邊界與 provider 的輸入上限切分過長片段，逐一產出 (speaker, text)
+
+    voice_map 的鍵為可辨識的具名說話者。multi_speaker 時將連續的對話輪次合併為多說話者片段，一次請求合成多輪。
+    """
+    segments = parse_script(script, voice_map or ())
+    if multi_speaker:
+        return iter_plan_dialogue(segments, provider)
+    return iter_plan_segments(segments, provider)
+
+def plan_script(script, provider: str, multi_speaker: bool = False, voice_map: dict = None) -> list:
+    """iter_plan_script 的列表版本"""
+    return list(iter_plan_script(script, provider, multi_speaker, voice_map))
+
+def iter_script_segments(
+    segments,
+    settings: RenderSettings,
+    status_log: list = None,
+    cache_stats: CacheStats = None,
+    progress_callback: Callable[[int], None] = None,
+    decode: bool = True,
+    render_metrics: metrics.RenderMetrics = None,
+):
+    """
+    依腳本順序逐一產出各片段的 AudioSegment（decode=False 時產出 provider 原生格式的 bytes）
 
-def get_mp3(text: str, voice: str, audio_model: str, api_key: str, instructions: str = None) -> bytes:
-    """使用 OpenAI TTS API 生成音頻"""
-    MAX_TEXT_LENGTH = 1000
+    segments 可為 generator（例如 iter_plan_script），只預先取用並行合成所需的片段，第 1 段規劃好即開始合成；
+    已有音頻的片段（例如從上次輸出切出）以 AudioSegment 代替 (speaker, text)，依序原樣產出。
+    片段會並行生成，第 N 段一完成即產出，不必等待後續片段；
+    失敗時拋出帶有片段序號的 SegmentSynthesisError。
+    progress_callback(已完成片段數) 會在每個片段完成後呼叫。
+    worker 合成後只將音頻排入解碼即繼續下一個片段，壓縮格式的片段合併解碼；
+    各片段的合成耗時與等待解碼結果的耗時記錄到 render_metrics。
+    """
+    if render_metrics is None:
+        render_metrics = metrics.RenderMetrics(settings.provider, settings.model, "api")
+    
+    # 片段在多個執行緒中完成，以鎖保護完成計數
+    progress_lock = threading.Lock()
+    completed = [0]
     
-    client = OpenAI(api_key=api_key)
+    def logged(segments):
+        for segment in segments:
+            if status_log is not None and not isinstance(segment, AudioSegment):
+                status_log.append(f"[{segment[0]}] {segment[1]}")
+            yield segment
     
-    # 如果文本長度超過限制，分割文本
-    if len(text) > MAX_TEXT_LENGTH:
-        print(f"Text too long ({len(text)} chars), splitting into chunks")
-        text_chunks = []
-        for i in range(0, len(text), MAX_TEXT_LENGTH):
-            text_chunks.append(text[i:i + MAX_TEXT_LENGTH])
+    def synthesize_segment(index: int, segment):
+        if isinstance(segment, AudioSegment):
+            result = segment
+        else:
+            speaker, text = segment
+            with render_metrics.stage("synthesize"):
+                audio_chunk = fetch_segment_audio(settings, speaker, text, cache_stats)
+            
+            # 依 provider 宣告的原生格式與取樣率排入解碼，結果在產出時取得
+            if decode:
+                result = submit_segment_audio(settings.provider, audio_chunk, settings.audio_format)
+            else:
+                result = audio_chunk
         
-        combined_audio = b""
-        for chunk in text_chunks:
-            try:
-                api_params = {
-                    "model": audio_model,
-                    "voice": voice,
-                    "input": chunk,
-                }
-                if instructions:
-                    api_params["instructions"] = instructions
-                
-                with client.audio.speech.with_streaming_response.create(**api_params) as response:
-                    with io.BytesIO() as file:
-                        for audio_chunk in response.iter_bytes():
-                            file.write(audio_chunk)
-                        combined_audio += file.getvalue()
-            except Exception as e:
-                print(f"Error generating audio for chunk: {e}")
-                raise
+        if progress_callback:
+            with progress_lock:
+                completed[0] += 1
+                progress_callback(completed[0])
         
-        return combined_audio
-    else:
+        return result
+    
+    # 並行生成所有片段，結果依腳本順序產出
+    results = iter_in_order(
+        render_metrics.trace.profiled(synthesize_segment), logged(segments), get_worker_count(settings.provider)
+    )
+    if not decode:
+        yield from results
+        return
+    for index, decoding in enumerate(results, 1):
+        if isinstance(decoding, AudioSegment):
+            yield decoding
+            continue
         try:
-            api_params = {
-                "model": audio_model,
-                "voice": voice,
-                "input": text,
-            }
-            if instructions:
-                api_params["instructions"] = instructions
-            
-            with client.audio.speech.with_streaming_response.create(**api_params) as response:
-                with io.BytesIO() as file:
-                    for chunk in response.iter_bytes():
-                        file.write(chunk)
-                    return file.getvalue()
+            with render_metrics.stage("decode"):
+                audio_segment = decoding.result()
         except Exception as e:
-            print(f"Error generating audio: {e}")
-            raise
+            raise SegmentSynthesisError(index, e) from e
+        yield audio_segment
 
-def get_gemini_pcm(text: str, voice: str, api_key: str) -> bytes:
-    """使用 Gemini TTS API 生成音頻"""
-    try:
-        client = genai.Client(api_key=api_key)
-        response = client.models.generate_content(
-            model='gemini-2.0-flash-exp',
-            contents=text,
-            config={
-                'speech_config': {
-                    'voice_config': {
-                        'prebuilt_voice_config': {
-                            'voice_name': voice
-                        }
-                    }
-                }
-            }
-        )
-        
-        # 提取音頻數據
-        pcm_data = b''
-        for part in response.candidates[0].content.parts:
-            if part.inline_data:
-                pcm_data += part.inline_data.data
-        
-        if not pcm_data:
-            raise ValueError("未從 Gemini API 收到音頻數據")
-        
-        return pcm_data
-    except Exception as e:
-        print(f"Gemini TTS 錯誤: {e}")
-        raise
+def iter_script_parts(
+    segments,
+    settings: RenderSettings,
+    render_metrics: metrics.RenderMetrics,
+):
+    """
+    依腳本順序產出 (片段序號, AudioSegment)，片段結束時產出 (片段序號, None)
 
-def get_polly_mp3(text: str, voice: str, api_key: str, secret_key: str, region: str) -> bytes:
-    """使用 AWS Polly 生成音頻"""
-    try:
-        polly = boto3.client(
-            'polly',
-            aws_access_key_id=api_key,
-            aws_secret_access_key=secret_key,
-            region_name=region
-        )
-        
-        response = polly.synthesize_speech(
-            Text=text,
-            OutputFormat='mp3',
-            VoiceId=voice,
-            Engine='neural'
-        )
-        
-        audio_data = response['AudioStream'].read()
-        return audio_data
-    except Exception as e:
-        print(f"AWS Polly 錯誤: {e}")
-        raise
+    支援串流合成的 provider（Gemini 的 PCM、台語 TTS 下載中的 WAV）每收到一段音頻即解碼產出，
+    不必等待整個片段完成；其他 provider 每個片段產出一次完整音頻。片段並行生成，失敗時拋出 SegmentSynthesisError。
+    segments 可為 generator（例如 iter_plan_script），第 1 段規劃好即開始合成。
+    """
+    spec = settings.spec
 
-def get_tai_tts_mp3(text: str, model: str) -> bytes:
-    """使用台語 TTS API 生成音頻"""
-    try:
-        # Step 1: 發送 POST 請求獲取 JSON 響應
-        response = requests.post(
-            TAI_TTS_URL,
-            json={"text": text, "model": model},
-            timeout=60
-        )
-        response.raise_for_status()
-        
-        # Step 2: 從 JSON 響應中獲取 audio_url
-        json_data = response.json()
-        audio_url = json_data.get("audio_url")
-        
-        if not audio_url:
-            raise ValueError("台語 TTS API 未返回 audio_url")
-        
-        # Step 3: 下載 WAV 文件
-        audio_response = requests.get(audio_url, timeout=60)
-        audio_response.raise_for_status()
-        
-        return audio_response.content
-    except Exception as e:
-        print(f"台語 TTS 錯誤: {e}")
-        raise
+    def synthesize_segment(index: int, segment: tuple, emit: Callable):
+        speaker, text = segment
+        decoder = stream_decoder(spec.audio_format, spec.sample_rate)
+
+        def on_part(data: bytes):
+            with render_metrics.stage("decode"):
+                part = decoder.feed(data)
+            if part is not None:
+                emit(part)
+
+        with render_metrics.stage("synthesize"):
+            fetch_segment_audio(settings, speaker, text, on_part=on_part)
+        with render_metrics.stage("decode"):
+            part = decoder.finish()
+        if part is not None:
+            emit(part)
+
+    yield from iter_parts_in_order(
+        render_metrics.trace.profiled(synthesize_segment), segments, get_worker_count(settings.provider)
+    )
 
 def generate_audio_from_script(
     script: str,
-    provider: str = "openai",
-    # OpenAI 參數
-    audio_api_key: str = None,
-    audio_model: str = "gpt-4o-mini-tts",
-    speaker1_voice: str = "onyx",
-    speaker2_voice: str = "nova",
-    speaker1_instructions: str = "保持活潑愉快的語氣",
-    speaker2_instructions: str = "保持活潑愉快的語氣",
-    # Gemini 參數
-    gemini_api_key: str = None,
-    gemini_male_voice: str = "Puck",
-    gemini_female_voice: str = "Aoede",
-    # AWS Polly 參數
-    aws_access_key: str = None,
-    aws_secret_key: str = None,
-    aws_region: str = "ap-northeast-1",
-    polly_voice: str = "Zhiyu",
-    # 台語 TTS 參數
-    tai_model: str = "model6",
-    # 通用參數
+    settings: RenderSettings,
     volume_boost: float = 0,
-) -> tuple[bytes, list]:
-    """從腳本生成音頻，支持多個 TTS provider"""
+    progress_callback: Callable[[int, Optional[int]], None] = None,
+    previous_audio: str = None,
+    normalize: str = "gain",
+    audio_format: str = "mp3",
+    bitrate: str = None,
+    render_metrics: metrics.RenderMetrics = None,
+    writer: OutputWriter = None,
+) -> tuple[Optional[bytes], list, RenderManifest]:
+    """
+    從腳本生成音頻，provider 與其設定由 settings 指定
+
+    normalize 為音量處理模式：lufs（響度正規化）、gain（固定增益 volume_boost dB）或 none。
+    audio_format 為輸出格式（mp3 / opus / aac / wav / pcm），bitrate 未指定時使用格式預設值。
+    指定 previous_audio（上次輸出的路徑）時只重新生成新增或修改的片段，其餘從上次輸出切出。
+    指定 writer（audio_store.writer）時以串流組裝將音頻依序寫入 writer，不在記憶體中保留整份音頻，回傳的音頻為 None。
+    progress_callback(已完成片段數, 片段總數) 在開始時與每個片段完成後呼叫；腳本邊解析邊合成，規劃完成前片段總數為 None。
+    各階段耗時記錄到 render_metrics（未指定時自行建立）。
+    回傳 (音頻, 日誌, manifest)。
+    """
     status_log = []
+    cache_stats = CacheStats()
+    if render_metrics is None:
+        render_metrics = metrics.RenderMetrics(settings.provider, settings.model, "api")
+    spec = settings.spec
+    output_format = get_output_format(audio_format)
+    manifest = RenderManifest(audio_format=output_format.name)
     
-    # 優化腳本處理
-    optimized_script = optimize_script(script)
+    # 增量重新生成：與上次的 manifest 比對，未變更的片段由快取或上次輸出取得
+    previous = load_previous_render(previous_audio) if previous_audio else None
+    if previous_audio and previous is None:
+        status_log.append("[增量] 找不到上次的輸出或 manifest，完整重新生成")
+    reuse = segment_reuser(previous)
     
-    # 使用 pydub 處理音頻合併
-    combined_segment = None
+    # 邊解析邊合成：片段規劃好即加入 manifest 並送去合成，不預先建立整份片段列表；
+    # 從上次輸出切出的片段以 AudioSegment 代替 (speaker, text)
+    planning_done = False
     
-    # 處理每一段
-    for speaker, text in optimized_script:
-        status_log.append(f"[{speaker}] {text}")
-        
-        try:
-            audio_chunk = None
-            
-            # 根據 provider 生成音頻
-            if provider == "openai":
-                if not audio_api_key:
-                    raise ValueError("缺少 OpenAI API Key")
-                voice = speaker1_voice if speaker == "speaker-1" else speaker2_voice
-                instructions = speaker1_instructions if speaker == "speaker-1" else speaker2_instructions
-                audio_chunk = get_mp3(text, voice, audio_model, audio_api_key, instructions)
-                audio_format = "mp3"
-                
-            elif provider == "gemini":
-                if not gemini_api_key:
-                    raise ValueError("缺少 Gemini API Key")
-                voice = gemini_male_voice if speaker == "speaker-1" else gemini_female_voice
-                audio_chunk = get_gemini_pcm(text, voice, gemini_api_key)
-                audio_format = "raw"
-                
-            elif provider == "polly":
-                if not aws_access_key or not aws_secret_key:
-                    raise ValueError("缺少 AWS 憑證")
-                audio_chunk = get_polly_mp3(text, polly_voice, aws_access_key, aws_secret_key, aws_region)
-                audio_format = "mp3"
-                
-            elif provider == "taiwanese":
-                audio_chunk = get_tai_tts_mp3(text, tai_model)
-                audio_format = "wav"
-                
-            else:
-                raise ValueError(f"不支援的 provider: {provider}")
-            
-            # 將音頻轉換為 AudioSegment
-            with NamedTemporaryFile(suffix=f".{audio_format}", delete=False) as temp_file:
-                temp_file.write(audio_chunk)
-                temp_file_path = temp_file.name
-            
-            # 根據格式讀取音頻
-            if audio_format == "mp3":
-                chunk_segment = AudioSegment.from_mp3(temp_file_path)
-            elif audio_format == "wav":
-                chunk_segment = AudioSegment.from_wav(temp_file_path)
-            elif audio_format == "raw":
-                # Gemini 返回 24kHz 單聲道 PCM
-                chunk_segment = AudioSegment(
-                    data=audio_chunk,
-                    sample_width=2,
-                    frame_rate=24000,
-                    channels=1
-                )
-                os.unlink(temp_file_path)
-                temp_file_path = None
-            
-            # 刪除臨時文件
-            if temp_file_path and os.path.exists(temp_file_path):
-                os.unlink(temp_file_path)
-            
-            # 合併音頻段
-            if combined_segment is None:
-                combined_segment = chunk_segment
-            else:
-                combined_segment += chunk_segment
-                
-        except Exception as e:
-            status_log.append(f"[錯誤] 無法生成音頻: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"無法生成音頻: {str(e)}")
+    def plan_items():
+        nonlocal planning_done
+        planned = render_metrics.timed(
+            "parse", iter_plan_script(script, settings.provider, settings.multi_speaker, settings.voice_map)
+        )
+        for speaker, text in planned:
+            entry = manifest_entry(speaker, text, settings)
+            manifest.entries.append(entry)
+            spliced = reuse(entry)
+            yield (speaker, text) if spliced is None else spliced
+        planning_done = True
+    
+    items = plan_items()
+    head = list(islice(items, 2))
+    
+    # 單一片段、provider 可直接輸出所要求的格式、未指定位元率且不需調整音量時，
+    # 以該格式向 provider 要求音頻並直接使用原始 bytes，不解碼也不重新編碼
+    native_rate = spec.native_sample_rate(output_format.name)
+    passthrough = (
+        len(head) == 1 and not isinstance(head[0], AudioSegment) and native_rate is not None and not bitrate
+        and not needs_processing(normalize, volume_boost)
+    )
+    fetch_settings = settings.with_native_format(output_format.name) if passthrough else settings
+    
+    # 片段總數在規劃完成（manifest 收齊所有片段）後才確定，之前回報為 None；
+    # 從上次輸出切出的片段也計入已完成
+    def report_progress(completed: int):
+        progress_callback(completed, len(manifest.entries) if planning_done else None)
+    
+    if progress_callback:
+        report_progress(0)
+    
+    # 並行生成需要的片段，結果依腳本順序產出
+    try:
+        generated = iter_script_segments(
+            chain(head, items),
+            fetch_settings,
+            status_log=status_log,
+            cache_stats=cache_stats,
+            progress_callback=report_progress if progress_callback else None,
+            decode=not passthrough,
+            render_metrics=render_metrics,
+        )
+        if passthrough:
+            chunks = list(generated)
+        elif writer is not None:
+            # 串流組裝：片段依腳本順序一完成就處理並寫出
+            audio_seconds = render_segments_to_file(
+                generated,
+                manifest,
+                status_log,
+                render_metrics,
+                output_format,
+                writer,
+                bitrate,
+                volume_boost,
+                normalize,
+            )
+        else:
+            chunks = list(generated)
+    except SegmentSynthesisError as e:
+        status_log.append(f"[錯誤] 片段 {e.index} 無法生成音頻: {str(e.cause)}")
+        render_metrics.finish("error")
+        raise HTTPException(status_code=500, detail=f"無法生成音頻: 片段 {e.index} 生成失敗: {str(e.cause)}")
+    
+    # 最後一個片段可能在規劃器確認沒有更多片段之前完成，完成後再回報一次確定的總數
+    if progress_callback:
+        progress_callback(len(manifest.entries), len(manifest.entries))
+    if previous is not None:
+        status_log.append(f"[增量] {manifest.summary()}")
+    status_log.append(f"[快取] {cache_stats.summary()}")
+    cost = estimate_cost(settings.provider, cache_stats.synthesized_characters)
+    status_log.append(f"[費用] 預估 ${cost:.4f}（{cache_stats.synthesized_characters} 字符）")
+    
+    if passthrough:
+        manifest.frame_rate = native_rate
+        status_log.append(f"[輸出] {output_format.name}（直接使用 provider 原始音頻）")
+        render_metrics.finish(audio_format=output_format.name, audio_bytes=len(chunks[0]))
+        if writer is not None:
+            writer.write(chunks[0])
+            return None, status_log, manifest
+        return chunks[0], status_log, manifest
+    
+    if writer is not None:
+        if not writer.size:
+            render_metrics.finish("empty")
+        else:
+            render_metrics.finish(audio_format=output_format.name, audio_bytes=writer.size, audio_seconds=audio_seconds)
+        return None, status_log, manifest
+    
+    combined_audio, audio_seconds = render_segments(
+        chunks,
+        manifest,
+        status_log,
+        render_metrics,
+        output_format,
+        bitrate,
+        volume_boost,
+        normalize,
+    )
+    if not combined_audio:
+        render_metrics.finish("empty")
+    else:
+        render_metrics.finish(
+            audio_format=output_format.name,
+            audio_bytes=len(combined_audio),
+            audio_seconds=audio_seconds,
+        )
+    
+    return combined_audio, status_log, manifest
+
+def render_segments(
+    chunks: list,
+    manifest: RenderManifest,
+    status_log: list,
+    render_metrics: metrics.RenderMetrics,
+    output_format,
+    bitrate: str = None,
+    volume_boost: float = 0,
+    normalize: str = "gain",
+) -> tuple[bytes, float]:
+    """
+    依腳本順序組裝各片段的 AudioSegment，處理音量後編碼為輸出格式，並將片段位置記錄到 manifest
+
+    回傳 (音頻, 長度秒數)；沒有任何音頻時回傳 (b"", 0)。
+    """
+    # 統一格式後記錄各片段位置，再一次配置緩衝區合併所有音頻段
+    chunk_segments = harmonize_segments(chunks)
+    record_offsets(manifest, chunk_segments)
+    with render_metrics.stage("assemble"):
+        combined_segment = assemble_segments(chunk_segments)
     
     # 如果沒有生成任何音頻段
     if combined_segment is None:
         status_log.append("[錯誤] 沒有生成任何音頻")
-        return b"", status_log
+        return b"", 0.0
+    
+    # 響度正規化或固定增益（lufs 模式各片段分別正規化）
+    try:
+        with render_metrics.stage("normalize"):
+            combined_segment, loudness = normalize_audio(
+                combined_segment,
+                normalize,
+                volume_boost,
+                segment_starts=[entry.offset_frames for entry in manifest.entries],
+            )
+        manifest.normalize = normalize
+        if normalize == "gain":
+            manifest.volume_boost = volume_boost
+        if loudness.mode != "none":
+            status_log.append(f"[音量] {loudness.summary()}")
+    except Exception as e:
+        status_log.append(f"[警告] 音量調整失敗: {str(e)}")
+    
+    # 將 AudioSegment 編碼為輸出格式
+    with render_metrics.stage("encode"):
+        combined_audio = encode_audio(combined_segment, output_format, bitrate)
+    bitrate_info = resolve_bitrate(output_format, bitrate)
+    status_log.append(f"[輸出] {output_format.name}" + (f" {bitrate_info}" if bitrate_info else ""))
+    return combined_audio, combined_segment.duration_seconds
+
+def render_segments_to_file(
+    chunks,
+    manifest: RenderManifest,
+    status_log: list,
+    render_metrics: metrics.RenderMetrics,
+    output_format,
+    writer: OutputWriter,
+    bitrate: str = None,
+    volume_boost: float = 0,
+    normalize: str = "gain",
+) -> float:
+    """
+    串流組裝：依腳本順序逐一處理各片段的音量，轉為第 1 段的取樣率與聲道數後送入單一 ffmpeg 程序，
+    由 ffmpeg 直接寫入 writer 的文件（WAV 與 PCM 直接寫出），並將片段位置記錄到 manifest
+
+    chunks 可為 generator，任何時間只保留處理中的片段，記憶體用量與音頻總長度無關；
+    lufs 模式的響度正規化與 true peak 限幅逐片段進行。回傳長度秒數，沒有任何音頻時回傳 0。
+    """
+    chunks = iter(chunks)
+    first = next(chunks, None)
+    if first is None:
+        status_log.append("[錯誤] 沒有生成任何音頻")
+        return 0.0
+    frame_rate, channels = first.frame_rate, first.channels
+    manifest.frame_rate = frame_rate
+    reports = []
+    frames = 0
+    
+    def pcm_chunks():
+        nonlocal frames, normalize
+        # manifest 的項目隨片段規劃逐一加入，以索引取用
+        for index, segment in enumerate(chain([first], chunks)):
+            entry = manifest.entries[index]
+            with render_metrics.stage("assemble"):
+                segment = segment.set_channels(channels).set_frame_rate(frame_rate).set_sample_width(2)
+            entry.offset_frames = frames
+            entry.frames = len(segment.raw_data) // segment.frame_width
+            frames += entry.frames
+            try:
+                with render_metrics.stage("normalize"):
+                    segment, loudness = normalize_audio(segment, normalize, volume_boost)
+                reports.append(loudness)
+            except Exception as e:
+                status_log.append(f"[警告] 音量調整失敗: {str(e)}")
+                normalize = "none"
+            # 正規化後的 raw_data 可能為 bytearray
+            yield bytes(segment.raw_data)
+    
+    source = pcm_chunks()
+    try:
+        if output_format.ffmpeg_format is not None:
+            # 壓縮格式由 ffmpeg 直接寫入輸出文件
+            encode_to_file(source, output_format, writer.temp_path, frame_rate, channels, bitrate)
+            writer.refresh()
+        else:
+            header = wav_header(frame_rate, channels) if output_format.name == "wav" else b""
+            writer.write(header)
+            for data in source:
+                writer.write(data)
+            if header:
+                # 寫完後補上標頭的長度欄位
+                writer.overwrite(0, wav_header(frame_rate, channels, data_bytes=writer.size - len(header)))
+    finally:
+        source.close()
+    
+    manifest.normalize = normalize
+    if normalize == "gain":
+        manifest.volume_boost = volume_boost
+    loudness = combine_reports(reports)
+    if loudness.mode != "none":
+        status_log.append(f"[音量] 逐片段處理｜{loudness.summary()}")
+    bitrate_info = resolve_bitrate(output_format, bitrate)
+    status_log.append(f"[輸出] {output_format.name}" + (f" {bitrate_info}" if bitrate_info else "") + "（串流組裝）")
+    return frames / frame_rate
+
+def generate_batch(
+    scripts: list,
+    settings: RenderSettings,
+    volume_boost: float = 0,
+    normalize: str = "gain",
+    audio_format: str = "mp3",
+    bitrate: str = None,
+    render_metrics: metrics.RenderMetrics = None,
+) -> tuple[list, dict]:
+    """
+    批次生成多個腳本，跨腳本去重：聲音、語氣與文本相同的片段只合成一次
+
+    所有唯一片段共用 provider 的並行上限，依首次出現順序合成；每個腳本所需片段到齊即組裝並保存，
+    共用片段在最後一個使用它的腳本完成後釋放。某個片段失敗只影響用到它的腳本。
+    回傳 (各腳本結果, 批次摘要)。
+    """
+    if render_metrics is None:
+        render_metrics = metrics.RenderMetrics(settings.provider, settings.model, "batch")
+    output_format = get_output_format(audio_format)
+    with render_metrics.stage("parse"):
+        planned = [
+            plan_script(script, settings.provider, settings.multi_speaker, settings.voice_map) for script in scripts
+        ]
+    plan = plan_batch(planned, settings)
+    cache_stats = CacheStats()
     
-    # 如果需要調整音量
-    if volume_boost > 0:
+    def synthesize_segment(index: int, segment: tuple):
+        speaker, text = segment
         try:
-            combined_segment = combined_segment + volume_boost
-            status_log.append(f"[音量] 已增加 {volume_boost} dB")
+            with render_metrics.stage("synthesize"):
+                audio_chunk = fetch_segment_audio(settings, speaker, text, cache_stats)
+            with render_metrics.stage("decode"):
+                return decode_segment_audio(settings.provider, audio_chunk, settings.audio_format)
         except Exception as e:
-            status_log.append(f"[警告] 音量調整失敗: {str(e)}")
-    
-    # 將 AudioSegment 轉換為二進制數據
-    output = io.BytesIO()
-    combined_segment.export(output, format="mp3")
-    combined_audio = output.getvalue()
-    
-    return combined_audio, status_log
-
-def save_audio_file(audio_data: bytes) -> str:
-    """將音頻數據保存為臨時文件"""
-    temp_dir = Path("./temp_audio")
-    temp_dir.mkdir(exist_ok=True)
-    # 清理舊文件
-    for old_file in temp_dir.glob("*.mp3"):
-        if old_file.stat().st_mtime < (time.time() - 24*60*60):  # 24小時前的文件
-            old_file.unlink()
-    # 創建新的臨時文件
-    temp_file = NamedTemporaryFile(
-        dir=temp_dir,
-        delete=False,
-        suffix=".mp3"
+            # 回傳例外而非拋出，其他腳本繼續生成
+            return e
+    
+    results = [None] * len(scripts)
+    decoded = {}
+    uses = list(plan.uses)
+    
+    def render_script(script_index: int):
+        keys = plan.keys[script_index]
+        chunks = [decoded[key] for key in keys]
+        manifest = plan_manifest(planned[script_index], settings)
+        manifest.audio_format = output_format.name
+        status_log = []
+        result = {"index": script_index, "segments": len(keys)}
+        failure = next((chunk for chunk in chunks if isinstance(chunk, Exception)), None)
+        if failure is not None:
+            result.update(status="failed", error=f"片段生成失敗: {failure}")
+        else:
+            audio_data, audio_seconds = render_segments(
+                chunks, manifest, status_log, render_metrics, output_format, bitrate, volume_boost, normalize
+            )
+            if audio_data:
+                with render_metrics.stage("save"):
+                    audio_path = save_audio_file(audio_data, manifest, output_format.name)
+                result.update(
+                    status="success",
+                    file_name=os.path.basename(audio_path),
+                    bytes=len(audio_data),
+                    duration_seconds=round(audio_seconds, 3),
+                )
+            else:
+                result.update(status="failed", error="沒有生成任何音頻")
+        result["logs"] = status_log
+        results[script_index] = result
+        # 釋放不再需要的片段
+        for key in keys:
+            uses[key] -= 1
+            if uses[key] == 0:
+                del decoded[key]
+    
+    next_script = 0
+    
+    def render_ready(ready: int):
+        """組裝所需片段都已合成（唯一片段索引 <= ready）的腳本"""
+        nonlocal next_script
+        while next_script < len(scripts) and plan.ready_after(next_script) <= ready:
+            render_script(next_script)
+            next_script += 1
+    
+    # 依序取得唯一片段，所需片段到齊的腳本立即組裝
+    render_ready(-1)
+    generated = iter_in_order(
+        render_metrics.trace.profiled(synthesize_segment), plan.unique, get_worker_count(settings.provider)
+    )
+    for index, segment in enumerate(generated):
+        decoded[index] = segment
+        render_ready(index)
+    
+    succeeded = [result for result in results if result["status"] == "success"]
+    # 唯一片段中未命中快取的才會呼叫 provider（快取停用時不記錄未命中，因此以命中數推算）
+    provider_calls = len(plan.unique) - cache_stats.hits
+    summary = {
+        "scripts": len(scripts),
+        "succeeded": len(succeeded),
+        "failed": len(scripts) - len(succeeded),
+        **plan.as_dict(),
+        "provider_calls": provider_calls,
+        "provider_calls_saved": plan.total_segments - provider_calls,
+        "cache": cache_stats.as_dict(),
+        "estimated_cost": round(estimate_cost(settings.provider, cache_stats.synthesized_characters), 6),
+    }
+    render_metrics.finish(
+        "ok" if len(succeeded) == len(scripts) else "error",
+        audio_format=output_format.name,
+        audio_bytes=sum(result["bytes"] for result in succeeded),
+        audio_seconds=sum(result["duration_seconds"] for result in succeeded),
+    )
+    return results, summary
+
+# 內容定址的輸出不會改變，可長期快取
+AUDIO_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+def save_audio_file(
+    audio_data: Optional[bytes],
+    manifest: RenderManifest = None,
+    audio_format: str = "mp3",
+    writer: OutputWriter = None,
+) -> str:
+    """
+    以內容雜湊命名保存音頻（副檔名依輸出格式，相同內容只保存一次），manifest 保存於同名的 .json
+
+    指定 writer 時保存串流組裝已寫入的文件（audio_data 不使用）。
+    過期與超出總大小的輸出由 audio_store 的背景 janitor 淘汰，這裡只寫入一筆索引。
+    """
+    if writer is not None:
+        audio_path = writer.commit()
+    else:
+        audio_path = audio_store.save(audio_data, get_output_format(audio_format).extension)
+    if manifest is not None:
+        manifest.save(manifest_path(audio_path))
+    return str(audio_path)
+
+def previous_audio_path(file_name: Optional[str]) -> Optional[str]:
+    """rerender_from 指定的上次輸出（只接受 temp_audio 內的輸出檔名）"""
+    if not file_name or not audio_store.is_output(file_name):
+        return None
+    audio_store.touch(file_name)
+    return str(audio_store.path(file_name))
+
+def audio_file_response(audio_path, headers: dict = None, if_none_match: str = None) -> Response:
+    """
+    依副檔名回傳音頻文件；PCM 沒有標頭，media type 附上 manifest 記錄的取樣率
+
+    內容定址的文件以雜湊作為強 ETag 並可長期快取，If-None-Match 相符時回傳 304；
+    Range / If-Range（206、416）由 FileResponse 處理。
+    """
+    headers = dict(headers or {})
+    etag = content_etag(audio_path)
+    if etag:
+        headers.update({"ETag": etag, "Cache-Control": AUDIO_CACHE_CONTROL})
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+    
+    output_format = format_for_path(audio_path)
+    frame_rate = None
+    path = manifest_path(audio_path)
+    if output_format.name == "pcm" and path.exists():
+        frame_rate = RenderManifest.load(path).frame_rate
+    return FileResponse(
+        audio_path,
+        media_type=media_type(output_format, frame_rate),
+        filename=f"generated_audio.{output_format.extension}",
+        headers=headers,
     )
-    temp_file.write(audio_data)
-    temp_file.close()
-    return temp_file.name
 
 # 定義請求模型
 class TTSRequest(BaseModel):
     script: str
-    provider: Optional[str] = "openai"  # openai, gemini, polly, taiwanese
+    provider: Optional[str] = "openai"  # 可用 provider 見 /options
     
-    # OpenAI 參數
+    # 通用 provider 參數，未指定時使用 provider 預設值（見 /options）
     api_key: Optional[str] = None
-    model: Optional[str] = "gpt-4o-mini-tts"
-    speaker1_voice: Optional[str] = "onyx"
-    speaker2_voice: Optional[str] = "nova"
+    model: Optional[str] = None
+    speaker1_voice: Optional[str] = None
+    speaker2_voice: Optional[str] = None
     speaker1_instructions: Optional[str] = "保持活潑愉快的語氣"
     speaker2_instructions: Optional[str] = "保持活潑愉快的語氣"
+    credentials: Optional[dict] = None  # api_key 以外的憑證，鍵名見 /options
     
     # Gemini 參數
     gemini_api_key: Optional[str] = None
-    gemini_male_voice: Optional[str] = "Puck"
-    gemini_female_voice: Optional[str] = "Aoede"
+    gemini_model: Optional[str] = None
+    gemini_male_voice: Optional[str] = None
+    gemini_female_voice: Optional[str] = None
     
     # AWS Polly 參數
     aws_access_key: Optional[str] = None
     aws_secret_key: Optional[str] = None
-    aws_region: Optional[str] = "ap-northeast-1"
-    polly_voice: Optional[str] = "Zhiyu"
+    aws_region: Optional[str] = None
+    polly_voice: Optional[str] = None
     
     # 台語 TTS 參數
-    tai_model: Optional[str] = "model6"
+    tai_model: Optional[str] = None
     
     # 通用參數
-    volume_boost: Optional[float] = 6.0
+    volume_boost: Optional[float] = 6.0  # normalize 為 gain 時使用
+    normalize: Optional[Literal["lufs", "gain", "none"]] = "gain"
+    format: Optional[Literal["mp3", "opus", "aac", "wav", "pcm"]] = "mp3"
+    bitrate: Optional[str] = None  # 例如 "64k"，可用值見 /options 的 formats
     return_url: Optional[bool] = False
+    rerender_from: Optional[str] = None  # 上次輸出的檔名，只重新生成變更的片段
+    profile: Optional[bool] = False  # 以 cProfile 剖析這次生成，結果存於 TTS_PROFILE_DIR
+    multi_speaker: Optional[bool] = False  # 一次請求合成多輪對話（支援的 provider 見 /options）
+    voices: Optional[dict[str, Optional[str]]] = None  # 說話者 → 聲音，例如 {"主持人": "onyx", "speaker-3": "coral"}
+    render_mode: Optional[Literal["memory", "stream"]] = None  # 未指定時使用 TTS_RENDER_MODE
+
+class BatchScript(BaseModel):
+    script: str
+    name: Optional[str] = None  # zip 內的檔名，未指定時為 script-001、script-002 ...
+
+class BatchTTSRequest(TTSRequest):
+    """批次生成：provider、聲音、格式與音量參數與 TTSRequest 相同，套用到所有腳本"""
+    script: Optional[str] = None  # 不使用，腳本放在 scripts
+    scripts: list[BatchScript] = Field(min_length=1)
+    output: Optional[Literal["urls", "zip"]] = "urls"
+
+# 各 provider 專屬的請求欄位 → 通用欄位或憑證名稱（優先於通用欄位）
+PROVIDER_REQUEST_FIELDS = {
+    "gemini": {
+        "api_key": "gemini_api_key",
+        "model": "gemini_model",
+        "speaker1_voice": "gemini_male_voice",
+        "speaker2_voice": "gemini_female_voice",
+    },
+    "polly": {
+        "access_key": "aws_access_key",
+        "secret_key": "aws_secret_key",
+        "region": "aws_region",
+        "speaker1_voice": "polly_voice",
+        "speaker2_voice": "polly_voice",
+    },
+    "taiwanese": {
+        "model": "tai_model",
+    },
+}
+
+def request_value(request: TTSRequest, name: str):
+    """依 provider 專屬欄位 → 通用欄位 → credentials 的順序取值"""
+    field_name = PROVIDER_REQUEST_FIELDS.get(request.provider, {}).get(name)
+    value = getattr(request, field_name) if field_name else None
+    return value or getattr(request, name, None) or (request.credentials or {}).get(name)
+
+def render_settings(request: TTSRequest) -> RenderSettings:
+    """將請求轉換為 RenderSettings，並檢查 provider 與必要憑證（缺少時回傳 400）"""
+    try:
+        spec = get_provider(request.provider)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=e.args[0])
+    
+    try:
+        voice_map = check_voice_map(request.voices or {})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=e.args[0])
+    
+    settings = RenderSettings(
+        provider=spec.name,
+        model=request_value(request, "model"),
+        voices=(request_value(request, "speaker1_voice"), request_value(request, "speaker2_voice")),
+        instructions=(request.speaker1_instructions, request.speaker2_instructions),
+        credentials={c.name: request_value(request, c.name) for c in spec.credentials},
+        multi_speaker=bool(request.multi_speaker),
+        voice_map=voice_map,
+    ).resolved()
+    
+    missing = spec.missing_credentials(settings.credentials)
+    if missing:
+        raise HTTPException(status_code=400, detail=f"未提供 {'、'.join(missing)}")
+    return settings
+
+def output_options(request: TTSRequest) -> tuple:
+    """檢查輸出格式與位元率（不支援時回傳 400），回傳 (OutputFormat, 指定的位元率或 None)"""
+    try:
+        output_format = get_output_format(request.format)
+        return output_format, request.bitrate and resolve_bitrate(output_format, request.bitrate)
+    except (KeyError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=e.args[0])
+
+def output_writer(request: TTSRequest, output_format) -> Optional[OutputWriter]:
+    """render_mode（未指定時為 TTS_RENDER_MODE）為 stream 時，開始串流組裝的輸出文件"""
+    if (request.render_mode or RENDER_MODE) != "stream":
+        return None
+    return audio_store.writer(output_format.extension)
 
 # API 端點
 @app.post("/generate-audio")
@@ -418,115 +798,455 @@ async def generate_audio(request: TTSRequest):
     - **polly**: AWS Polly (需 aws_access_key, aws_secret_key)
     - **taiwanese**: 台語 TTS (免費，無需金鑰)
     
+    其他已註冊的 provider 使用通用參數 api_key、model、speaker1_voice、speaker2_voice 與 credentials，
+    可用選項與預設值見 `/options`。
+    
     通用參數:
-    - **script**: 腳本內容，格式為 "speaker-1: 文本" 或 "speaker-2: 文本"
+    - **script**: 腳本內容，每行格式為 "speaker-N: 文本" 或 "名稱: 文本"（名稱需列在 voices），未標記的行屬於 speaker-1
     - **provider**: TTS 服務商 (預設: openai)
-    - **volume_boost**: 音量增益 dB (預設: 6.0)
+    - **volume_boost**: 音量增益 dB (預設: 6.0，normalize 為 gain 時使用)
+    - **normalize**: 音量處理：lufs（響度正規化到 TTS_TARGET_LUFS 並限制 true peak）、gain（固定增益）、none (預設: gain)
+    - **format**: 輸出格式 mp3 / opus / aac / wav / pcm（16-bit LE，無標頭）(預設: mp3)
+    - **bitrate**: 壓縮格式的位元率，例如 "64k"（預設依格式而定，可用值見 `/options`）；
+      單一片段、provider 可直接輸出該格式且未指定位元率與音量處理時，直接回傳 provider 的原始音頻
     - **return_url**: 是否返回音頻 URL (預設: False)
+    - **rerender_from**: 上次輸出的檔名（`audio_url` 或 `X-Audio-File` 標頭），只重新生成新增或修改的片段
+    - **profile**: 以 cProfile 剖析這次生成，剖析文件位置寫在日誌的 `[剖析]` 行 (預設: False)
+    - **multi_speaker**: 將連續的對話輪次合併為一次多說話者請求（目前為 gemini），失敗時自動改為逐輪合成 (預設: False)
+    - **render_mode**: memory（整份音頻在記憶體中組裝後編碼）或 stream（片段依序處理、由單一 ffmpeg 程序編碼並直接寫入文件，
+      記憶體用量與音頻長度無關，適合數小時的有聲書；lufs 的限幅逐片段進行）(預設: TTS_RENDER_MODE，未設定為 memory)
+    - **voices**: 說話者 → 聲音的對應表，例如 `{"主持人": "onyx", "speaker-3": "coral"}`；
+      未列出的 speaker-N 奇數使用 speaker1_voice、偶數使用 speaker2_voice，聲音為 null 的具名說話者依順序輪流使用兩者
+    
+    日誌最後一行 `[耗時]` 為各階段耗時；`return_url` 回應另附結構化的 `timings`，音頻回應附 `Server-Timing` 標頭。
     """
-    # 根據 provider 獲取相應的 API Key
-    if request.provider == "openai":
-        api_key = request.api_key or OPENAI_API_KEY
-        if not api_key:
-            raise HTTPException(status_code=400, detail="未提供 OpenAI API Key")
-    elif request.provider == "gemini":
-        gemini_key = request.gemini_api_key or GEMINI_API_KEY
-        if not gemini_key:
-            raise HTTPException(status_code=400, detail="未提供 Gemini API Key")
-    elif request.provider == "polly":
-        aws_key = request.aws_access_key or AWS_ACCESS_KEY_ID
-        aws_secret = request.aws_secret_key or AWS_SECRET_ACCESS_KEY
-        if not aws_key or not aws_secret:
-            raise HTTPException(status_code=400, detail="未提供 AWS 憑證")
-    # taiwanese 不需要 API Key
+    settings = render_settings(request)
+    output_format, bitrate = output_options(request)
+    previous_audio = await run_in_threadpool(previous_audio_path, request.rerender_from)
+    render_metrics = metrics.RenderMetrics(settings.provider, settings.model, "api", profile=request.profile)
+    trace = render_metrics.trace
+    writer = output_writer(request, output_format)
     
     try:
-        # 生成音頻
-        audio_data, status_log = generate_audio_from_script(
-            script=request.script,
-            provider=request.provider,
-            # OpenAI
-            audio_api_key=request.api_key or OPENAI_API_KEY,
-            audio_model=request.model,
-            speaker1_voice=request.speaker1_voice,
-            speaker2_voice=request.speaker2_voice,
-            speaker1_instructions=request.speaker1_instructions,
-            speaker2_instructions=request.speaker2_instructions,
-            # Gemini
-            gemini_api_key=request.gemini_api_key or GEMINI_API_KEY,
-            gemini_male_voice=request.gemini_male_voice,
-            gemini_female_voice=request.gemini_female_voice,
-            # AWS Polly
-            aws_access_key=request.aws_access_key or AWS_ACCESS_KEY_ID,
-            aws_secret_key=request.aws_secret_key or AWS_SECRET_ACCESS_KEY,
-            aws_region=request.aws_region,
-            polly_voice=request.polly_voice,
-            # 台語
-            tai_model=request.tai_model,
-            # 通用
+        # 生成音頻（在執行緒池中執行，不阻塞事件迴圈）
+        audio_data, status_log, manifest = await run_in_threadpool(
+            trace.profiled(generate_audio_from_script),
+            request.script,
+            settings,
             volume_boost=request.volume_boost,
+            previous_audio=previous_audio,
+            normalize=request.normalize,
+            audio_format=output_format.name,
+            bitrate=bitrate,
+            render_metrics=render_metrics,
+            writer=writer,
         )
         
-        # 保存音頻文件
-        audio_path = save_audio_file(audio_data)
+        # 保存音頻文件與 manifest
+        with render_metrics.stage("save"):
+            audio_path = await run_in_threadpool(
+                trace.profiled(save_audio_file), audio_data, manifest, output_format.name, writer
+            )
+        file_name = os.path.basename(audio_path)
+        status_log.extend(await run_in_threadpool(trace.report))
         
         # 根據請求返回不同的響應
         if request.return_url:
-            file_name = os.path.basename(audio_path)
             file_url = f"/audio/{file_name}"
             
             return {
                 "status": "success",
                 "message": "音頻生成成功",
                 "provider": request.provider,
+                "format": output_format.name,
                 "audio_url": file_url,
+                "manifest_url": f"{file_url}/manifest",
+                "segments": {
+                    "total": len(manifest.entries),
+                    "reused": manifest.reused_segments,
+                    "regenerated": manifest.regenerated_segments,
+                },
+                "timings": trace.as_dict(),
                 "logs": status_log
             }
         else:
-            return FileResponse(
+            return audio_file_response(
                 audio_path,
-                media_type="audio/mpeg",
-                filename="generated_audio.mp3"
+                headers={
+                    "X-Audio-File": file_name,
+                    "X-Segments-Reused": str(manifest.reused_segments),
+                    "X-Segments-Regenerated": str(manifest.regenerated_segments),
+                    "Server-Timing": trace.server_timing(),
+                },
             )
             
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"生成音頻時發生錯誤: {str(e)}")
+    finally:
+        # 未保存（生成失敗）的串流組裝臨時文件
+        if writer is not None:
+            writer.abort()
+
+def stream_pcm(
+    segment: AudioSegment,
+    reference: AudioSegment,
+    volume_boost: float = 0,
+    normalize: str = "gain",
+) -> bytes:
+    """
+    處理音量後將音頻統一為第 1 段（reference）的取樣率與聲道數，回傳 16-bit PCM（lufs 模式逐片段正規化）
+
+    WAV 與 PCM 直接輸出（WAV 的標頭由呼叫端在第 1 段前送出），壓縮格式送入 encode_stream。
+    """
+    segment, _ = normalize_audio(segment, normalize, volume_boost)
+    # 正規化後的 raw_data 可能為 bytearray，StreamingResponse 只接受 bytes
+    return bytes(
+        segment.set_frame_rate(reference.frame_rate)
+        .set_channels(reference.channels)
+        .set_sample_width(2)
+        .raw_data
+    )
+
+@app.post("/generate-audio/stream")
+async def generate_audio_stream(request: TTSRequest):
+    """
+    串流生成音頻 API 端點
+    
+    參數與 `/generate-audio` 相同（`return_url` 無作用）。以 chunked 傳輸回傳 `format` 指定的格式：
+    腳本邊解析邊合成，第 1 段完成即開始輸出，後續片段仍在並行生成，並嚴格依腳本順序送出。
+    Gemini 以串流 API 合成，片段生成途中即開始輸出（`normalize` 為 `lufs` 時需整段音頻，仍以片段為單位輸出）。
+    壓縮格式由單一 ffmpeg 程序連續編碼，片段之間沒有間隙。
+    WAV 串流的標頭長度欄位為最大值。開始輸出後若有片段失敗，串流會提前結束。
+    """
+    settings = render_settings(request)
+    output_format, bitrate = output_options(request)
+    
+    volume_boost = request.volume_boost or 0
+    render_metrics = metrics.RenderMetrics(settings.provider, settings.model, "stream", profile=request.profile)
+    # 邊解析邊合成：解析耗時累計為 parse 階段
+    planned = iter_plan_script(request.script, settings.provider, settings.multi_speaker, settings.voice_map)
+    parts = iter_script_parts(render_metrics.timed("parse", planned), settings, render_metrics)
+    
+    # 先取得第 1 段音頻，讓憑證或首段錯誤仍能以 HTTP 狀態碼回報
+    try:
+        first = await run_in_threadpool(render_metrics.trace.profiled(next), parts, None)
+    except HTTPException:
+        render_metrics.finish("error")
+        raise
+    except Exception as e:
+        render_metrics.finish("error")
+        raise HTTPException(status_code=500, detail=f"生成音頻時發生錯誤: {str(e)}")
+    if first is None:
+        render_metrics.finish("empty")
+        raise HTTPException(status_code=500, detail="生成音頻時發生錯誤: 沒有生成任何音頻")
+    render_metrics.first_audio()
+    reference = first[1]
+    # lufs 需要整個片段才能量測響度，其他模式每段音頻直接送出
+    whole_segments = request.normalize == "lufs"
+    
+    audio_seconds = 0.0
+    
+    def pcm_chunks():
+        nonlocal audio_seconds
+        pending = []  # 目前片段中尚未送出的音頻
+        to_pcm = render_metrics.trace.profiled(stream_pcm)
+        try:
+            for _, part in chain([first], parts):
+                if part is not None:
+                    pending.append(part)
+                    if whole_segments:
+                        continue
+                elif not pending:
+                    continue
+                segment = pending[0] if len(pending) == 1 else pending[0]._spawn(
+                    b"".join(p.raw_data for p in pending)
+                )
+                pending.clear()
+                with render_metrics.stage("encode"):
+                    chunk = to_pcm(segment, reference, volume_boost, request.normalize)
+                audio_seconds += segment.duration_seconds
+                yield chunk
+        finally:
+            parts.close()
+    
+    def stream_chunks():
+        status, audio_bytes = "error", 0
+        source = pcm_chunks()
+        if output_format.ffmpeg_format is not None:
+            # 壓縮格式以單一 ffmpeg 程序連續編碼（PCM 由背景執行緒送入）
+            source = encode_stream(source, output_format, reference.frame_rate, reference.channels, bitrate)
+        try:
+            if output_format.name == "wav":
+                header = wav_stream_header(reference.frame_rate, reference.channels)
+                audio_bytes += len(header)
+                yield header
+            for chunk in source:
+                audio_bytes += len(chunk)
+                yield chunk
+            status = "ok"
+        except Exception:
+            # 已送出回應標頭，只能記錄錯誤並結束串流
+            logger.exception("串流生成中斷")
+            raise
+        finally:
+            source.close()
+            render_metrics.finish(status, output_format.name, audio_bytes, audio_seconds)
+            # 串流沒有日誌可回傳，耗時摘要只輸出到伺服器紀錄
+            for line in render_metrics.trace.report():
+                logger.info("串流 %s", line)
+    
+    # 同步 generator 由 Starlette 在執行緒池中迭代，不會阻塞事件迴圈
+    return StreamingResponse(
+        stream_chunks(),
+        media_type=media_type(output_format, reference.frame_rate, reference.channels),
+        headers={"Content-Disposition": f'attachment; filename="generated_audio.{output_format.extension}"'},
+    )
+
+def batch_entry_names(scripts: list, extension: str) -> list:
+    """zip 內各腳本的檔名：使用 name（去除路徑與特殊字元），未指定或重複時以序號命名"""
+    names = []
+    used = set()
+    for index, item in enumerate(scripts, 1):
+        stem = re.sub(r"[^\w.-]+", "_", Path(item.name or "").name).strip("._")
+        if not stem or stem in used:
+            stem = f"script-{index:03d}"
+        used.add(stem)
+        names.append(f"{stem}.{extension}")
+    return names
+
+def write_batch_zip(results: list, summary: dict, names: list) -> str:
+    """將成功的輸出與 manifest 打包為 zip（不重新壓縮音頻），附上 batch.json 摘要，回傳臨時文件路徑"""
+    with NamedTemporaryFile(suffix=".zip", delete=False) as temp_file:
+        with zipfile.ZipFile(temp_file, "w", compression=zipfile.ZIP_STORED) as archive:
+            for result, name in zip(results, names):
+                if result["status"] != "success":
+                    continue
+                audio_path = audio_store.path(result["file_name"])
+                archive.write(audio_path, name)
+                manifest_file = manifest_path(audio_path)
+                if manifest_file.exists():
+                    archive.write(manifest_file, f"{Path(name).stem}.json")
+            archive.writestr(
+                "batch.json",
+                json.dumps({"summary": summary, "results": results}, ensure_ascii=False, indent=2),
+            )
+    return temp_file.name
+
+@app.post("/generate-audio/batch")
+async def generate_audio_batch(request: BatchTTSRequest):
+    """
+    批次生成多個腳本
+    
+    `scripts` 為 `[{"script": "...", "name": "ep01"}, ...]`，其餘參數與 `/generate-audio` 相同並套用到所有腳本
+    （`return_url`、`rerender_from` 無作用）。所有腳本的片段一起規劃，聲音、語氣與文本相同的片段
+    （共用的片頭、片尾、業配與固定台詞）只合成一次，並共用 provider 的並行上限。
+    
+    - **output**: urls（預設，回傳各腳本的 `audio_url`）或 zip（音頻、manifest 與 batch.json 打包下載）
+    
+    回應的 `summary` 包含片段總數、唯一片段數、`dedup_ratio` 與省下的 provider 呼叫數 `provider_calls_saved`。
+    某個片段失敗只影響用到它的腳本，該腳本的 `status` 為 failed。
+    """
+    if len(request.scripts) > BATCH_MAX_SCRIPTS:
+        raise HTTPException(status_code=400, detail=f"腳本數超過上限 ({BATCH_MAX_SCRIPTS})")
+    settings = render_settings(request)
+    output_format, bitrate = output_options(request)
+    render_metrics = metrics.RenderMetrics(settings.provider, settings.model, "batch", profile=request.profile)
+    trace = render_metrics.trace
+    
+    try:
+        results, summary = await run_in_threadpool(
+            trace.profiled(generate_batch),
+            [item.script for item in request.scripts],
+            settings,
+            volume_boost=request.volume_boost,
+            normalize=request.normalize,
+            audio_format=output_format.name,
+            bitrate=bitrate,
+            render_metrics=render_metrics,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"批次生成音頻時發生錯誤: {str(e)}")
+    
+    names = batch_entry_names(request.scripts, output_format.extension)
+    for result, name in zip(results, names):
+        result["name"] = name
+        if result["status"] == "success":
+            result["audio_url"] = f"/audio/{result['file_name']}"
+            result["manifest_url"] = f"{result['audio_url']}/manifest"
+    summary["timings"] = trace.as_dict()
+    logs = await run_in_threadpool(trace.report)
+    
+    if request.output == "zip":
+        zip_path = await run_in_threadpool(write_batch_zip, results, summary, names)
+        return FileResponse(
+            zip_path,
+            media_type="application/zip",
+            filename="batch.zip",
+            headers={"Server-Timing": trace.server_timing()},
+            background=BackgroundTask(os.unlink, zip_path),
+        )
+    
+    if summary["succeeded"] == len(results):
+        status = "success"
+    else:
+        status = "partial" if summary["succeeded"] else "failed"
+    return {
+        "status": status,
+        "provider": request.provider,
+        "format": output_format.name,
+        "summary": summary,
+        "results": results,
+        "logs": logs,
+    }
+
+# 背景工作佇列
+job_manager = JobManager()
+metrics.JOBS.labels("queued").set_function(lambda: job_manager.info()["queued"])
+metrics.JOBS.labels("running").set_function(lambda: job_manager.info()["running"])
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: TTSRequest):
+    """
+    建立背景生成工作
+    
+    參數與 `/generate-audio` 相同（`return_url` 無作用），立即回傳 job_id；
+    以 `GET /jobs/{job_id}` 查詢進度，完成後由 `GET /jobs/{job_id}/audio` 下載。
+    排隊中的工作已達上限時回傳 429。
+    """
+    settings = render_settings(request)
+    output_format, bitrate = output_options(request)
+    
+    def run_job(job):
+        render_metrics = metrics.RenderMetrics(settings.provider, settings.model, "api", profile=request.profile)
+        trace = render_metrics.trace
+        writer = output_writer(request, output_format)
+        try:
+            audio_data, status_log, manifest = trace.profiled(generate_audio_from_script)(
+                request.script,
+                settings,
+                volume_boost=request.volume_boost,
+                progress_callback=job.report_progress,
+                previous_audio=previous_audio_path(request.rerender_from),
+                normalize=request.normalize,
+                audio_format=output_format.name,
+                bitrate=bitrate,
+                render_metrics=render_metrics,
+                writer=writer,
+            )
+            job.logs = status_log
+            if not (audio_data or writer is not None and writer.size):
+                raise RuntimeError("沒有生成任何音頻")
+            with render_metrics.stage("save"):
+                audio_path = trace.profiled(save_audio_file)(audio_data, manifest, output_format.name, writer)
+        finally:
+            if writer is not None:
+                writer.abort()
+        status_log.extend(trace.report())
+        return audio_path
+    
+    try:
+        job = job_manager.submit(run_job)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}",
+        "audio_url": f"/jobs/{job.id}/audio",
+    }
+
+def find_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="工作不存在或已過期")
+    return job
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """查詢工作狀態、逐片段進度與預估剩餘秒數"""
+    job = find_job(job_id)
+    result = job.to_dict()
+    if job.status == "succeeded":
+        # 可作為下一次請求的 rerender_from
+        result["audio_file"] = os.path.basename(job.result)
+    return result
+
+@app.api_route("/jobs/{job_id}/audio", methods=["GET", "HEAD"])
+async def get_job_audio(job_id: str, request: Request):
+    """下載已完成工作的音頻（支援 ETag / Range），尚未完成時回傳 409"""
+    job = find_job(job_id)
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=f"生成音頻時發生錯誤: {job.error}")
+    if job.status != "succeeded":
+        raise HTTPException(status_code=409, detail=f"工作尚未完成 ({job.status})")
+    if not Path(job.result).exists():
+        raise HTTPException(status_code=404, detail="音頻文件不存在")
+    
+    return audio_file_response(job.result, if_none_match=request.headers.get("if-none-match"))
 
 # 獲取音頻文件的端點
-@app.get("/audio/{file_name}")
-async def get_audio(file_name: str):
-    """獲取生成的音頻文件"""
-    file_path = Path(f"./temp_audio/{file_name}")
+@app.api_route("/audio/{file_name}", methods=["GET", "HEAD"])
+async def get_audio(file_name: str, request: Request):
+    """
+    獲取生成的音頻文件
+
+    回應帶有強 ETag 與長期快取的 Cache-Control；If-None-Match 相符時回傳 304，
+    支援 Range 請求（206），方便 CDN 快取與播放器拖曳。
+    """
+    file_path = audio_store.path(file_name)
     
-    if not file_path.exists():
+    if not audio_store.is_output(file_name) or not file_path.is_file():
         raise HTTPException(status_code=404, detail="音頻文件不存在")
+    # 記錄最後存取時間（依此 LRU 淘汰）
+    await run_in_threadpool(audio_store.touch, file_name)
     
-    return FileResponse(
-        file_path,
-        media_type="audio/mpeg",
-        filename="generated_audio.mp3"
-    )
+    return audio_file_response(file_path, if_none_match=request.headers.get("if-none-match"))
+
+@app.get("/audio/{file_name}/manifest")
+async def get_audio_manifest(file_name: str):
+    """獲取音頻的 render manifest（各片段的雜湊、聲音設定、位置與長度）"""
+    path = manifest_path(audio_store.path(file_name))
+    if not audio_store.is_output(file_name) or not path.exists():
+        raise HTTPException(status_code=404, detail="manifest 不存在")
+    return RenderManifest.load(path).to_dict()
 
 # 獲取可用的音頻模型和聲音選項
 @app.get("/options")
 async def get_options():
-    """獲取所有 TTS provider 的可用選項"""
-    return {
-        "providers": ["openai", "gemini", "polly", "taiwanese"],
-        "openai": {
-            "models": STANDARD_AUDIO_MODELS,
-            "voices": STANDARD_VOICES
-        },
-        "gemini": {
-            "voices": GEMINI_VOICES
-        },
-        "polly": {
-            "voices": POLLY_VOICES
+    """獲取所有 TTS provider 的可用選項與能力"""
+    options = {
+        "providers": provider_names(),
+        "formats": {
+            name: {"bitrates": list(spec.bitrates), "default_bitrate": spec.default_bitrate}
+            for name, spec in OUTPUT_FORMATS.items()
         },
-        "taiwanese": {
-            "models": TAI_TTS_MODELS
-        }
     }
+    for spec in list_providers():
+        options[spec.name] = {
+            "label": spec.label,
+            "models": list(spec.models),
+            "default_model": spec.default_model,
+            "voices": list(spec.voices),
+            "default_voices": list(spec.default_voices),
+            "supports_instructions": spec.supports_instructions,
+            "credentials": [
+                {"name": c.name, "label": c.label, "env": c.env, "required": c.required}
+                for c in spec.credentials
+            ],
+            "max_chars": spec.max_chars,
+            "multi_speaker": spec.synthesize_dialogue is not None,
+            "dialogue_max_chars": spec.dialogue_max_chars if spec.synthesize_dialogue else None,
+            "audio_format": spec.audio_format,
+            "sample_rate": spec.sample_rate,
+            "output_formats": sorted(name for name in OUTPUT_FORMATS if spec.native_sample_rate(name)),
+            "concurrency": get_concurrency(spec.name),
+            "download_concurrency": get_download_concurrency(spec.name),
+            "cost_per_char": spec.cost_per_char,
+        }
+    return options
 
 # 健康檢查端點
 @app.get("/health")
@@ -535,9 +1255,21 @@ async def health_check():
     return {
         "status": "healthy", 
         "api_version": "2.0.0",
-        "supported_providers": ["openai", "gemini", "polly", "taiwanese"]
+        "supported_providers": provider_names(),
+        "segment_cache": segment_cache.info(),
+        "clients": client_registry.info(),
+        "jobs": job_manager.info(),
+        "audio_store": audio_store.info(),
+        "rate_limits": limiter_info()
     }
 
+# Prometheus 指標端點
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 文字格式的指標（provider 延遲與錯誤、字元數、處理階段耗時、輸出大小等）"""
+    content, content_type = metrics.render_latest()
+    return Response(content=content, media_type=content_type)
+
 # 主程序
 if __name__ == "__main__":
     # 啟動 API 服務器
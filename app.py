@@ -1,717 +1,404 @@
-import io
 import os
-from pathlib import Path
-from tempfile import NamedTemporaryFile
-import time
+from itertools import chain, islice
 import gradio as gr
-import boto3
-import requests
-from openai import OpenAI
-from pydub import AudioSegment
 from dotenv import load_dotenv
-from google import genai
-from google.genai import types
+from audio_cache import CacheStats
+from audio_assembler import assemble_segments, harmonize_segments
+from script_parser import parse_script, parse_voice_map
+from text_chunker import iter_plan_dialogue, iter_plan_segments
+from synthesis import SegmentSynthesisError, get_worker_count, map_in_order
+from providers import (
+    RenderSettings,
+    decode_segment_audio,
+    estimate_cost,
+    fetch_segment_audio,
+    find_provider_by_label,
+    list_providers,
+)
+from audio_encode import OUTPUT_FORMATS, encode_audio, get_output_format, resolve_bitrate
+from audio_store import audio_store
+import metrics
+from loudness import TARGET_LUFS, needs_processing, normalize_audio
+from render_manifest import (
+    RenderManifest,
+    load_previous_render,
+    manifest_entry,
+    manifest_path,
+    record_offsets,
+    segment_reuser,
+)
 
 # 加載環境變量
 load_dotenv()
 
-# 獲取 OpenAI API Key (如果在環境變量中設置了)
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
-
-# 標準音頻模型和聲音選項
-STANDARD_AUDIO_MODELS = [
-    "gpt-4o-mini-tts",
-    "gpt-4o-audio-preview",
-    "tts-1",
-    "tts-1-hd",
-]
-STANDARD_VOICES = [
-    "alloy",
-    "echo",
-    "fable",
-    "onyx",
-    "nova",
-    "shimmer",
-    "coral",
-    "sage",
-]
-STANDARD_VOICE_NOTES = """
-OpenAI 聲音備註：
-- alloy: 中性平衡，對話感自然，通用場景。
-- echo: 低沉男聲，較穩重，適合旁白或正式說明。
-- fable: 溫暖敘事感，適合故事/有聲書。
-- onyx: 清晰沉穩男聲，較正式，適合說明/主持。
-- nova: 友好女聲，明亮自然，適合對話互動。
-- shimmer: 柔和女聲，親切溫暖，適合客服/陪伴。
-- coral: 活潑女聲，帶能量感，適合行銷/短視頻。
-- sage: 成熟男聲，穩健理性，適合新聞/解說。
-"""
-GEMINI_MODEL_DEFAULT = "gemini-2.5-pro-preview-tts"
-GEMINI_VOICES = [
-    "Puck",
-    "Charon",
-    "Fenrir",
-    "Alnilam",
-    "Aoede",
-    "Algieba",
-]
-GEMINI_SAMPLE_RATE = 24000
-GEMINI_VOICE_NOTES = """
-Gemini 聲音備註：
-- Puck: 自然、中音、對話感強，適合一般對話。中文咬字清楚，外國腔較少。
-- Charon: 低沉穩重、帶權威感，適合新聞播報/嚴肅公告/懸疑。
-- Fenrir: 高亢有活力、語速偏快，適合遊戲旁白或激動解說。講中文時語速有時忽快忽慢，除非要激動效果，建議避開。
-- Aoede: 建議女聲首選，中文咬字清楚、外國腔較少。
-- Alnilam/Algieba: 舊版常見的名稱；在 gemini-2.5 系列建議優先用 Puck/Aoede/Charon/Fenrir。
-
-中文建議：首選組合 Puck (男) + Aoede (女)；若中文朗讀為主且要穩定，避免使用 Fenrir。
-"""
-POLLY_VOICE_DEFAULT = "Zhiyu"
-POLLY_REGION_DEFAULT = os.getenv("AWS_REGION", "ap-northeast-1")
-POLLY_VOICE_NOTES = "AWS Polly 中文目前僅女聲 Zhiyu，雙說話者將共用此聲音。需要 AWS Access Key / Secret / Region 才能使用。"
-TAI_TTS_URL = "https://learn-language.tokyo/taigiTTS/taigi-text-to-speech"
-TAI_TTS_MODEL_DEFAULT = "model6"
-TAI_VOICE_NOTES = "台語 TTS (Taiwanese) 目前僅單一女聲，無需 API Key，模型預設 model6。雙說話者將共用同一聲音。"
-
-# 優化腳本處理 - 合並相同說話者連續文本
-def optimize_script(script):
-    print("🔄 開始優化腳本處理...")
-    lines = [line.strip() for line in script.splitlines() if line.strip()]
-    optimized = []
-    current_speaker = None
-    current_text = ""
-    
-    for line in lines:
-        if line.lower().startswith("speaker-1:"):
-            speaker = "speaker-1"
-            text = line.split(":", 1)[1].strip()
-        elif line.lower().startswith("speaker-2:"):
-            speaker = "speaker-2"
-            text = line.split(":", 1)[1].strip()
-        else:
-            speaker = "speaker-1"  # 默認使用說話者1
-            text = line
-        
-        # 如果說話者變了，保存之前的文本並開始新的
-        if speaker != current_speaker and current_text:
-            optimized.append((current_speaker, current_text))
-            current_text = text
-            current_speaker = speaker
-        else:
-            # 相同說話者，合並文本（加空格）
-            if current_text:
-                current_text += " " + text
-            else:
-                current_text = text
-                current_speaker = speaker
-                
-    # 添加最後一個說話者的文本
-    if current_text:
-        optimized.append((current_speaker, current_text))
-        
-    print(f"✅ 腳本優化完成，共 {len(optimized)} 段對話")
-    return optimized
-
-def get_mp3(text: str, voice: str, audio_model: str, audio_api_key: str, instructions: str = None) -> bytes:
-    """使用 OpenAI TTS API 生成音頻"""
-    print(f"🎤 開始生成音頻: 長度 {len(text)} 字符, 聲音: {voice}, 模型: {audio_model}")
-    
-    # 檢查文本長度，OpenAI TTS API 有 4096 個標記的限制
-    # 大約 1000 個漢字約等於 2000-3000 個標記，為安全起見，我們將限制設為 1000 個字符
-    MAX_TEXT_LENGTH = 1000
-    
-    client = OpenAI(api_key=audio_api_key)
-    
-    # 如果文本長度超過限制，分割文本
-    if len(text) > MAX_TEXT_LENGTH:
-        print(f"📝 文本過長 ({len(text)} 字符)，分割成多個區塊")
-        # 將文本分割成更小的塊
-        text_chunks = []
-        for i in range(0, len(text), MAX_TEXT_LENGTH):
-            text_chunks.append(text[i:i + MAX_TEXT_LENGTH])
-        
-        print(f"📦 共分割成 {len(text_chunks)} 個區塊")
-        
-        # 為每個塊生成音頻並合並
-        combined_audio = b""
-        for i, chunk in enumerate(text_chunks, 1):
-            print(f"🔄 處理區塊 {i}/{len(text_chunks)}: {len(chunk)} 字符")
-            try:
-                # 構建 API 參數
-                api_params = {
-                    "model": audio_model,
-                    "voice": voice,
-                    "input": chunk,
-                }
-                if instructions:
-                    api_params["instructions"] = instructions
-                    print(f"💬 使用語氣指示: {instructions}")
-                
-                print(f"📡 調用 OpenAI TTS API...")
-                with client.audio.speech.with_streaming_response.create(**api_params) as response:
-                    with io.BytesIO() as file:
-                        for audio_chunk in response.iter_bytes():
-                            file.write(audio_chunk)
-                        chunk_audio = file.getvalue()
-                        combined_audio += chunk_audio
-                        print(f"✅ 區塊 {i} 生成完成: {len(chunk_audio)} bytes")
-            except Exception as e:
-                print(f"❌ 區塊 {i} 生成失敗: {e}")
-                raise
-        
-        print(f"🎵 所有區塊合並完成，總大小: {len(combined_audio)} bytes")
-        return combined_audio
-    else:
-        # 原始邏輯，處理短文本
-        try:
-            # 構建 API 參數
-            api_params = {
-                "model": audio_model,
-                "voice": voice,
-                "input": text,
-            }
-            if instructions:
-                api_params["instructions"] = instructions
-                print(f"💬 使用語氣指示: {instructions}")
-            
-            print(f"📡 調用 OpenAI TTS API...")
-            with client.audio.speech.with_streaming_response.create(**api_params) as response:
-                with io.BytesIO() as file:
-                    for audio_chunk in response.iter_bytes():
-                        file.write(audio_chunk)
-                    audio_data = file.getvalue()
-                    print(f"✅ 音頻生成完成: {len(audio_data)} bytes")
-                    return audio_data
-        except Exception as e:
-            print(f"❌ 音頻生成失敗: {e}")
-            raise
-
-
-def get_polly_mp3(text: str, polly_voice: str, polly_region: str, polly_access_key: str = None, polly_secret_key: str = None) -> bytes:
-    """使用 AWS Polly 生成 MP3"""
-    print(f"🎤 Polly 生成音頻: 長度 {len(text)} 字符, 聲音: {polly_voice}, 區域: {polly_region}")
-    client_kwargs = {"region_name": polly_region or POLLY_REGION_DEFAULT}
-    if polly_access_key and polly_secret_key:
-        client_kwargs.update(
-            aws_access_key_id=polly_access_key,
-            aws_secret_access_key=polly_secret_key,
-        )
-    polly = boto3.client("polly", **client_kwargs)
-    try:
-        resp = polly.synthesize_speech(
-            Text=text,
-            OutputFormat="mp3",
-            VoiceId=polly_voice,
-            Engine="neural",
-        )
-        audio_bytes = resp["AudioStream"].read()
-        print(f"✅ Polly 音頻生成完成: {len(audio_bytes)} bytes")
-        return audio_bytes
-    except Exception as e:
-        print(f"❌ Polly 音頻生成失敗: {e}")
-        raise
-
-
-def get_tai_tts_mp3(text: str, model: str = TAI_TTS_MODEL_DEFAULT) -> bytes:
-    """使用台語 TTS 服務生成音頻，無需金鑰"""
-    print(f"🎤 台語 TTS 生成音頻: 長度 {len(text)} 字符, 模型: {model}")
-    try:
-        # 第一步：POST 取得 audio_url
-        resp = requests.post(
-            TAI_TTS_URL,
-            json={"text": text, "model": model},
-            headers={"content-type": "application/json", "origin": "https://learn-language.tokyo"},
-            timeout=60,
-        )
-        resp.raise_for_status()
-        result = resp.json()
-        audio_url = result.get("audio_url")
-        if not audio_url:
-            raise RuntimeError(f"台語 TTS 回應中缺少 audio_url: {result}")
-        
-        print(f"🔗 取得音頻 URL: {audio_url}")
-        
-        # 第二步：下載 WAV 音頻檔案
-        audio_resp = requests.get(audio_url, timeout=60)
-        audio_resp.raise_for_status()
-        audio_bytes = audio_resp.content
-        print(f"✅ 台語 TTS 音頻下載完成: {len(audio_bytes)} bytes (WAV 格式)")
-        return audio_bytes
-    except Exception as e:
-        print(f"❌ 台語 TTS 音頻生成失敗: {e}")
-        raise
-
-
-def get_gemini_pcm(text: str, voice: str, gemini_model: str, gemini_api_key: str) -> bytes:
-    """使用 Gemini TTS 生成原始 PCM 音頻 (24kHz mono)"""
-    if not gemini_api_key:
-        raise ValueError("缺少 Gemini API Key")
-    print(f"🎤 Gemini 生成音頻: 長度 {len(text)} 字符, 聲音: {voice}, 模型: {gemini_model}")
-
-    client = genai.Client(api_key=gemini_api_key)
-    config = types.GenerateContentConfig(
-        response_modalities=["audio"],
-        speech_config=types.SpeechConfig(
-            voice_config=types.VoiceConfig(
-                prebuilt_voice_config=types.PrebuiltVoiceConfig(voice_name=voice)
-            )
-        ),
-    )
-
-    response = client.models.generate_content(
-        model=gemini_model,
-        contents=[types.Content(role="user", parts=[types.Part.from_text(text=text)])],
-        config=config,
-    )
-
-    if response.candidates:
-        for part in response.candidates[0].content.parts:
-            if part.inline_data and part.inline_data.data:
-                return part.inline_data.data
-    raise RuntimeError("未能取得 Gemini 音頻輸出")
+# 優化腳本處理 - 逐行解析並合並相同說話者連續文本，逐一產出 (speaker, text)
+def optimize_script(script, speakers=()):
+    print("🔄 開始優化腳本處理（邊解析邊合成）...")
+    return parse_script(script, speakers)
 
 def generate_audio_from_script(
     script: str,
-    audio_api_key: str,
-    audio_model: str = "gpt-4o-mini-tts",
-    speaker1_voice: str = "onyx",
-    speaker2_voice: str = "nova",
+    settings: RenderSettings,
     volume_boost: float = 0,
-    speaker1_instructions: str = "保持活潑愉快的語氣",
-    speaker2_instructions: str = "保持活潑愉快的語氣",
-) -> tuple[bytes, str]:
-    """從腳本生成音頻，支持兩個說話者，並優化 API 調用"""
-    print("🎬 開始從腳本生成音頻")
+    previous_audio: str = None,
+    normalize: str = "gain",
+    audio_format: str = "mp3",
+    bitrate: str = None,
+    render_metrics: metrics.RenderMetrics = None,
+) -> tuple[bytes, str, RenderManifest]:
+    """
+    從腳本生成音頻，支持兩個說話者；provider 的切分上限、並行數與音頻格式由註冊表決定
+
+    normalize 為音量處理模式：lufs（響度正規化）、gain（固定增益 volume_boost dB）或 none。
+    audio_format 為輸出格式（mp3 / opus / aac / wav / pcm），bitrate 未指定時使用格式預設值。
+    指定 previous_audio（上次輸出的路徑）時只重新生成新增或修改的片段，其餘從上次輸出切出。
+    各階段耗時記錄到 render_metrics（未指定時自行建立）。
+    """
+    spec = settings.spec
+    print(f"🎬 開始使用 {spec.label} 從腳本生成音頻")
     print(f"📜 腳本總長度: {len(script)} 字符")
-    print(f"🎤 說話者聲音: 說話者1={speaker1_voice}, 說話者2={speaker2_voice}")
-    print(f"🔊 音量增強: {volume_boost} dB")
+    print(f"🎤 說話者聲音: 說話者1={settings.voices[0]}, 說話者2={settings.voices[1]}, 模型: {settings.model}")
+    print(f"🔊 音量處理: {normalize}" + (f" ({volume_boost} dB)" if normalize == "gain" else ""))
+    output_format = get_output_format(audio_format)
+    print(f"📦 輸出格式: {output_format.label}" + (f" {bitrate}" if bitrate else ""))
     
     status_log = []
+    if render_metrics is None:
+        render_metrics = metrics.RenderMetrics(spec.name, settings.model, "gradio")
+    
+    cache_stats = CacheStats()
+    manifest = RenderManifest(audio_format=output_format.name)
     
-    # 優化腳本處理
+    # 增量重新生成：與上次的 manifest 比對，未變更的片段由快取或上次輸出取得
+    previous = None
+    if previous_audio:
+        print(f"♻️ 載入上次輸出: {previous_audio}")
+        previous = load_previous_render(previous_audio)
+        if previous is None:
+            print("⚠️ 找不到上次的輸出或 manifest，完整重新生成")
+            status_log.append("[增量] 找不到上次的輸出或 manifest，完整重新生成")
+    reuse = segment_reuser(previous)
+    
+    # 優化腳本處理，並依 provider 輸入上限切分；片段規劃好即加入 manifest 並送去合成，
+    # 不預先建立整份片段列表
     print("🔍 優化腳本內容...")
-    optimized_script = optimize_script(script)
-    print(f"✅ 腳本優化完成，共 {len(optimized_script)} 個片段")
+    if settings.multi_speaker:
+        # 連續的對話輪次合併為一次多說話者請求
+        planned = iter_plan_dialogue(optimize_script(script, settings.voice_map), spec.name)
+    else:
+        planned = iter_plan_segments(optimize_script(script, settings.voice_map), spec.name)
     
-    # 使用 pydub 處理音頻合並
-    combined_segment = None
+    def plan_items():
+        for speaker, text in render_metrics.timed("parse", planned):
+            status_log.append(f"[{spec.label}][{speaker}] {text}")
+            entry = manifest_entry(speaker, text, settings)
+            manifest.entries.append(entry)
+            # 從上次輸出切出的片段不需合成
+            yield speaker, text, reuse(entry)
     
-    # 處理每一段
-    total_segments = len(optimized_script)
-    print(f"🎵 開始處理 {total_segments} 個音頻片段")
+    items = plan_items()
+    head = list(islice(items, 2))
     
-    for i, (speaker, text) in enumerate(optimized_script, 1):
-        voice_to_use = speaker1_voice if speaker == "speaker-1" else speaker2_voice
-        instructions_to_use = speaker1_instructions if speaker == "speaker-1" else speaker2_instructions
+    # 單一片段、provider 可直接輸出所要求的格式、未指定位元率且不需調整音量時，
+    # 以該格式向 provider 要求音頻並直接使用原始 bytes，不解碼也不重新編碼
+    native_rate = spec.native_sample_rate(output_format.name)
+    passthrough = (
+        len(head) == 1 and head[0][2] is None and native_rate is not None and not bitrate
+        and not needs_processing(normalize, volume_boost)
+    )
+    fetch_settings = settings.with_native_format(output_format.name) if passthrough else settings
+    print(f"🎵 開始處理音頻片段 ({spec.label})")
+    
+    def synthesize_segment(index: int, item: tuple):
+        speaker, text, spliced = item
+        if spliced is not None:
+            return spliced
+        print(f"🎭 處理片段 {index}: {speaker} ({len(text)} 字符)")
         
-        print(f"🎭 處理片段 {i}/{total_segments}: {speaker} ({len(text)} 字符)")
-        status_log.append(f"[{speaker}] {text}")
+        # 生成這一段的音頻（先查快取）
+        with render_metrics.stage("synthesize"):
+            audio_chunk = fetch_segment_audio(fetch_settings, speaker, text, cache_stats)
+        print(f"✅ {speaker} 音頻生成完成: {len(audio_chunk)} bytes")
         
-        try:
-            # 生成這一段的音頻
-            print(f"📡 生成 {speaker} 的音頻...")
-            audio_chunk = get_mp3(
-                text,
-                voice_to_use,
-                audio_model,
-                audio_api_key,
-                instructions_to_use
-            )
-            
-            print(f"✅ {speaker} 音頻生成完成: {len(audio_chunk)} bytes")
-            
-            # 將二進制數據轉換為 AudioSegment
-            with NamedTemporaryFile(suffix=".mp3", delete=False) as temp_file:
-                temp_file.write(audio_chunk)
-                temp_file_path = temp_file.name
-            
-            # 讀取音頻
-            chunk_segment = AudioSegment.from_mp3(temp_file_path)
-            
-            # 刪除臨時文件
-            os.unlink(temp_file_path)
-            
-            # 合並音頻段
-            if combined_segment is None:
-                combined_segment = chunk_segment
-                print("🔗 創建第一個音頻片段")
-            else:
-                combined_segment += chunk_segment
-                print(f"🔗 已合並片段 {i}/{total_segments}")
-                
-        except Exception as e:
-            error_msg = f"❌ 片段 {i} ({speaker}) 生成失敗: {str(e)}"
-            print(error_msg)
-            status_log.append(f"[錯誤] 無法生成音頻: {str(e)}")
-            raise
+        if passthrough:
+            return audio_chunk
+        # 依 provider 的原生格式與取樣率在記憶體中解碼
+        with render_metrics.stage("decode"):
+            return decode_segment_audio(spec.name, audio_chunk, fetch_settings.audio_format)
+    
+    # 並行生成需要的片段，結果依腳本順序排列
+    try:
+        chunks = map_in_order(
+            render_metrics.trace.profiled(synthesize_segment), chain(head, items), get_worker_count(spec.name)
+        )
+    except SegmentSynthesisError as e:
+        speaker = manifest.entries[e.index - 1].speaker
+        error_msg = f"❌ {spec.label} 片段 {e.index} ({speaker}) 生成失敗: {str(e.cause)}"
+        print(error_msg)
+        status_log.append(f"[錯誤] 片段 {e.index} 無法生成 {spec.label} 音頻: {str(e.cause)}")
+        render_metrics.finish("error")
+        raise
+    print(f"✅ {len(manifest.entries)} 個片段處理完成")
+    
+    if previous is not None:
+        print(f"♻️ 增量重新生成: {manifest.summary()}")
+        status_log.append(f"[增量] {manifest.summary()}")
+    
+    print(f"💾 片段快取: {cache_stats.summary()}")
+    status_log.append(f"[快取] {cache_stats.summary()}")
+    cost = estimate_cost(spec.name, cache_stats.synthesized_characters)
+    print(f"💰 預估費用: ${cost:.4f} ({cache_stats.synthesized_characters} 字符)")
+    status_log.append(f"[費用] 預估 ${cost:.4f}（{cache_stats.synthesized_characters} 字符）")
+    
+    if passthrough:
+        print(f"⚡ 單一片段，直接輸出 provider 原始 {output_format.label} 音頻: {len(chunks[0])} bytes")
+        manifest.frame_rate = native_rate
+        status_log.append(f"[輸出] {output_format.name}（直接使用 provider 原始音頻）")
+        render_metrics.finish(audio_format=output_format.name, audio_bytes=len(chunks[0]))
+        return chunks[0], "\n".join(status_log), manifest
+    
+    # 統一格式後記錄各片段位置，再一次配置緩衝區合並所有音頻段
+    chunk_segments = harmonize_segments(chunks)
+    record_offsets(manifest, chunk_segments)
+    with render_metrics.stage("assemble"):
+        combined_segment = assemble_segments(chunk_segments)
+    print(f"🔗 已合並 {len(chunk_segments)} 個 {spec.label} 片段")
     
     # 如果沒有生成任何音頻段
     if combined_segment is None:
-        error_msg = "❌ 沒有生成任何音頻"
+        error_msg = f"❌ {spec.label} 沒有生成任何音頻"
         print(error_msg)
         status_log.append("[錯誤] 沒有生成任何音頻")
-        return b"", "\n".join(status_log)
+        render_metrics.finish("empty")
+        return b"", "\n".join(status_log), manifest
     
-    # 如果需要調整音量
-    if volume_boost > 0:
+    # 響度正規化或固定增益（lufs 模式各片段分別正規化）
+    if needs_processing(normalize, volume_boost):
         try:
-            print(f"🔊 調整音量 +{volume_boost} dB...")
-            # 調整音量
-            combined_segment = combined_segment + volume_boost  # 增加音量 (dB)
-            status_log.append(f"[音量] 已增加 {volume_boost} dB")
-            print("✅ 音量調整完成")
+            print(f"🔊 調整音量 ({normalize})...")
+            with render_metrics.stage("normalize"):
+                combined_segment, loudness = normalize_audio(
+                    combined_segment,
+                    normalize,
+                    volume_boost,
+                    segment_starts=[entry.offset_frames for entry in manifest.entries],
+                )
+            manifest.normalize = normalize
+            if normalize == "gain":
+                manifest.volume_boost = volume_boost
+            status_log.append(f"[音量] {loudness.summary()}")
+            print(f"✅ 音量調整完成: {loudness.summary()}")
         except Exception as e:
             warning_msg = f"⚠️ 音量調整失敗: {str(e)}"
             print(warning_msg)
             status_log.append(f"[警告] 音量調整失敗: {str(e)}")
     
-    # 將 AudioSegment 轉換為二進制數據
-    print("💾 導出最終音頻文件...")
-    output = io.BytesIO()
-    combined_segment.export(output, format="mp3")
-    combined_audio = output.getvalue()
+    # 將 AudioSegment 編碼為輸出格式
+    print(f"💾 導出最終音頻文件 ({output_format.label})...")
+    with render_metrics.stage("encode"):
+        combined_audio = encode_audio(combined_segment, output_format, bitrate)
+    bitrate_info = resolve_bitrate(output_format, bitrate)
+    status_log.append(f"[輸出] {output_format.name}" + (f" {bitrate_info}" if bitrate_info else ""))
+    render_metrics.finish(
+        audio_format=output_format.name,
+        audio_bytes=len(combined_audio),
+        audio_seconds=combined_segment.duration_seconds,
+    )
     
-    print(f"🎉 腳本音頻生成完成！最終大小: {len(combined_audio)} bytes")
-    return combined_audio, "\n".join(status_log)
-
-
-def generate_gemini_audio_from_script(
-    script: str,
-    gemini_api_key: str,
-    gemini_voice_speaker1: str = "Puck",
-    gemini_voice_speaker2: str = "Aoede",
-    gemini_model: str = GEMINI_MODEL_DEFAULT,
-    volume_boost: float = 0,
-) -> tuple[bytes, str]:
-    print("🎬 開始使用 Gemini 從腳本生成音頻")
-    print(f"📜 腳本總長度: {len(script)} 字符")
-    print(f"🎤 聲音: 說話者1={gemini_voice_speaker1}, 說話者2={gemini_voice_speaker2}, 模型: {gemini_model}")
-
-    status_log = []
-    optimized_script = optimize_script(script)
-    print(f"✅ 腳本優化完成，共 {len(optimized_script)} 個片段")
-
-    combined_segment = None
-    total_segments = len(optimized_script)
-    print(f"🎵 開始處理 {total_segments} 個音頻片段 (Gemini)")
-
-    for i, (speaker, text) in enumerate(optimized_script, 1):
-        print(f"🎭 處理片段 {i}/{total_segments}: {speaker} ({len(text)} 字符)")
-        status_log.append(f"[Gemini][{speaker}] {text}")
-
-        try:
-            voice_to_use = gemini_voice_speaker1 if speaker == "speaker-1" else gemini_voice_speaker2
-            pcm_bytes = get_gemini_pcm(text, voice_to_use, gemini_model, gemini_api_key)
-
-            chunk_segment = AudioSegment(
-                data=pcm_bytes,
-                sample_width=2,
-                frame_rate=GEMINI_SAMPLE_RATE,
-                channels=1,
-            )
-
-            if combined_segment is None:
-                combined_segment = chunk_segment
-                print("🔗 創建第一個 Gemini 音頻片段")
-            else:
-                combined_segment += chunk_segment
-                print(f"🔗 已合並 Gemini 片段 {i}/{total_segments}")
-        except Exception as e:
-            error_msg = f"❌ Gemini 片段 {i} 生成失敗: {str(e)}"
-            print(error_msg)
-            status_log.append(f"[錯誤] 無法生成 Gemini 音頻: {str(e)}")
-            raise
-
-    if combined_segment is None:
-        error_msg = "❌ Gemini 沒有生成任何音頻"
-        print(error_msg)
-        status_log.append("[錯誤] 沒有生成任何音頻")
-        return b"", "\n".join(status_log)
-
-    if volume_boost > 0:
-        try:
-            print(f"🔊 調整音量 +{volume_boost} dB (Gemini)...")
-            combined_segment = combined_segment + volume_boost
-            status_log.append(f"[音量] 已增加 {volume_boost} dB")
-            print("✅ 音量調整完成 (Gemini)")
-        except Exception as e:
-            warning_msg = f"⚠️ 音量調整失敗 (Gemini): {str(e)}"
-            print(warning_msg)
-            status_log.append(f"[警告] 音量調整失敗: {str(e)}")
-
-    print("💾 導出 Gemini 最終音頻文件...")
-    output = io.BytesIO()
-    combined_segment.export(output, format="mp3")
-    combined_audio = output.getvalue()
-    print(f"🎉 Gemini 腳本音頻生成完成！最終大小: {len(combined_audio)} bytes")
-    return combined_audio, "\n".join(status_log)
-
-
-def generate_polly_audio_from_script(
-    script: str,
-    polly_access_key: str,
-    polly_secret_key: str,
-    polly_region: str,
-    polly_voice: str = POLLY_VOICE_DEFAULT,
-    volume_boost: float = 0,
-) -> tuple[bytes, str]:
-    print("🎬 開始使用 AWS Polly 從腳本生成音頻")
-    print(f"📜 腳本總長度: {len(script)} 字符")
-    print(f"🎤 聲音: {polly_voice}, 區域: {polly_region}")
+    print(f"🎉 {spec.label} 腳本音頻生成完成！最終大小: {len(combined_audio)} bytes")
+    return combined_audio, "\n".join(status_log), manifest
 
-    status_log = []
-    optimized_script = optimize_script(script)
-    print(f"✅ 腳本優化完成，共 {len(optimized_script)} 個片段")
-
-    combined_segment = None
-    total_segments = len(optimized_script)
-    print(f"🎵 開始處理 {total_segments} 個音頻片段 (Polly)")
-
-    for i, (speaker, text) in enumerate(optimized_script, 1):
-        print(f"🎭 處理片段 {i}/{total_segments}: {speaker} ({len(text)} 字符)")
-        status_log.append(f"[Polly][{speaker}] {text}")
-
-        try:
-            audio_bytes = get_polly_mp3(text, polly_voice, polly_region, polly_access_key, polly_secret_key)
-
-            with NamedTemporaryFile(suffix=".mp3", delete=False) as temp_file:
-                temp_file.write(audio_bytes)
-                temp_file_path = temp_file.name
-
-            chunk_segment = AudioSegment.from_mp3(temp_file_path)
-            os.unlink(temp_file_path)
-
-            if combined_segment is None:
-                combined_segment = chunk_segment
-                print("🔗 創建第一個 Polly 音頻片段")
-            else:
-                combined_segment += chunk_segment
-                print(f"🔗 已合並 Polly 片段 {i}/{total_segments}")
-        except Exception as e:
-            error_msg = f"❌ Polly 片段 {i} 生成失敗: {str(e)}"
-            print(error_msg)
-            status_log.append(f"[錯誤] 無法生成 Polly 音頻: {str(e)}")
-            raise
-
-    if combined_segment is None:
-        error_msg = "❌ Polly 沒有生成任何音頻"
-        print(error_msg)
-        status_log.append("[錯誤] 沒有生成任何音頻")
-        return b"", "\n".join(status_log)
-
-    if volume_boost > 0:
-        try:
-            print(f"🔊 調整音量 +{volume_boost} dB (Polly)...")
-            combined_segment = combined_segment + volume_boost
-            status_log.append(f"[音量] 已增加 {volume_boost} dB")
-            print("✅ 音量調整完成 (Polly)")
-        except Exception as e:
-            warning_msg = f"⚠️ 音量調整失敗 (Polly): {str(e)}"
-            print(warning_msg)
-            status_log.append(f"[警告] 音量調整失敗: {str(e)}")
-
-    print("💾 導出 Polly 最終音頻文件...")
-    output = io.BytesIO()
-    combined_segment.export(output, format="mp3")
-    combined_audio = output.getvalue()
-    print(f"🎉 Polly 腳本音頻生成完成！最終大小: {len(combined_audio)} bytes")
-    return combined_audio, "\n".join(status_log)
-
-
-def generate_tai_audio_from_script(
-    script: str,
-    tai_model: str = TAI_TTS_MODEL_DEFAULT,
-    volume_boost: float = 0,
-) -> tuple[bytes, str]:
-    print("🎬 開始使用台語 TTS 從腳本生成音頻")
-    print(f"📜 腳本總長度: {len(script)} 字符")
-    print(f"🎤 模型: {tai_model} (僅單一女聲)")
-
-    status_log = []
-    optimized_script = optimize_script(script)
-    print(f"✅ 腳本優化完成，共 {len(optimized_script)} 個片段")
-
-    combined_segment = None
-    total_segments = len(optimized_script)
-    print(f"🎵 開始處理 {total_segments} 個音頻片段 (台語 TTS)")
-
-    for i, (speaker, text) in enumerate(optimized_script, 1):
-        print(f"🎭 處理片段 {i}/{total_segments}: {speaker} ({len(text)} 字符)")
-        status_log.append(f"[TaiTTS][{speaker}] {text}")
-
-        try:
-            audio_bytes = get_tai_tts_mp3(text, tai_model)
-
-            # 台語 TTS 回傳 WAV 格式，需用 from_wav
-            with NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                temp_file.write(audio_bytes)
-                temp_file_path = temp_file.name
-
-            chunk_segment = AudioSegment.from_wav(temp_file_path)
-            os.unlink(temp_file_path)
-
-            if combined_segment is None:
-                combined_segment = chunk_segment
-                print("🔗 創建第一個 台語 TTS 音頻片段")
-            else:
-                combined_segment += chunk_segment
-                print(f"🔗 已合並 台語 TTS 片段 {i}/{total_segments}")
-        except Exception as e:
-            error_msg = f"❌ 台語 TTS 片段 {i} 生成失敗: {str(e)}"
-            print(error_msg)
-            status_log.append(f"[錯誤] 無法生成 台語 TTS 音頻: {str(e)}")
-            raise
-
-    if combined_segment is None:
-        error_msg = "❌ 台語 TTS 沒有生成任何音頻"
-        print(error_msg)
-        status_log.append("[錯誤] 沒有生成任何音頻")
-        return b"", "\n".join(status_log)
-
-    if volume_boost > 0:
-        try:
-            print(f"🔊 調整音量 +{volume_boost} dB (台語 TTS)...")
-            combined_segment = combined_segment + volume_boost
-            status_log.append(f"[音量] 已增加 {volume_boost} dB")
-            print("✅ 音量調整完成 (台語 TTS)")
-        except Exception as e:
-            warning_msg = f"⚠️ 音量調整失敗 (台語 TTS): {str(e)}"
-            print(warning_msg)
-            status_log.append(f"[警告] 音量調整失敗: {str(e)}")
 
-    print("💾 導出 台語 TTS 最終音頻文件...")
-    output = io.BytesIO()
-    combined_segment.export(output, format="mp3")
-    combined_audio = output.getvalue()
-    print(f"🎉 台語 TTS 腳本音頻生成完成！最終大小: {len(combined_audio)} bytes")
-    return combined_audio, "\n".join(status_log)
-
-def save_audio_file(audio_data: bytes) -> str:
-    """將音頻數據保存為臨時文件"""
+def save_audio_file(audio_data: bytes, manifest: RenderManifest = None, audio_format: str = "mp3") -> str:
+    """以內容雜湊命名保存音頻（副檔名依輸出格式，相同內容只保存一次），manifest 保存於同名的 .json"""
     print("💾 開始保存音頻文件...")
     
-    temp_dir = Path("./temp_audio")
-    temp_dir.mkdir(exist_ok=True)
-    
-    # 清理舊文件
-    old_files_count = 0
-    for old_file in temp_dir.glob("*.mp3"):
-        if old_file.stat().st_mtime < (time.time() - 24*60*60):  # 24小時前的文件
-            old_file.unlink()
-            old_files_count += 1
-    
-    if old_files_count > 0:
-        print(f"🧹 清理了 {old_files_count} 個舊的臨時文件")
-    
-    # 創建新的臨時文件
-    temp_file = NamedTemporaryFile(
-        dir=temp_dir,
-        delete=False,
-        suffix=".mp3"
-    )
-    temp_file.write(audio_data)
-    temp_file.close()
+    # 過期與超出總大小的舊文件由背景 janitor 清理
+    audio_path = audio_store.save(audio_data, get_output_format(audio_format).extension)
+    if manifest is not None:
+        manifest.save(manifest_path(audio_path))
     
-    print(f"✅ 音頻文件已保存: {temp_file.name} ({len(audio_data)} bytes)")
-    return temp_file.name
+    print(f"✅ 音頻文件已保存: {audio_path} ({len(audio_data)} bytes)")
+    return str(audio_path)
 
 def process_and_save_audio(
-    script,
-    api_key,
-    gemini_api_key,
-    provider,
-    model,
-    voice1,
-    voice2,
-    volume_boost,
-    instr1,
-    instr2,
-    gemini_voice_speaker1,
-    gemini_voice_speaker2,
-    gemini_model,
-    polly_access_key,
-    polly_secret_key,
-    polly_region,
-    polly_voice,
-    tai_model,
+    script, provider, speaker_voices, normalize, volume_boost, audio_format, bitrate, rerender, profile, previous_audio,
+    *provider_values
 ):
-    """處理音頻生成並保存文件，支持 OpenAI / Gemini / AWS Polly / 台語 TTS"""
+    """
+    處理音頻生成並保存文件，支持所有已註冊的 provider
+
+    speaker_voices 為每行一組的 "名稱=聲音"，列出的具名說話者才會被辨識。
+    normalize 為音量處理模式（lufs / gain / none），volume_boost 只在 gain 模式使用。
+    audio_format 與 bitrate 為輸出格式與位元率（bitrate 為空時使用格式預設值）。
+    rerender 勾選時以 previous_audio（本次工作階段上一次的輸出）為基礎，只重新生成變更的片段。
+    profile 勾選時以 cProfile 剖析這次生成；日誌最後附上各階段耗時與剖析文件位置。
+    provider_values 依 PROVIDER_CONTROLS 的順序排列，包含每個 provider 專屬欄位的值。
+    回傳 (音頻路徑, 日誌, 供下次重新生成使用的輸出路徑)。
+    """
     try:
-        if provider == "Gemini TTS":
-            key_to_use = gemini_api_key or GEMINI_API_KEY
-            audio_data, status_log = generate_gemini_audio_from_script(
-                script,
-                key_to_use,
-                gemini_voice_speaker1,
-                gemini_voice_speaker2,
-                gemini_model,
-                volume_boost,
-            )
-        elif provider == "AWS Polly":
-            audio_data, status_log = generate_polly_audio_from_script(
-                script,
-                polly_access_key,
-                polly_secret_key,
-                polly_region or POLLY_REGION_DEFAULT,
-                polly_voice,
-                volume_boost,
-            )
-        elif provider == "Taiwanese TTS":
-            audio_data, status_log = generate_tai_audio_from_script(
-                script,
-                tai_model or TAI_TTS_MODEL_DEFAULT,
-                volume_boost,
-            )
-        else:
-            key_to_use = api_key or OPENAI_API_KEY
-            audio_data, status_log = generate_audio_from_script(
-                script,
-                key_to_use,
-                model,
-                voice1,
-                voice2,
-                volume_boost,
-                instr1,
-                instr2,
-            )
-
-        audio_path = save_audio_file(audio_data)
-        return audio_path, status_log
+        settings = collect_settings(
+            find_provider_by_label(provider).name, provider_values, parse_voice_map(speaker_voices)
+        )
+        missing = settings.spec.missing_credentials(settings.credentials)
+        if missing:
+            raise ValueError(f"缺少 {'、'.join(missing)}")
+        render_metrics = metrics.RenderMetrics(settings.provider, settings.model, "gradio", profile=profile)
+        trace = render_metrics.trace
+        audio_data, status_log, manifest = trace.profiled(generate_audio_from_script)(
+            script,
+            settings,
+            volume_boost,
+            previous_audio=previous_audio if rerender else None,
+            normalize=normalize,
+            audio_format=audio_format,
+            bitrate=bitrate and resolve_bitrate(get_output_format(audio_format), bitrate),
+            render_metrics=render_metrics,
+        )
+
+        with render_metrics.stage("save"):
+            audio_path = trace.profiled(save_audio_file)(audio_data, manifest, audio_format)
+        timing = trace.report()
+        print("\n".join(f"⏱️ {line}" for line in timing))
+        return audio_path, "\n".join([status_log, *timing]), audio_path
     except Exception as e:
         error_message = f"生成音頻時發生錯誤: {str(e)}"
         print(error_message)
-        return None, error_message
+        return None, error_message, previous_audio
+
+
+# 各 provider 專屬欄位的排列：provider 名稱 → [(欄位種類, 名稱或說話者序號), ...]
+PROVIDER_CONTROLS = {}
+
+
+def collect_settings(provider_name: str, provider_values: tuple, voice_map: dict = None) -> RenderSettings:
+    """從介面欄位值組出指定 provider 的 RenderSettings；voice_map 為說話者 → 聲音"""
+    values = iter(provider_values)
+    fields = {}
+    for name, layout in PROVIDER_CONTROLS.items():
+        current = {item: next(values) for item in layout}
+        if name == provider_name:
+            fields = current
+
+    voices = [None, None]
+    instructions = [None, None]
+    credentials = {}
+    model = None
+    multi_speaker = False
+    for (kind, key), value in fields.items():
+        if kind == "credential":
+            credentials[key] = value
+        elif kind == "model":
+            model = value
+        elif kind == "voice":
+            # key 為 None 時兩位說話者共用同一聲音
+            for index in ((0, 1) if key is None else (key,)):
+                voices[index] = value
+        elif kind == "instructions":
+            instructions[key] = value
+        elif kind == "multi_speaker":
+            multi_speaker = bool(value)
+
+    return RenderSettings(
+        provider=provider_name,
+        model=model,
+        voices=tuple(voices),
+        instructions=tuple(instructions),
+        credentials=credentials,
+        multi_speaker=multi_speaker,
+        voice_map=voice_map or {},
+    ).resolved()
+
+
+def build_provider_controls(spec, visible: bool) -> tuple:
+    """依 provider 宣告建立專屬欄位，回傳 (容器, 欄位元件列表)"""
+    layout = []
+    components = []
+
+    def add(kind, key, component):
+        layout.append((kind, key))
+        components.append(component)
+
+    with gr.Column(visible=visible) as container:
+        for credential in spec.credentials:
+            add("credential", credential.name, gr.Textbox(
+                label=credential.label,
+                type="password" if credential.secret else "text",
+                value=None if credential.secret else os.getenv(credential.env or "", credential.default),
+            ))
+        with gr.Row():
+            if spec.models:
+                add("model", None, gr.Dropdown(
+                    label=f"{spec.label} 模型 | Model",
+                    choices=list(spec.models),
+                    value=spec.default_model,
+                ))
+            if len(spec.voices) > 1:
+                add("voice", 0, gr.Dropdown(
+                    label="說話者1聲音 (男角) | Speaker 1 Voice (Male)",
+                    choices=list(spec.voices),
+                    value=spec.default_voices[0],
+                ))
+                add("voice", 1, gr.Dropdown(
+                    label="說話者2聲音 (女角) | Speaker 2 Voice (Female)",
+                    choices=list(spec.voices),
+                    value=spec.default_voices[1],
+                ))
+            elif spec.voices:
+                add("voice", None, gr.Dropdown(
+                    label=f"{spec.label} 聲音 (雙說話者共用) | Voice",
+                    choices=list(spec.voices),
+                    value=spec.default_voices[0],
+                ))
+        if spec.synthesize_dialogue is not None:
+            add("multi_speaker", None, gr.Checkbox(
+                label="多說話者合成 | Multi-speaker Synthesis",
+                value=False,
+                info=f"將連續的對話輪次（每次最多 {spec.dialogue_max_chars} 字符）合併為一次請求，大幅減少請求數；失敗時自動改為逐輪合成"
+            ))
+        if spec.notes:
+            gr.Markdown(spec.notes)
+        if spec.supports_instructions:
+            with gr.Row():
+                add("instructions", 0, gr.Textbox(
+                    label="說話者1語氣 | Speaker 1 Instructions",
+                    value="保持活潑愉快的語氣",
+                    placeholder="例如:保持活潑愉快的語氣、用專業嚴肅的口吻說話等",
+                    lines=4
+                ))
+                add("instructions", 1, gr.Textbox(
+                    label="說話者2語氣 | Speaker 2 Instructions",
+                    value="保持活潑愉快的語氣",
+                    placeholder="例如:保持活潑愉快的語氣、用專業嚴肅的口吻說話等",
+                    lines=4
+                ))
+
+    PROVIDER_CONTROLS[spec.name] = layout
+    return container, components
 
 
 def toggle_provider(selected_provider):
-    """切換顯示 OpenAI/Gemini 專屬欄位"""
-    is_openai = selected_provider == "OpenAI TTS"
-    is_gemini = selected_provider == "Gemini TTS"
-    is_polly = selected_provider == "AWS Polly"
-    is_tai = selected_provider == "Taiwanese TTS"
-    return (
-        gr.update(visible=is_openai),  # api_key
-        gr.update(visible=is_gemini),  # gemini_api_key
-        gr.update(visible=is_openai),  # audio_model
-        gr.update(visible=is_openai),  # speaker1_voice
-        gr.update(visible=is_openai),  # speaker2_voice
-        gr.update(visible=is_openai),  # openai voice notes
-        gr.update(visible=is_gemini),  # gemini_model
-        gr.update(visible=is_gemini),  # gemini_voice_speaker1
-        gr.update(visible=is_gemini),  # gemini_voice_speaker2
-        gr.update(visible=is_gemini),  # gemini voice notes
-        gr.update(visible=is_polly),   # polly access key
-        gr.update(visible=is_polly),   # polly secret key
-        gr.update(visible=is_polly),   # polly region
-        gr.update(visible=is_polly),   # polly voice dropdown
-        gr.update(visible=is_polly),   # polly notes
-        gr.update(visible=is_tai),     # tai model
-        gr.update(visible=is_tai),     # tai notes
+    """只顯示所選 provider 的專屬欄位"""
+    return [gr.update(visible=spec.label == selected_provider) for spec in list_providers()]
+
+def bitrate_choices(audio_format: str) -> list:
+    """輸出格式可選的位元率，預設值標註於選項名稱"""
+    spec = OUTPUT_FORMATS[audio_format]
+    return [
+        (f"{value}（預設）" if value == spec.default_bitrate else value, value)
+        for value in spec.bitrates
+    ]
+
+def toggle_bitrate(audio_format: str):
+    return gr.update(
+        choices=bitrate_choices(audio_format),
+        value=None,
+        visible=bool(OUTPUT_FORMATS[audio_format].bitrates),
     )
 
 # Gradio 界面
 def create_gradio_interface():
+    providers = list_providers()
     with gr.Blocks(title="TTS Generator") as demo:
         gr.Markdown("""
 <style>
@@ -727,120 +414,73 @@ def create_gradio_interface():
                     placeholder="""請粘貼腳本內容，格式如下：
 speaker-1: 歡迎來到 David888 Podcast，我是 David...
 speaker-2: 大家好，我是 Cordelia...
-沒有標記說話者的行會默認使用說話者1的聲音。
+speaker-3 之後的說話者輪流使用說話者1、2的聲音；沒有標記說話者的行會默認使用說話者1的聲音。
 
 提示：為提高效率，相同說話者的多行文字將自動合並處理。""",
                     lines=20
                 )
-                api_key = gr.Textbox(
-                    label="OpenAI API Key",
-                    type="password",
-                    visible=True
-                )
-                gemini_api_key = gr.Textbox(
-                    label="Gemini API Key",
-                    type="password",
-                    visible=False
-                )
-                polly_access_key = gr.Textbox(
-                    label="AWS Access Key ID",
-                    type="password",
-                    visible=False
-                )
-                polly_secret_key = gr.Textbox(
-                    label="AWS Secret Access Key",
-                    type="password",
-                    visible=False
-                )
-                polly_region = gr.Textbox(
-                    label="AWS Region",
-                    value=POLLY_REGION_DEFAULT,
-                    visible=False
+                speaker_voices = gr.Textbox(
+                    label="說話者聲音 | Speaker Voices",
+                    placeholder="每行一組 名稱=聲音，例如：\n主持人=onyx\nspeaker-3=coral",
+                    lines=3,
+                    info="具名說話者（腳本中的「名稱: 文本」）需列在這裡；聲音留空時輪流使用說話者1、2的聲音"
                 )
                 provider = gr.Radio(
                     label="TTS 服務 | Provider",
-                    choices=["OpenAI TTS", "Gemini TTS", "AWS Polly", "Taiwanese TTS"],
-                    value="OpenAI TTS"
+                    choices=[spec.label for spec in providers],
+                    value=providers[0].label
                 )
-                with gr.Row():
-                    audio_model = gr.Dropdown(
-                        label="音頻模型 | Audio Model",
-                        choices=STANDARD_AUDIO_MODELS,
-                        value="gpt-4o-mini-tts",
-                        visible=True
-                    )
-                    speaker1_voice = gr.Dropdown(
-                        label="說話者1聲音 (男角) | Speaker 1 Voice (Male)",
-                        choices=STANDARD_VOICES,
-                        value="onyx",
-                        visible=True
-                    )
-                    speaker2_voice = gr.Dropdown(
-                        label="說話者2聲音 (女角) | Speaker 2 Voice (Female)",
-                        choices=STANDARD_VOICES,
-                        value="nova",
-                        visible=True
-                    )
-                openai_voice_notes = gr.Markdown(STANDARD_VOICE_NOTES, visible=True)
-                with gr.Row():
-                    gemini_model = gr.Dropdown(
-                        label="Gemini 模型 | Gemini Model",
-                        choices=[GEMINI_MODEL_DEFAULT],
-                        value=GEMINI_MODEL_DEFAULT,
-                        visible=False
-                    )
-                    gemini_voice_speaker1 = gr.Dropdown(
-                        label="Gemini 說話者1聲音 | Speaker 1 Voice",
-                        choices=GEMINI_VOICES,
-                        value="Puck",
-                        visible=False
-                    )
-                    gemini_voice_speaker2 = gr.Dropdown(
-                        label="Gemini 說話者2聲音 | Speaker 2 Voice",
-                        choices=GEMINI_VOICES,
-                        value="Aoede",
-                        visible=False
-                    )
-                gemini_voice_notes = gr.Markdown(GEMINI_VOICE_NOTES, visible=False)
-                with gr.Row():
-                    polly_voice = gr.Dropdown(
-                        label="Polly 聲音 (僅中文女聲)",
-                        choices=[POLLY_VOICE_DEFAULT],
-                        value=POLLY_VOICE_DEFAULT,
-                        visible=False
-                    )
-                polly_voice_notes = gr.Markdown(POLLY_VOICE_NOTES, visible=False)
-                with gr.Row():
-                    tai_model = gr.Dropdown(
-                        label="台語 TTS 模型 (單一女聲)",
-                        choices=[TAI_TTS_MODEL_DEFAULT],
-                        value=TAI_TTS_MODEL_DEFAULT,
-                        visible=False
-                    )
-                tai_voice_notes = gr.Markdown(TAI_VOICE_NOTES, visible=False)
                 
-                with gr.Row():
-                    speaker1_instructions = gr.Textbox(
-                        label="說話者1語氣 | Speaker 1 Instructions",
-                        value="保持活潑愉快的語氣",
-                        placeholder="例如:保持活潑愉快的語氣、用專業嚴肅的口吻說話等",
-                        lines=4
-                    )
-                    speaker2_instructions = gr.Textbox(
-                        label="說話者2語氣 | Speaker 2 Instructions",
-                        value="保持活潑愉快的語氣",
-                        placeholder="例如:保持活潑愉快的語氣、用專業嚴肅的口吻說話等",
-                        lines=4
-                    )
+                # 各 provider 專屬欄位（由註冊表產生）
+                containers = []
+                provider_inputs = []
+                for index, spec in enumerate(providers):
+                    container, components = build_provider_controls(spec, visible=index == 0)
+                    containers.append(container)
+                    provider_inputs.extend(components)
                 
+                normalize = gr.Radio(
+                    label="音量處理 | Loudness",
+                    choices=[
+                        ("響度正規化 (LUFS)", "lufs"),
+                        ("固定增益 | Fixed Gain", "gain"),
+                        ("不調整 | None", "none"),
+                    ],
+                    value="lufs",
+                    info=f"響度正規化會將每段對話調整到 {TARGET_LUFS:g} LUFS，並限制峰值避免破音"
+                )
                 volume_boost = gr.Slider(
                     label="音量增益 (dB) | Volume Boost (dB)",
                     minimum=0,
                     maximum=20,
                     value=6,
                     step=1,
+                    visible=False,
                     info="增加音頻音量，單位為分貝(dB)。建議值：6-10 dB"
                 )
+                with gr.Row():
+                    # PCM 沒有標頭，瀏覽器無法播放，僅由 API 提供
+                    audio_format = gr.Dropdown(
+                        label="輸出格式 | Format",
+                        choices=[(spec.label, name) for name, spec in OUTPUT_FORMATS.items() if name != "pcm"],
+                        value="mp3",
+                    )
+                    bitrate = gr.Dropdown(
+                        label="位元率 | Bitrate",
+                        choices=bitrate_choices("mp3"),
+                        value=None,
+                        info="留空使用格式預設值；單一片段時可直接使用 provider 原始音頻"
+                    )
+                rerender = gr.Checkbox(
+                    label="只重新生成變更的片段 | Re-render Changed Segments Only",
+                    value=False,
+                    info="與上一次的輸出比對，未變更的片段直接重用，不再呼叫 API"
+                )
+                profile = gr.Checkbox(
+                    label="效能剖析 | Profile",
+                    value=False,
+                    info="以 cProfile 記錄這次生成，剖析文件位置顯示於日誌最後"
+                )
                 generate_button = gr.Button("生成音頻 | Generate Audio")
             with gr.Column(scale=1):
                 # 輸出區
@@ -853,54 +493,37 @@ speaker-2: 大家好，我是 Cordelia...
                     lines=20
                 )
         
+        # 上一次輸出的路徑（增量重新生成的基準）
+        previous_audio = gr.State(None)
+        
         # 事件處理
         generate_button.click(
             fn=process_and_save_audio,
             inputs=[
-                script_input,
-                api_key,
-                gemini_api_key,
-                provider,
-                audio_model,
-                speaker1_voice,
-                speaker2_voice,
-                volume_boost,
-                speaker1_instructions,
-                speaker2_instructions,
-                gemini_voice_speaker1,
-                gemini_voice_speaker2,
-                gemini_model,
-                polly_access_key,
-                polly_secret_key,
-                polly_region,
-                polly_voice,
-                tai_model,
+                script_input, provider, speaker_voices, normalize, volume_boost, audio_format, bitrate,
+                rerender, profile, previous_audio, *provider_inputs,
             ],
-            outputs=[audio_output, status_output]
+            outputs=[audio_output, status_output, previous_audio]
+        )
+
+        # 固定增益模式才顯示音量增益
+        normalize.change(
+            fn=lambda mode: gr.update(visible=mode == "gain"),
+            inputs=normalize,
+            outputs=volume_boost,
+        )
+
+        # 位元率選項依輸出格式而定，無損格式不顯示
+        audio_format.change(
+            fn=toggle_bitrate,
+            inputs=audio_format,
+            outputs=bitrate,
         )
 
         provider.change(
             fn=toggle_provider,
             inputs=provider,
-            outputs=[
-                api_key,
-                gemini_api_key,
-                audio_model,
-                speaker1_voice,
-                speaker2_voice,
-                openai_voice_notes,
-                gemini_model,
-                gemini_voice_speaker1,
-                gemini_voice_speaker2,
-                gemini_voice_notes,
-                polly_access_key,
-                polly_secret_key,
-                polly_region,
-                polly_voice,
-                polly_voice_notes,
-                tai_model,
-                tai_voice_notes,
-            ],
+            outputs=containers,
         )
     return demo
 
@@ -910,4 +533,7 @@ demo = create_gradio_interface()
 app = demo.queue()
 
 if __name__ == "__main__":
-    app.launch(server_name="0.0.0.0", server_port=7860)
\ No newline at end of file
+    # 設定 TTS_METRICS_PORT 時另開 Prometheus 指標端點
+    if metrics.start_metrics_server():
+        print(f"📈 Prometheus 指標: http://0.0.0.0:{metrics.METRICS_PORT}/metrics")
+    app.launch(server_name="0.0.0.0", server_port=7860)
@@ -0,0 +1,54 @@
+"""
+線性時間音頻組裝
+
+取代逐段 `combined_segment += chunk_segment`（每次都複製整段已累積的音頻，總成本為平方級）：
+先統一所有片段的取樣率、取樣寬度與聲道數，計算總長度後一次配置緩衝區，再依序寫入。
+api.py 與 app.py 共用。
+"""
+import numpy as np
+from pydub import AudioSegment
+
+
+def harmonize_segments(segments: list) -> list:
+    """
+    將所有片段轉為相同格式，規則與 pydub 串接時相同：取最大的聲道數、取樣率與取樣寬度
+    """
+    if not segments:
+        return []
+    channels = max(segment.channels for segment in segments)
+    frame_rate = max(segment.frame_rate for segment in segments)
+    sample_width = max(segment.sample_width for segment in segments)
+    return [
+        segment.set_channels(channels).set_frame_rate(frame_rate).set_sample_width(sample_width)
+        for segment in segments
+    ]
+
+
+def assemble_segments(segments: list):
+    """
+    將片段依序組裝為單一 AudioSegment，沒有片段時回傳 None
+
+    只配置一次輸出緩衝區，每個片段只複製一次，耗時與記憶體皆與總長度成線性關係。
+    """
+    segments = harmonize_segments([segment for segment in segments if segment is not None])
+    if not segments:
+        return None
+    if len(segments) == 1:
+        return segments[0]
+
+    first = segments[0]
+    total_bytes = sum(len(segment.raw_data) for segment in segments)
+    buffer = bytearray(total_bytes)
+    view = np.frombuffer(buffer, dtype=np.uint8)
+    offset = 0
+    for segment in segments:
+        data = np.frombuffer(segment.raw_data, dtype=np.uint8)
+        view[offset:offset + len(data)] = data
+        offset += len(data)
+
+    return AudioSegment(
+        data=buffer,
+        sample_width=first.sample_width,
+        frame_rate=first.frame_rate,
+        channels=first.channels,
+    )
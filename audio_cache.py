@@ -0,0 +1,296 @@
+"""
+片段音頻快取
+
+以 (provider, model, voice, instructions, 正規化文本) 為鍵，保存 provider 回傳的原始音頻 bytes。
+記憶體層為有容量上限的 LRU，磁碟層依總大小與存放時間淘汰，api.py 與 app.py 共用。
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+CACHE_DIR = os.getenv("TTS_CACHE_DIR", "./tts_cache")
+CACHE_MEMORY_MB = float(os.getenv("TTS_CACHE_MEMORY_MB", "64"))
+CACHE_DISK_MB = float(os.getenv("TTS_CACHE_DISK_MB", "1024"))
+CACHE_MAX_AGE_HOURS = float(os.getenv("TTS_CACHE_MAX_AGE_HOURS", "168"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """統一 Unicode 形式並壓縮空白，避免僅空白差異造成快取未命中"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(
+    provider: str,
+    model: str,
+    voice: str,
+    instructions: str,
+    text: str,
+    audio_format: str = None,
+) -> str:
+    """計算片段快取鍵；audio_format 只在要求 provider 預設以外的格式時指定，預設格式的鍵不變"""
+    parts = [provider or "", model or "", voice or "", instructions or "", normalize_text(text)]
+    if audio_format:
+        parts.append(audio_format)
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class CacheStats:
+    """快取命中統計，可用於單次生成或整個進程"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.synthesized_characters = 0
+
+    def record(self, kind: str):
+        with self._lock:
+            setattr(self, kind, getattr(self, kind) + 1)
+
+    def record_characters(self, characters: int):
+        """記錄未命中而實際送往 provider 的字符數（用於費用估算）"""
+        with self._lock:
+            self.synthesized_characters += characters
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    def summary(self) -> str:
+        return f"命中 {self.hits} (記憶體 {self.memory_hits} / 磁碟 {self.disk_hits})，未命中 {self.misses}"
+
+    def as_dict(self) -> dict:
+        return {
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "synthesized_characters": self.synthesized_characters,
+        }
+
+
+class SegmentCache:
+    """記憶體 LRU + 磁碟兩層的片段音頻快取（執行緒安全）"""
+
+    def __init__(
+        self,
+        cache_dir: str = CACHE_DIR,
+        memory_bytes: int = int(CACHE_MEMORY_MB * 1024 * 1024),
+        disk_bytes: int = int(CACHE_DISK_MB * 1024 * 1024),
+        max_age_seconds: float = CACHE_MAX_AGE_HOURS * 3600,
+        enabled: bool = CACHE_ENABLED,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.max_age_seconds = max_age_seconds
+        self.enabled = enabled
+        self.stats = CacheStats()
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_size = 0
+        self._disk_index = None  # key -> (size, last_access)，首次使用時建立
+        self._disk_size = 0
+        self._inflight = {}
+
+    # 記憶體層
+    def _memory_get(self, key: str):
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+        return data
+
+    def _memory_put(self, key: str, data: bytes):
+        if len(data) > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old)
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    # 磁碟層
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.bin"
+
+    def _load_disk_index(self):
+        if self._disk_index is not None:
+            return
+        self._disk_index = {}
+        self._disk_size = 0
+        if self.cache_dir.exists():
+            for path in self.cache_dir.glob("*/*.bin"):
+                stat = path.stat()
+                self._disk_index[path.stem] = (stat.st_size, stat.st_mtime)
+                self._disk_size += stat.st_size
+        self._evict_disk()
+
+    def _drop_disk_entry(self, key: str):
+        size, _ = self._disk_index.pop(key)
+        self._disk_size -= size
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def _evict_disk(self):
+        expire_before = time.time() - self.max_age_seconds
+        for key in [k for k, (_, accessed) in self._disk_index.items() if accessed < expire_before]:
+            self._drop_disk_entry(key)
+        if self._disk_size > self.disk_bytes:
+            # 依最後存取時間淘汰最舊的項目
+            for key, _ in sorted(self._disk_index.items(), key=lambda item: item[1][1]):
+                if self._disk_size <= self.disk_bytes:
+                    break
+                self._drop_disk_entry(key)
+
+    def _disk_get(self, key: str):
+        entry = self._disk_index.get(key)
+        if entry is None:
+            return None
+        if entry[1] < time.time() - self.max_age_seconds:
+            self._drop_disk_entry(key)
+            return None
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            self._disk_index.pop(key, None)
+            self._disk_size -= entry[0]
+            return None
+        self._disk_index[key] = (entry[0], time.time())
+        return data
+
+    def _disk_put(self, key: str, data: bytes):
+        if len(data) > self.disk_bytes:
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        old = self._disk_index.get(key)
+        if old is not None:
+            self._disk_size -= old[0]
+        self._disk_index[key] = (len(data), time.time())
+        self._disk_size += len(data)
+        self._evict_disk()
+
+    def get(self, key: str, stats: CacheStats = None):
+        """查詢快取，未命中時回傳 None（不計入未命中次數）"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            data = self._memory_get(key)
+            if data is not None:
+                kind = "memory_hits"
+            else:
+                self._load_disk_index()
+                data = self._disk_get(key)
+                if data is None:
+                    return None
+                kind = "disk_hits"
+                self._memory_put(key, data)
+        self.stats.record(kind)
+        if stats is not None:
+            stats.record(kind)
+        return data
+
+    def contains(self, key: str) -> bool:
+        """是否有未過期的快取項目（不讀取內容、不計入統計）"""
+        if not self.enabled:
+            return False
+        with self._lock:
+            if key in self._memory:
+                return True
+            self._load_disk_index()
+            entry = self._disk_index.get(key)
+            return entry is not None and entry[1] >= time.time() - self.max_age_seconds
+
+    def put(self, key: str, data: bytes):
+        if not self.enabled or not data:
+            return
+        with self._lock:
+            self._memory_put(key, data)
+            self._load_disk_index()
+            try:
+                self._disk_put(key, data)
+            except OSError as e:
+                print(f"⚠️ 片段快取寫入磁碟失敗: {e}")
+
+    def get_or_create(self, key: str, create, stats: CacheStats = None) -> bytes:
+        """
+        命中則直接回傳，否則呼叫 create() 生成並寫入快取。
+
+        同一個鍵同時被多個執行緒請求時（例如腳本內重複的台詞），只會呼叫一次 create()。
+        """
+        if not self.enabled:
+            return create()
+        data = self.get(key, stats)
+        if data is not None:
+            return data
+
+        with self._lock:
+            # 查詢後到此之間可能已有其他執行緒寫入
+            data = self._memory_get(key)
+            future = self._inflight.get(key)
+            owner = future is None and data is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+        if not owner:
+            if data is None:
+                data = future.result()
+            self.stats.record("memory_hits")
+            if stats is not None:
+                stats.record("memory_hits")
+            return data
+
+        self.stats.record("misses")
+        if stats is not None:
+            stats.record("misses")
+        try:
+            data = create()
+            self.put(key, data)
+            future.set_result(data)
+            return data
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def info(self) -> dict:
+        """供 /health 使用的快取狀態"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                **self.stats.as_dict(),
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_size,
+                "disk_entries": len(self._disk_index) if self._disk_index is not None else None,
+                "disk_bytes": self._disk_size if self._disk_index is not None else None,
+            }
+
+
+segment_cache = SegmentCache()
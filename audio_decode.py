@@ -0,0 +1,481 @@
+"""
+記憶體內音頻解碼
+
+provider 回傳的音頻 bytes 直接在記憶體中解碼為 AudioSegment：WAV 與原始 PCM 由 Python 直接解析，
+MP3 等壓縮格式交給 ffmpeg。同時等待解碼的壓縮音頻（例如並行合成的各片段）由背景執行緒合併為一次 ffmpeg 呼叫，
+每個音頻是該次呼叫中各自的輸入與輸出管線，結果與逐一解碼相同，但不必每個片段啟動一個 ffmpeg 程序；
+解碼全程經管線進行，不寫入臨時文件。
+邊下載邊解碼時以 stream_decoder 取得逐段解碼器：WAV 與 PCM 每收到資料即產出完整樣本，
+其他格式在結束時整段解碼。api.py 與 app.py 共用。
+"""
+import io
+import os
+import selectors
+import struct
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Optional
+
+from dotenv import load_dotenv
+from pydub import AudioSegment
+from pydub.audio_segment import fix_wav_headers
+from pydub.exceptions import CouldntDecodeError
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+load_dotenv()
+
+# 原始 PCM 預設規格（Gemini TTS: 24kHz、16-bit、單聲道）
+PCM_SAMPLE_RATE = 24000
+PCM_SAMPLE_WIDTH = 2
+PCM_CHANNELS = 1
+# 一次 ffmpeg 呼叫最多合併解碼的音頻數（每個佔用一條輸入與一條輸出管線），1 表示逐一解碼
+DECODE_BATCH_MAX = max(1, int(os.getenv("TTS_DECODE_BATCH_MAX", "32")))
+# 合併解碼時管線的緩衝區大小與每次讀寫的 bytes 數（加大緩衝區以減少讀寫次數與程序切換）
+PIPE_CHUNK = 256 * 1024
+
+
+def decode_pcm(
+    data: bytes,
+    frame_rate: int = PCM_SAMPLE_RATE,
+    sample_width: int = PCM_SAMPLE_WIDTH,
+    channels: int = PCM_CHANNELS,
+) -> AudioSegment:
+    """將原始 PCM 包裝為 AudioSegment（不複製、不啟動外部程序）"""
+    return AudioSegment(
+        data=data,
+        sample_width=sample_width,
+        frame_rate=frame_rate,
+        channels=channels,
+    )
+
+
+def decode_wav(data: bytes) -> AudioSegment:
+    """在記憶體中解析 WAV"""
+    return AudioSegment.from_file(io.BytesIO(data), format="wav")
+
+
+# 格式名稱與 ffmpeg demuxer 名稱不同者（Opus 以 Ogg 封裝）
+FFMPEG_DEMUXERS = {"opus": "ogg"}
+
+# MP3 解碼器固有延遲（樣本數），ffmpeg 從管線讀取時只會修剪開頭
+MP3_DECODER_DELAY = 529
+
+
+def mp3_end_padding(data: bytes) -> int:
+    """
+    從 Xing/Info 標頭的 LAME 擴充欄位讀取需修剪的結尾樣本數，沒有標頭時回傳 0
+
+    ffmpeg 讀取可 seek 的檔案時會依此修剪結尾；管線輸入無法 seek 到結尾，需自行修剪。
+    多個 MP3 直接串接時（標頭記錄的大小與實際不符），ffmpeg 不會修剪，這裡也不修剪。
+    """
+    start = 0
+    # 跳過 ID3v2 標籤
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = data[6:10]
+        start = 10 + ((size[0] & 0x7F) << 21 | (size[1] & 0x7F) << 14 | (size[2] & 0x7F) << 7 | (size[3] & 0x7F))
+    header = data[start:start + 4]
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return 0
+    mpeg1 = (header[1] >> 3) & 0x3 == 0x3
+    mono = (header[3] >> 6) == 0x3
+    # Xing/Info 標頭位於 frame header 與 side info 之後
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    offset = start + 4 + side_info
+    if data[offset:offset + 4] not in (b"Xing", b"Info"):
+        return 0
+    flags = int.from_bytes(data[offset + 4:offset + 8], "big")
+    position = offset + 8
+    if flags & 0x1:
+        position += 4
+    if flags & 0x2:
+        stream_bytes = int.from_bytes(data[position:position + 4], "big")
+        if abs(stream_bytes - (len(data) - start)) > 0.05 * stream_bytes:
+            return 0
+        position += 4
+    if flags & 0x4:
+        position += 100
+    if flags & 0x8:
+        position += 4
+    # LAME 擴充：第 21-23 byte 為 12-bit delay + 12-bit padding
+    lame = data[position:position + 24]
+    if len(lame) < 24:
+        return 0
+    padding = int.from_bytes(lame[21:24], "big") & 0xFFF
+    return max(0, padding - MP3_DECODER_DELAY)
+
+
+def _wav_output_segment(wav_data: bytearray, data: bytes, audio_format: str) -> AudioSegment:
+    """將 ffmpeg 經管線輸出的 16-bit PCM WAV 包裝為 AudioSegment，並依 LAME 標頭修剪 MP3 結尾"""
+    # 管線輸出的 WAV 標頭長度欄位無效，需修正
+    fix_wav_headers(wav_data)
+    segment = AudioSegment(data=bytes(wav_data))
+    if audio_format == "mp3":
+        padding = mp3_end_padding(data)
+        if padding:
+            segment = segment._spawn(segment.raw_data[:-padding * segment.frame_width])
+    return segment
+
+
+def decode_with_ffmpeg(data: bytes, audio_format: str) -> AudioSegment:
+    """經管線交給 ffmpeg 解碼為 16-bit PCM WAV，不經過檔案系統，也不另外呼叫 ffprobe"""
+    command = [
+        AudioSegment.converter,
+        "-v", "error",
+        "-f", FFMPEG_DEMUXERS.get(audio_format, audio_format),
+        "-i", "pipe:0",
+        "-vn",
+        "-acodec", "pcm_s16le",
+        "-f", "wav",
+        "pipe:1",
+    ]
+    process = subprocess.run(command, input=data, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0 or not process.stdout:
+        raise CouldntDecodeError(
+            f"ffmpeg 解碼 {audio_format} 失敗 (code {process.returncode}): "
+            f"{process.stderr.decode(errors='ignore')}"
+        )
+    return _wav_output_segment(bytearray(process.stdout), data, audio_format)
+
+
+def _pipe() -> tuple:
+    """建立管線，並盡量將緩衝區加大到 PIPE_CHUNK（僅 Linux 支援，失敗時維持系統預設）"""
+    read_fd, write_fd = os.pipe()
+    if hasattr(fcntl, "F_SETPIPE_SZ"):
+        try:
+            fcntl.fcntl(write_fd, fcntl.F_SETPIPE_SZ, PIPE_CHUNK)
+        except OSError:
+            pass
+    return read_fd, write_fd
+
+
+def _exchange(inputs: dict, outputs: dict):
+    """
+    在單一執行緒中同時寫入與讀取多條管線，直到全部關閉
+
+    inputs 為 {寫入端 fd: bytes}，寫完即關閉；outputs 為 {讀取端 fd: list}，讀到結束為止，讀到的各段依序加入 list。
+    對方提前結束（管線中斷）時停止寫入該管線，錯誤由呼叫端依程序結束碼判斷。
+    """
+    with selectors.DefaultSelector() as selector:
+        for fd, data in inputs.items():
+            os.set_blocking(fd, False)
+            selector.register(fd, selectors.EVENT_WRITE, memoryview(data))
+        for fd in outputs:
+            os.set_blocking(fd, False)
+            selector.register(fd, selectors.EVENT_READ)
+        try:
+            _pump(selector, outputs)
+        finally:
+            for key in list(selector.get_map().values()):
+                os.close(key.fd)
+
+
+def _pump(selector, outputs: dict):
+    """_exchange 的讀寫迴圈，已關閉的管線從 selector 移除"""
+    while selector.get_map():
+        for key, _ in selector.select():
+            fd = key.fd
+            if key.events & selectors.EVENT_WRITE:
+                view = key.data
+                try:
+                    view = view[os.write(fd, view[:PIPE_CHUNK]):]
+                except BlockingIOError:
+                    continue
+                except BrokenPipeError:
+                    view = view[:0]
+                if view:
+                    selector.modify(fd, selectors.EVENT_WRITE, view)
+                    continue
+            else:
+                try:
+                    chunk = os.read(fd, PIPE_CHUNK)
+                except BlockingIOError:
+                    continue
+                if chunk:
+                    outputs[fd].append(chunk)
+                    continue
+            selector.unregister(fd)
+            os.close(fd)
+
+
+def decode_batch(items: list) -> list:
+    """
+    以一次 ffmpeg 呼叫解碼多個音頻，items 為 [(bytes, 格式), ...]，依序回傳 AudioSegment
+
+    每個音頻經各自的管線輸入，分別以另一條管線輸出為 16-bit PCM WAV，不經過檔案系統；
+    各音頻的取樣率與聲道數可不同，結果與逐一解碼相同（MP3 結尾同樣依 LAME 標頭修剪）。
+    任一音頻無法解碼時整批失敗，拋出 CouldntDecodeError。
+    不支援傳遞額外管線給子程序的平台（Windows）逐一解碼。
+    """
+    if len(items) == 1 or os.name != "posix":
+        return [decode_with_ffmpeg(*item) for item in items]
+    input_pipes = [_pipe() for _ in items]
+    output_pipes = [_pipe() for _ in items]
+    stderr_read, stderr_write = os.pipe()
+    # ffmpeg 讀取各輸入管線的讀取端、寫入各輸出管線的寫入端
+    child_fds = [read_fd for read_fd, _ in input_pipes] + [write_fd for _, write_fd in output_pipes]
+    inputs = {write_fd: data for (_, write_fd), (data, _) in zip(input_pipes, items)}
+    outputs = {read_fd: [] for read_fd, _ in output_pipes}
+    stderr = []
+    command = [AudioSegment.converter, "-v", "error", "-nostdin"]
+    for (read_fd, _), (_, audio_format) in zip(input_pipes, items):
+        command += ["-f", FFMPEG_DEMUXERS.get(audio_format, audio_format), "-i", f"pipe:{read_fd}"]
+    for index, (_, write_fd) in enumerate(output_pipes):
+        command += ["-map", f"{index}:a:0", "-acodec", "pcm_s16le", "-f", "wav", f"pipe:{write_fd}"]
+    try:
+        process = subprocess.Popen(
+            command,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=stderr_write,
+            pass_fds=child_fds,
+        )
+    except BaseException:
+        for fd in [*inputs, *outputs, stderr_read]:
+            os.close(fd)
+        raise
+    finally:
+        for fd in [*child_fds, stderr_write]:
+            os.close(fd)
+    try:
+        _exchange(inputs, {**outputs, stderr_read: stderr})
+    finally:
+        process.wait()
+    if process.returncode != 0 or not all(outputs.values()):
+        raise CouldntDecodeError(
+            f"ffmpeg 合併解碼 {len(items)} 個音頻失敗 (code {process.returncode}): "
+            f"{b''.join(stderr).decode(errors='ignore')}"
+        )
+    return [
+        _wav_output_segment(bytearray(b"".join(chunks)), data, audio_format)
+        for chunks, (data, audio_format) in zip(outputs.values(), items)
+    ]
+
+
+class BatchDecoder:
+    """
+    合併同時等待的壓縮音頻解碼
+
+    submit 將音頻排入佇列並回傳 Future；背景執行緒每次取出目前排隊的音頻（最多 max_batch 個）
+    以 decode_batch 一起解碼，解碼期間新排入的音頻留到下一批，不另外等待湊批。
+    整批失敗時改為逐一解碼，只有無法解碼的音頻得到例外。
+    """
+
+    def __init__(self, max_batch: int = DECODE_BATCH_MAX):
+        self.max_batch = max_batch
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def submit(self, data: bytes, audio_format: str) -> Future:
+        future = Future()
+        with self._condition:
+            self._queue.append((data, audio_format, future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="tts-decode", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return future
+
+    def decode(self, data: bytes, audio_format: str) -> AudioSegment:
+        return self.submit(data, audio_format).result()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+            batch = [entry for entry in batch if entry[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            items = [(data, audio_format) for data, audio_format, _ in batch]
+            try:
+                results = decode_batch(items)
+            except Exception as e:
+                if len(batch) == 1:
+                    results = [e]
+                else:
+                    # 找出無法解碼的音頻，其餘照常完成
+                    results = []
+                    for item in items:
+                        try:
+                            results.append(decode_with_ffmpeg(*item))
+                        except Exception as error:
+                            results.append(error)
+            for (_, _, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+_batch_decoder = BatchDecoder()
+
+
+def submit_audio(data: bytes, audio_format: str, frame_rate: int = PCM_SAMPLE_RATE) -> Future:
+    """
+    依格式排入解碼，回傳結果為 AudioSegment 的 Future（參數同 decode_audio）
+
+    WAV 與 PCM 在呼叫端直接解碼，回傳已完成的 Future；其他格式與同時等待的音頻合併為一次 ffmpeg 呼叫。
+    """
+    if audio_format in ("raw", "pcm", "wav") or DECODE_BATCH_MAX <= 1:
+        future = Future()
+        try:
+            future.set_result(decode_audio(data, audio_format, frame_rate))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    return _batch_decoder.submit(data, audio_format)
+
+
+def decode_audio(data: bytes, audio_format: str, frame_rate: int = PCM_SAMPLE_RATE) -> AudioSegment:
+    """
+    依格式將音頻 bytes 解碼為 AudioSegment
+
+    audio_format: "mp3"、"wav"、"raw"/"pcm"（16-bit 單聲道，取樣率由 frame_rate 指定）或其他 ffmpeg 支援的格式；
+    其他執行緒同時等待解碼的壓縮音頻會合併為一次 ffmpeg 呼叫。
+    """
+    if audio_format in ("raw", "pcm"):
+        return decode_pcm(data, frame_rate=frame_rate)
+    if audio_format == "wav":
+        try:
+            return decode_wav(data)
+        except Exception:
+            # 非標準 WAV（例如 float 或 extensible 標頭）交給 ffmpeg
+            return decode_with_ffmpeg(data, "wav")
+    if DECODE_BATCH_MAX > 1:
+        return _batch_decoder.decode(data, audio_format)
+    return decode_with_ffmpeg(data, audio_format)
+
+
+class PcmStreamDecoder:
+    """逐段解碼原始 PCM：每次 feed 回傳目前完整樣本的 AudioSegment，不完整的樣本留到下次"""
+
+    def __init__(
+        self,
+        frame_rate: int = PCM_SAMPLE_RATE,
+        sample_width: int = PCM_SAMPLE_WIDTH,
+        channels: int = PCM_CHANNELS,
+    ):
+        self.frame_rate = frame_rate
+        self.sample_width = sample_width
+        self.channels = channels
+        self._pending = b""
+
+    def feed(self, data: bytes) -> Optional[AudioSegment]:
+        data = self._pending + data
+        ready = len(data) - len(data) % (self.sample_width * self.channels)
+        self._pending = data[ready:]
+        if not ready:
+            return None
+        return decode_pcm(data[:ready], self.frame_rate, self.sample_width, self.channels)
+
+    def finish(self) -> Optional[AudioSegment]:
+        self._pending = b""
+        return None
+
+
+class WavStreamDecoder:
+    """
+    逐段解碼 WAV：讀完標頭後每次 feed 回傳目前完整樣本的 AudioSegment
+
+    data 長度為 0 或最大值（長度未知的串流）時讀到結束為止。16-bit 整數 PCM 以外的 WAV
+    （例如 24-bit 或 float）先累積，finish 時整檔解碼。
+    """
+
+    def __init__(self):
+        self._header = b""
+        self._pcm = None           # 標頭解析完成後的 PcmStreamDecoder
+        self._remaining = None     # data 區塊剩餘 bytes，None 表示讀到結束
+        self._fallback = None      # 不支援逐段解碼時累積整個檔案
+
+    def _parse_header(self) -> bool:
+        """解析 RIFF 標頭直到 data 區塊開頭；資料不足時回傳 False"""
+        data = self._header
+        if len(data) < 12:
+            return False
+        if data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+            raise CouldntDecodeError("不是有效的 WAV 標頭")
+        position = 12
+        fmt = None
+        while True:
+            if len(data) < position + 8:
+                return False
+            chunk_id = data[position:position + 4]
+            size = struct.unpack("<I", data[position + 4:position + 8])[0]
+            body = position + 8
+            if chunk_id == b"data":
+                break
+            if len(data) < body + size:
+                return False
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", data[body:body + 16])
+            position = body + size + size % 2
+        if fmt is None:
+            raise CouldntDecodeError("WAV 缺少 fmt 區塊")
+        format_tag, channels, frame_rate, _, _, bits = fmt
+        if format_tag not in (1, 0xFFFE) or bits != 16:
+            self._fallback = bytearray(data)
+            return True
+        self._pcm = PcmStreamDecoder(frame_rate, 2, channels)
+        self._remaining = None if size in (0, 0xFFFFFFFF) else size
+        self._header = data[body:]  # data 區塊中已收到的部分
+        return True
+
+    def feed(self, data: bytes) -> Optional[AudioSegment]:
+        if self._fallback is not None:
+            self._fallback += data
+            return None
+        if self._pcm is None:
+            self._header += data
+            if not self._parse_header() or self._fallback is not None:
+                return None
+            data, self._header = self._header, b""
+        if self._remaining is not None:
+            data = data[:self._remaining]
+            self._remaining -= len(data)
+        return self._pcm.feed(data) if data else None
+
+    def finish(self) -> Optional[AudioSegment]:
+        if self._fallback is not None:
+            return decode_audio(bytes(self._fallback), "wav")
+        if self._pcm is None:
+            raise CouldntDecodeError("WAV 標頭不完整")
+        return None
+
+
+class BufferedDecoder:
+    """不支援逐段解碼的格式：累積全部資料，finish 時整段解碼"""
+
+    def __init__(self, audio_format: str, frame_rate: int = PCM_SAMPLE_RATE):
+        self.audio_format = audio_format
+        self.frame_rate = frame_rate
+        self._data = bytearray()
+
+    def feed(self, data: bytes) -> Optional[AudioSegment]:
+        self._data += data
+        return None
+
+    def finish(self) -> Optional[AudioSegment]:
+        if not self._data:
+            return None
+        return decode_audio(bytes(self._data), self.audio_format, frame_rate=self.frame_rate)
+
+
+def stream_decoder(audio_format: str, frame_rate: int = PCM_SAMPLE_RATE):
+    """
+    取得逐段解碼器：feed(bytes) 回傳已可解碼的 AudioSegment 或 None，finish() 回傳剩餘部分或 None
+
+    "raw"/"pcm" 與 "wav" 邊收邊解碼，其他格式在 finish 時整段解碼。
+    """
+    if audio_format in ("raw", "pcm"):
+        return PcmStreamDecoder(frame_rate)
+    if audio_format == "wav":
+        return WavStreamDecoder()
+    return BufferedDecoder(audio_format, frame_rate)
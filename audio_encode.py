@@ -0,0 +1,245 @@
+"""
+輸出格式與編碼
+
+支援 mp3、opus、aac、wav 與 pcm（16-bit little-endian、無標頭）輸出：WAV 與 PCM 由 Python 直接寫出，
+壓縮格式交給 ffmpeg 並可指定位元率。provider 能直接輸出所要求的格式且不需處理時，
+api.py 與 app.py 會直接使用 provider 的原始 bytes，不經過這裡。
+串流輸出以 encode_stream 將 PCM 持續送入單一 ffmpeg 程序，片段之間沒有編碼器填充造成的間隙；
+串流組裝以 encode_to_file 由同一個 ffmpeg 程序直接寫入輸出文件。
+"""
+import io
+import struct
+import subprocess
+import tempfile
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from pydub import AudioSegment
+
+
+@dataclass(frozen=True)
+class OutputFormat:
+    """輸出格式：副檔名、HTTP media type 與 ffmpeg 編碼設定"""
+
+    name: str
+    label: str
+    extension: str
+    media_type: str
+    ffmpeg_format: Optional[str] = None  # None 表示由 Python 直接寫出
+    codec: Optional[str] = None          # None 表示使用 ffmpeg 對該格式的預設編碼器
+    bitrates: tuple = ()
+    default_bitrate: Optional[str] = None
+
+
+OUTPUT_FORMATS = {
+    spec.name: spec
+    for spec in (
+        # 24kHz 為 MPEG-2 Layer III，位元率上限 160k
+        OutputFormat("mp3", "MP3", "mp3", "audio/mpeg", "mp3",
+                     bitrates=("32k", "48k", "64k", "96k", "128k", "160k"), default_bitrate="128k"),
+        OutputFormat("opus", "Opus (Ogg)", "opus", "audio/ogg", "opus", "libopus",
+                     bitrates=("16k", "24k", "32k", "48k", "64k", "96k"), default_bitrate="48k"),
+        OutputFormat("aac", "AAC (ADTS)", "aac", "audio/aac", "adts", "aac",
+                     bitrates=("48k", "64k", "96k", "128k", "160k"), default_bitrate="96k"),
+        OutputFormat("wav", "WAV", "wav", "audio/wav"),
+        OutputFormat("pcm", "PCM (16-bit LE)", "pcm", "audio/pcm"),
+    )
+}
+
+DEFAULT_OUTPUT_FORMAT = "mp3"
+
+
+def get_output_format(name: Optional[str]) -> OutputFormat:
+    """取得輸出格式（None 為 mp3），不存在時拋出 KeyError"""
+    try:
+        return OUTPUT_FORMATS[name or DEFAULT_OUTPUT_FORMAT]
+    except KeyError:
+        raise KeyError(f"不支援的輸出格式: {name}") from None
+
+
+def resolve_bitrate(output_format: OutputFormat, bitrate: Optional[str]) -> Optional[str]:
+    """檢查位元率（未指定時使用格式預設值）；無損格式忽略位元率，不適用的位元率拋出 ValueError"""
+    if not output_format.bitrates:
+        return None
+    if not bitrate:
+        return output_format.default_bitrate
+    if bitrate not in output_format.bitrates:
+        raise ValueError(
+            f"{output_format.name} 不支援位元率 {bitrate}，可用: {', '.join(output_format.bitrates)}"
+        )
+    return bitrate
+
+
+def format_for_path(path) -> OutputFormat:
+    """依副檔名判斷已保存音頻的格式，無法判斷時視為 mp3"""
+    suffix = Path(path).suffix.lstrip(".").lower()
+    for spec in OUTPUT_FORMATS.values():
+        if spec.extension == suffix:
+            return spec
+    return OUTPUT_FORMATS[DEFAULT_OUTPUT_FORMAT]
+
+
+def output_extensions() -> set:
+    return {f".{spec.extension}" for spec in OUTPUT_FORMATS.values()}
+
+
+def media_type(output_format: OutputFormat, frame_rate: Optional[int] = None, channels: int = 1) -> str:
+    """HTTP media type；PCM 無標頭，附上取樣率與聲道數"""
+    if output_format.name == "pcm" and frame_rate:
+        return f"{output_format.media_type};rate={frame_rate};channels={channels}"
+    return output_format.media_type
+
+
+def encode_audio(segment: AudioSegment, output_format: OutputFormat, bitrate: Optional[str] = None) -> bytes:
+    """將 AudioSegment 編碼為指定格式"""
+    if output_format.name == "pcm":
+        return segment.set_sample_width(2).raw_data
+    output = io.BytesIO()
+    if output_format.ffmpeg_format is None:
+        segment.export(output, format=output_format.name)
+    else:
+        segment.export(
+            output,
+            format=output_format.ffmpeg_format,
+            codec=output_format.codec,
+            bitrate=resolve_bitrate(output_format, bitrate),
+        )
+    return output.getvalue()
+
+
+def wav_header(frame_rate: int, channels: int = 1, sample_width: int = 2, data_bytes: Optional[int] = None) -> bytes:
+    """PCM WAV 標頭（44 bytes）；data_bytes 為 None 時長度未知，RIFF 與 data 長度填最大值"""
+    byte_rate = frame_rate * channels * sample_width
+    data_size = 0xFFFFFFFF if data_bytes is None else min(data_bytes, 0xFFFFFFFF - 36)
+    riff_size = 0xFFFFFFFF if data_bytes is None else data_size + 36
+    return (
+        b"RIFF" + struct.pack("<I", riff_size) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, frame_rate, byte_rate,
+                                channels * sample_width, sample_width * 8)
+        + b"data" + struct.pack("<I", data_size)
+    )
+
+
+def wav_stream_header(frame_rate: int, channels: int = 1, sample_width: int = 2) -> bytes:
+    """串流用的 WAV 標頭：總長度未知，RIFF 與 data 長度填最大值（播放器會讀到串流結束）"""
+    return wav_header(frame_rate, channels, sample_width)
+
+
+def _encode_command(output_format: OutputFormat, frame_rate: int, channels: int, bitrate: Optional[str]) -> list:
+    """從 stdin 讀取 16-bit PCM 編碼為 output_format 的 ffmpeg 參數（不含輸出位置）"""
+    command = [
+        AudioSegment.converter,
+        "-v", "error",
+        # raw PCM 不需探測格式，避免 ffmpeg 等到讀滿探測緩衝才開始編碼
+        "-probesize", "32", "-analyzeduration", "0",
+        "-f", "s16le", "-ar", str(frame_rate), "-ac", str(channels),
+        "-i", "pipe:0",
+    ]
+    if output_format.codec:
+        command += ["-acodec", output_format.codec]
+    bitrate = resolve_bitrate(output_format, bitrate)
+    if bitrate:
+        command += ["-b:a", bitrate]
+    return command
+
+
+def encode_stream(
+    pcm_chunks,
+    output_format: OutputFormat,
+    frame_rate: int,
+    channels: int = 1,
+    bitrate: Optional[str] = None,
+):
+    """
+    以單一 ffmpeg 程序將 16-bit PCM 區塊連續編碼為 output_format，逐步產出編碼後的 bytes
+
+    pcm_chunks 由背景執行緒讀取並寫入 ffmpeg，結束時由該執行緒關閉；編碼輸出一產生即產出，
+    片段之間沒有各自編碼時的填充間隙。pcm_chunks 拋出的例外在輸出結束後重新拋出，
+    呼叫端提前關閉 generator 時終止 ffmpeg。
+    """
+    command = _encode_command(output_format, frame_rate, channels, bitrate)
+    command += ["-flush_packets", "1", "-f", output_format.ffmpeg_format, "pipe:1"]
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    errors = []
+
+    def feed():
+        try:
+            for chunk in pcm_chunks:
+                process.stdin.write(chunk)
+        except BrokenPipeError:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            process.kill()
+        finally:
+            if hasattr(pcm_chunks, "close"):
+                pcm_chunks.close()
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    feeder = threading.Thread(target=feed, name="stream-encoder", daemon=True)
+    feeder.start()
+    try:
+        while True:
+            chunk = process.stdout.read1(65536)
+            if not chunk:
+                break
+            yield chunk
+        feeder.join()
+        stderr = process.stderr.read()
+        process.wait()
+        if errors:
+            raise errors[0]
+        if process.returncode != 0:
+            raise RuntimeError(
+                f"ffmpeg 編碼 {output_format.name} 失敗 (code {process.returncode}): "
+                f"{stderr.decode(errors='ignore')}"
+            )
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+
+def encode_to_file(
+    pcm_chunks,
+    output_format: OutputFormat,
+    path,
+    frame_rate: int,
+    channels: int = 1,
+    bitrate: Optional[str] = None,
+):
+    """
+    以單一 ffmpeg 程序將 16-bit PCM 區塊連續編碼為 output_format，直接寫入 path（覆寫）
+
+    與 encode_stream 相同沒有片段間隙；輸出為可回寫的文件，ffmpeg 編碼結束時會補上
+    MP3 的 Xing / LAME 標頭（長度與 encoder delay，播放器可正確拖曳並去除前後填充）。
+    pcm_chunks 在呼叫端執行緒中讀取，拋出的例外會終止 ffmpeg 後重新拋出。
+    """
+    command = _encode_command(output_format, frame_rate, channels, bitrate)
+    command += ["-y", "-f", output_format.ffmpeg_format, str(path)]
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr)
+        try:
+            for chunk in pcm_chunks:
+                process.stdin.write(chunk)
+            process.stdin.close()
+            process.wait()
+        except BrokenPipeError:
+            process.wait()
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        if process.returncode != 0:
+            stderr.seek(0)
+            raise RuntimeError(
+                f"ffmpeg 編碼 {output_format.name} 失敗 (code {process.returncode}): "
+                f"{stderr.read().decode(errors='ignore')}"
+            )
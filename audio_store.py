@@ -0,0 +1,347 @@
+"""
+內容定址的輸出音頻存放區
+
+輸出音頻以內容雜湊命名（sha256 前 32 碼 + 副檔名），相同內容只保存一次，檔名不變內容就不變：
+雜湊可直接作為強 ETag，回應可長期快取。寫入先寫臨時文件再原子替換，讀取端不會看到寫到一半的文件；
+串流組裝以 writer 逐步寫入臨時文件，完成後才計算雜湊並命名。
+
+每個輸出記錄在 SQLite 索引（大小、建立與最後存取時間），保存與存取只需一次主鍵寫入；
+過期與超出總大小的輸出（依最後存取時間 LRU）由背景 janitor 執行緒定期淘汰，請求路徑不掃描目錄。
+api.py 與 app.py 共用。
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from audio_encode import output_extensions
+
+load_dotenv()
+
+AUDIO_DIR = os.getenv("TTS_AUDIO_DIR", "./temp_audio")
+AUDIO_MAX_MB = float(os.getenv("TTS_AUDIO_MAX_MB", "2048"))
+AUDIO_MAX_AGE_HOURS = float(os.getenv("TTS_AUDIO_MAX_AGE_HOURS", "24"))
+AUDIO_JANITOR_SECONDS = float(os.getenv("TTS_AUDIO_JANITOR_SECONDS", "300"))
+
+INDEX_NAME = "index.sqlite3"
+# 與輸出同名的附屬文件（render manifest），隨輸出一起刪除
+SIDECAR_SUFFIXES = (".json",)
+# 中斷的寫入超過此秒數視為殘留
+PARTIAL_MAX_AGE_SECONDS = 60 * 60
+
+HASH_LENGTH = 32
+_HASH_NAME = re.compile(rf"^[0-9a-f]{{{HASH_LENGTH}}}$")
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+
+
+def file_hash(path) -> str:
+    """與 content_hash 相同的雜湊，逐塊讀取文件計算"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def content_etag(path) -> Optional[str]:
+    """內容定址文件的強 ETag；舊的隨機檔名回傳 None"""
+    stem = Path(path).stem
+    return f'"{stem}"' if _HASH_NAME.match(stem) else None
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """If-None-Match 是否與 ETag 相符（依 RFC 9110 以弱比較判斷）"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+class AudioStore:
+    """以 SQLite 索引管理的輸出存放區（執行緒安全），依總大小與最後存取時間淘汰"""
+
+    def __init__(
+        self,
+        directory: str = AUDIO_DIR,
+        max_bytes: int = int(AUDIO_MAX_MB * 1024 * 1024),
+        max_age_seconds: float = AUDIO_MAX_AGE_HOURS * 3600,
+        janitor_seconds: float = AUDIO_JANITOR_SECONDS,
+        suffixes: set = None,
+    ):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.janitor_seconds = janitor_seconds
+        # 納入管理的輸出副檔名；目錄內其他文件不受影響
+        self.suffixes = suffixes if suffixes is not None else output_extensions()
+        self.evicted = 0
+        self.last_sweep = None
+
+        self._lock = threading.Lock()
+        self._db = None  # 首次使用時開啟
+        self._janitor = None
+        self._stop = threading.Event()
+
+    # 索引
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.directory / INDEX_NAME, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA busy_timeout=5000")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS outputs ("
+                "name TEXT PRIMARY KEY, size INTEGER NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS outputs_accessed ON outputs (accessed)")
+            self._db = db
+        return self._db
+
+    def path(self, file_name: str) -> Path:
+        """存放區內的文件路徑（只取檔名，避免路徑穿越）"""
+        return self.directory / Path(file_name).name
+
+    def is_output(self, file_name: str) -> bool:
+        """是否為納入管理的輸出檔名；索引、manifest 與寫入中的暫存文件不對外提供"""
+        name = Path(file_name).name
+        return name == file_name and Path(name).suffix in self.suffixes
+
+    def save(self, data: bytes, extension: str) -> Path:
+        """
+        以內容雜湊命名保存音頻，回傳路徑
+
+        相同內容已存在時不重寫，只更新最後存取時間；索引只寫入一筆，不掃描目錄。
+        音頻在鎖外寫入臨時文件，鎖只保護改名與索引更新，大文件的寫入不會阻塞其他請求。
+        """
+        self.start()
+        path = self.directory / f"{content_hash(data)}.{extension}"
+        temp_path = None if path.exists() else self._write_temp(data)
+        if not self._commit(path, len(data), temp_path):
+            # 檢查之後文件已被淘汰，寫入後再登記
+            self._commit(path, len(data), self._write_temp(data))
+        return path
+
+    def save_file(self, temp_path, extension: str) -> Path:
+        """
+        將已寫好的臨時文件以內容雜湊命名移入存放區，回傳路徑
+
+        相同內容已存在時刪除臨時文件，只更新最後存取時間。
+        """
+        self.start()
+        temp_path = Path(temp_path)
+        size = temp_path.stat().st_size
+        path = self.directory / f"{file_hash(temp_path)}.{extension}"
+        self._commit(path, size, temp_path)
+        return path
+
+    def _write_temp(self, data: bytes) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with NamedTemporaryFile(dir=self.directory, delete=False, suffix=".part") as temp_file:
+            temp_file.write(data)
+        return Path(temp_file.name)
+
+    def _commit(self, path: Path, size: int, temp_path: Optional[Path]) -> bool:
+        """
+        將臨時文件改名為 path（已存在時刪除臨時文件）並登記索引
+
+        未指定臨時文件且 path 已不存在時不登記，回傳 False。
+        """
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            if temp_path is None:
+                if not path.exists():
+                    return False
+            elif path.exists():
+                temp_path.unlink()
+            else:
+                os.replace(temp_path, path)
+            db.execute(
+                "INSERT INTO outputs (name, size, created, accessed) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET accessed = excluded.accessed",
+                (path.name, size, now, now),
+            )
+        return True
+
+    def writer(self, extension: str) -> "OutputWriter":
+        """開始逐步寫入一個輸出（串流組裝使用），寫完以 commit 保存"""
+        self.start()
+        return OutputWriter(self, extension)
+
+    def touch(self, file_name: str):
+        """記錄存取（下載、作為 rerender_from），延後淘汰"""
+        self.start()
+        with self._lock:
+            self._connect().execute(
+                "UPDATE outputs SET accessed = ? WHERE name = ?", (time.time(), Path(file_name).name)
+            )
+
+    # 淘汰
+    def _remove(self, name: str):
+        path = self.directory / name
+        for target in (path, *(path.with_suffix(suffix) for suffix in SIDECAR_SUFFIXES)):
+            target.unlink(missing_ok=True)
+        self._db.execute("DELETE FROM outputs WHERE name = ?", (name,))
+        self.evicted += 1
+
+    def reconcile(self):
+        """
+        讓索引與目錄一致：補登索引建立前的輸出、移除文件已不存在的記錄，
+        並刪除過期的孤立附屬文件與中斷寫入的殘留。janitor 啟動時執行一次。
+        """
+        with self._lock:
+            db = self._connect()
+            indexed = {name for (name,) in db.execute("SELECT name FROM outputs")}
+            present = set()
+            sidecars = []
+            now = time.time()
+            for path in self.directory.iterdir():
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                modified, size = stat.st_mtime, stat.st_size
+                if path.suffix in self.suffixes:
+                    present.add(path.name)
+                    if path.name not in indexed:
+                        db.execute(
+                            "INSERT OR IGNORE INTO outputs (name, size, created, accessed) VALUES (?, ?, ?, ?)",
+                            (path.name, size, modified, modified),
+                        )
+                elif path.suffix in SIDECAR_SUFFIXES and modified < now - self.max_age_seconds:
+                    sidecars.append(path)
+                elif path.suffix == ".part" and modified < now - PARTIAL_MAX_AGE_SECONDS:
+                    path.unlink(missing_ok=True)
+            for name in indexed - present:
+                db.execute("DELETE FROM outputs WHERE name = ?", (name,))
+            outputs = {Path(name).stem for name in present}
+            for path in sidecars:
+                if path.stem not in outputs:
+                    path.unlink(missing_ok=True)
+
+    def sweep(self) -> int:
+        """刪除超過保留期限的輸出，總大小超出上限時依最後存取時間由舊到新刪除，回傳刪除數量"""
+        with self._lock:
+            db = self._connect()
+            before = self.evicted
+            expired = db.execute(
+                "SELECT name FROM outputs WHERE accessed < ?", (time.time() - self.max_age_seconds,)
+            ).fetchall()
+            for (name,) in expired:
+                self._remove(name)
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM outputs").fetchone()[0]
+            if total > self.max_bytes:
+                for name, size in db.execute("SELECT name, size FROM outputs ORDER BY accessed").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    self._remove(name)
+                    total -= size
+            self.last_sweep = time.time()
+            return self.evicted - before
+
+    def _run_janitor(self):
+        try:
+            self.reconcile()
+        except Exception as e:
+            print(f"⚠️ 輸出索引整理失敗: {e}")
+        while True:
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"⚠️ 輸出清理失敗: {e}")
+            if self._stop.wait(self.janitor_seconds):
+                return
+
+    def start(self):
+        """啟動背景 janitor（重複呼叫無作用）"""
+        if self._janitor is not None:
+            return
+        with self._lock:
+            if self._janitor is None:
+                self._janitor = threading.Thread(target=self._run_janitor, name="audio-store-janitor", daemon=True)
+                self._janitor.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def info(self) -> dict:
+        """供 /health 使用的存放區狀態"""
+        with self._lock:
+            entries, size = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM outputs"
+            ).fetchone()
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "max_age_seconds": self.max_age_seconds,
+            "evicted": self.evicted,
+            "last_sweep": self.last_sweep,
+        }
+
+
+class OutputWriter:
+    """
+    逐步寫入的輸出：先寫入存放區內的臨時文件，commit 時依內容雜湊命名並登記索引
+
+    音頻不必整份留在記憶體；未 commit 即結束（例外或 abort）時刪除臨時文件。
+    """
+
+    def __init__(self, store: AudioStore, extension: str):
+        self.store = store
+        self.extension = extension
+        self.size = 0
+        self.path = None  # commit 後的輸出路徑
+        store.directory.mkdir(parents=True, exist_ok=True)
+        self._file = NamedTemporaryFile(dir=store.directory, delete=False, suffix=".part")
+
+    @property
+    def temp_path(self) -> Path:
+        """寫入中的臨時文件，可交給外部程序（例如 ffmpeg）直接寫入，寫完後呼叫 refresh"""
+        return Path(self._file.name)
+
+    def refresh(self):
+        """外部程序直接寫入 temp_path 後，更新大小並將寫入位置移到結尾"""
+        self._file.flush()
+        self.size = self._file.seek(0, os.SEEK_END)
+
+    def write(self, data: bytes):
+        self._file.write(data)
+        self.size += len(data)
+
+    def overwrite(self, offset: int, data: bytes):
+        """改寫已寫入的內容（例如寫完後補上 WAV 標頭的長度欄位），之後的寫入仍接在結尾"""
+        self._file.seek(offset)
+        self._file.write(data)
+        self._file.seek(0, os.SEEK_END)
+
+    def commit(self) -> Path:
+        self._file.close()
+        self.path = self.store.save_file(self._file.name, self.extension)
+        return self.path
+
+    def abort(self):
+        """放棄寫入（已 commit 時無作用）"""
+        if self.path is None:
+            self._file.close()
+            Path(self._file.name).unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.abort()
+
+
+audio_store = AudioStore()
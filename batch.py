@@ -0,0 +1,68 @@
+"""
+批次生成的跨腳本片段去重
+
+多個腳本的片段一起規劃：聲音、語氣與文本都相同的片段只合成一次，各腳本共用同一份音頻。
+唯一片段依首次出現的順序排列，依序合成時，第 N 個腳本所需的片段一到齊即可組裝，不必等待整批；
+共用片段在最後一個使用它的腳本組裝後即可釋放。
+"""
+from dataclasses import dataclass, field
+
+
+@dataclass
+class BatchPlan:
+    """批次的去重結果：唯一片段與各腳本的片段索引"""
+
+    unique: list = field(default_factory=list)       # [(speaker, text)]，每個唯一片段的代表
+    keys: list = field(default_factory=list)         # 每個腳本各片段在 unique 中的索引
+    uses: list = field(default_factory=list)         # 各唯一片段被使用的次數
+    characters: int = 0                              # 所有腳本片段的總字元數
+    unique_characters: int = 0
+
+    @property
+    def total_segments(self) -> int:
+        return sum(len(keys) for keys in self.keys)
+
+    @property
+    def dedup_ratio(self) -> float:
+        """因重複而不必合成的片段比例"""
+        total = self.total_segments
+        return 1 - len(self.unique) / total if total else 0.0
+
+    def ready_after(self, script_index: int) -> int:
+        """腳本所需片段中最後合成的唯一片段索引；沒有片段時為 -1"""
+        return max(self.keys[script_index], default=-1)
+
+    def as_dict(self) -> dict:
+        return {
+            "segments": self.total_segments,
+            "unique_segments": len(self.unique),
+            "duplicate_segments": self.total_segments - len(self.unique),
+            "dedup_ratio": round(self.dedup_ratio, 4),
+            "characters": self.characters,
+            "unique_characters": self.unique_characters,
+        }
+
+
+def plan_batch(planned_scripts: list, settings) -> BatchPlan:
+    """
+    將各腳本已切分的片段 [(speaker, text), ...] 依 (聲音, 語氣, 文本) 去重
+
+    不同說話者使用相同聲音與語氣時也視為同一片段；settings 為 RenderSettings。
+    """
+    plan = BatchPlan()
+    index_by_key = {}
+    for segments in planned_scripts:
+        keys = []
+        for speaker, text in segments:
+            key = (*settings.for_speaker(speaker), text)
+            index = index_by_key.get(key)
+            if index is None:
+                index = index_by_key[key] = len(plan.unique)
+                plan.unique.append((speaker, text))
+                plan.uses.append(0)
+                plan.unique_characters += len(text)
+            plan.uses[index] += 1
+            plan.characters += len(text)
+            keys.append(index)
+        plan.keys.append(keys)
+    return plan
@@ -0,0 +1,108 @@
+"""
+音頻組裝效能比較：逐段 `+=` 串接 vs audio_assembler.assemble_segments
+
+以合成的 PCM 片段（不需 API Key、不需 ffmpeg）量測 10 / 100 / 1000 段的組裝耗時與峰值記憶體。
+
+用法:
+    python benchmarks/assembly.py
+    python benchmarks/assembly.py --counts 10 100 1000 --seconds 3 --json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from pydub import AudioSegment
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_assembler import assemble_segments  # noqa: E402
+
+
+def make_segments(count: int, seconds: float, frame_rate: int = 24000) -> list:
+    """產生長度略有差異的 16-bit 單聲道片段（模擬 Gemini PCM）"""
+    rng = np.random.default_rng(0)
+    segments = []
+    for _ in range(count):
+        frames = int(frame_rate * seconds * rng.uniform(0.5, 1.5))
+        samples = rng.integers(-8000, 8000, size=frames, dtype=np.int16)
+        segments.append(AudioSegment(
+            data=samples.tobytes(),
+            sample_width=2,
+            frame_rate=frame_rate,
+            channels=1,
+        ))
+    return segments
+
+
+def concat_incremental(segments: list) -> AudioSegment:
+    """原本的做法：每段都複製整段已累積的音頻"""
+    combined = None
+    for segment in segments:
+        if combined is None:
+            combined = segment
+        else:
+            combined += segment
+    return combined
+
+
+def measure(function, segments: list) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(segments)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "seconds": round(elapsed, 4),
+        "peak_mb": round(peak / 1024 / 1024, 2),
+        "output_mb": round(len(result.raw_data) / 1024 / 1024, 2),
+        "digest": hash(bytes(result.raw_data)),
+    }
+
+
+def run(counts: list, seconds: float) -> list:
+    results = []
+    for count in counts:
+        segments = make_segments(count, seconds)
+        incremental = measure(concat_incremental, segments)
+        preallocated = measure(assemble_segments, segments)
+        identical = incremental.pop("digest") == preallocated.pop("digest")
+        results.append({
+            "segments": count,
+            "audio_minutes": round(sum(len(s) for s in segments) / 60000, 1),
+            "incremental": incremental,
+            "preallocated": preallocated,
+            "speedup": round(incremental["seconds"] / max(preallocated["seconds"], 1e-9), 1),
+            "identical_output": identical,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="音頻組裝效能比較")
+    parser.add_argument("--counts", type=int, nargs="+", default=[10, 100, 1000], help="片段數量")
+    parser.add_argument("--seconds", type=float, default=3.0, help="每段平均秒數")
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出")
+    args = parser.parse_args()
+
+    results = run(args.counts, args.seconds)
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        return
+
+    print(f"{'片段數':>6} {'音頻(分)':>8} {'+= 耗時':>10} {'+= 峰值MB':>10} {'預配置耗時':>10} {'預配置峰值MB':>12} {'加速':>6} {'輸出一致':>8}")
+    for row in results:
+        print(
+            f"{row['segments']:>6} {row['audio_minutes']:>8} "
+            f"{row['incremental']['seconds']:>10} {row['incremental']['peak_mb']:>10} "
+            f"{row['preallocated']['seconds']:>10} {row['preallocated']['peak_mb']:>12} "
+            f"{row['speedup']:>6} {str(row['identical_output']):>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
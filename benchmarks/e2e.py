@@ -0,0 +1,306 @@
+"""
+端到端效能量測：以本機假 provider 驅動 api.py 的 /generate-audio
+
+每個 (情境, provider) 組合在獨立子程序中執行，峰值 RSS 互不影響；假 provider 在父程序中執行，
+不計入被測程序的 CPU 與記憶體。結果以 JSON 輸出，可直接 diff 比較。
+
+量測項目：
+- 端到端延遲百分位數（p50 / p90 / p99）、每秒腳本數、每秒 provider 請求數
+- 解碼 / 編碼 CPU 時間（Python 執行緒 CPU + ffmpeg 子程序 CPU；編碼於所有片段解碼後才執行，
+  以該期間的子程序 CPU 計入編碼，其餘子程序 CPU 計入解碼；--render-mode stream 時編碼與解碼交錯進行，
+  ffmpeg CPU 全部計入解碼，以 ffmpeg_seconds 比較）
+- 每個請求啟動的子程序（ffmpeg）數
+- 被測程序的峰值 RSS
+
+用法:
+    python benchmarks/e2e.py
+    python benchmarks/e2e.py --scenarios small medium --providers openai gemini --latency 0.2 --error-rate 0.05
+    python benchmarks/e2e.py --scenarios hour --providers gemini --output results.json
+    python benchmarks/e2e.py --scenarios hour 3hour --providers openai --render-mode stream
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_providers import FakeProviderServer  # noqa: E402
+
+PROVIDERS = ["openai", "gemini", "polly", "taiwanese"]
+
+# 情境: (對話輪數, 每輪字符數, 預設請求次數)；以每字符 0.25 秒計，hour 約 60 分鐘音頻、3hour 約 3 小時
+SCENARIOS = {
+    "small": (10, 40, 10),
+    "medium": (100, 80, 3),
+    "hour": (240, 60, 1),
+    "3hour": (720, 60, 1),
+}
+
+_PHRASES = [
+    "今天我們來聊聊語音合成的效能", "這一段文字只是用來量測的範例", "每個片段都會送到假的服務",
+    "請注意延遲與吞吐量的變化", "長篇腳本需要更有效率的處理", "我們也會觀察記憶體的使用量",
+]
+
+
+def make_script(turns: int, chars_per_turn: int) -> str:
+    lines = []
+    for turn in range(turns):
+        text = ""
+        index = turn
+        while len(text) < chars_per_turn:
+            text += _PHRASES[index % len(_PHRASES)] + "。"
+            index += 1
+        lines.append(f"speaker-{turn % 2 + 1}: {text[:chars_per_turn]}")
+    return "\n".join(lines)
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def max_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 單位為 KB，macOS 為 bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class ProcessCounter:
+    """包裝 subprocess.Popen，累計啟動的子程序數"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def install(self):
+        counter = self
+
+        class CountingPopen(subprocess.Popen):
+            def __init__(self, *args, **kwargs):
+                with counter.lock:
+                    counter.count += 1
+                super().__init__(*args, **kwargs)
+
+        subprocess.Popen = CountingPopen
+
+
+class CpuMeter:
+    """累計被包裝函式的執行緒 CPU 時間與期間內的子程序 CPU 時間"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread_seconds = 0.0
+        self.children_seconds = 0.0
+
+    def wrap(self, function, count_children: bool = False):
+        def wrapper(*args, **kwargs):
+            thread_start = time.thread_time()
+            children_start = children_cpu()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                thread_elapsed = time.thread_time() - thread_start
+                with self.lock:
+                    self.thread_seconds += thread_elapsed
+                    if count_children:
+                        self.children_seconds += children_cpu() - children_start
+        return wrapper
+
+
+def run_scenario(provider: str, scenario: str, requests_count: int) -> dict:
+    """子程序：匯入 api.py、包裝解碼與編碼、依序送出請求"""
+    from fastapi.testclient import TestClient
+    from pydub import AudioSegment
+
+    import api
+    import audio_decode
+    import providers
+
+    decode_meter = CpuMeter()
+    encode_meter = CpuMeter()
+    processes = ProcessCounter()
+    processes.install()
+    # WAV / PCM 在呼叫端解碼，壓縮格式在背景執行緒合併解碼
+    providers.submit_audio = decode_meter.wrap(providers.submit_audio)
+    audio_decode.decode_batch = decode_meter.wrap(audio_decode.decode_batch)
+    AudioSegment.export = encode_meter.wrap(AudioSegment.export, count_children=True)
+
+    turns, chars_per_turn, _ = SCENARIOS[scenario]
+    script = make_script(turns, chars_per_turn)
+    payload = {
+        "script": script,
+        "provider": provider,
+        "api_key": "sk-benchmark",
+        "gemini_api_key": "benchmark",
+        "aws_access_key": "benchmark",
+        "aws_secret_key": "benchmark",
+        "aws_region": "us-east-1",
+        "return_url": True,
+    }
+
+    client = TestClient(api.app)
+    latencies = []
+    failures = []
+    output_bytes = 0
+    children_start = children_cpu()
+    process_start = time.process_time()
+    wall_start = time.perf_counter()
+    for _ in range(requests_count):
+        start = time.perf_counter()
+        response = client.post("/generate-audio", json=payload)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code == 200:
+            # 以文件大小計算輸出，不把整份音頻讀進量測程序（避免測試端的副本計入峰值 RSS）
+            output_bytes += api.audio_store.path(response.json()["audio_url"].rsplit("/", 1)[-1]).stat().st_size
+        else:
+            failures.append(response.text[:200])
+    wall = time.perf_counter() - wall_start
+    children_total = children_cpu() - children_start
+
+    return {
+        "wall_seconds": round(wall, 3),
+        "latencies": latencies,
+        "failures": failures,
+        "output_mb": round(output_bytes / 1024 / 1024, 2),
+        "segments_per_request": len(api.plan_script(script, provider)),
+        "script_chars": len(script),
+        "cpu": {
+            "process_seconds": round(time.process_time() - process_start, 3),
+            "decode_seconds": round(decode_meter.thread_seconds + children_total - encode_meter.children_seconds, 3),
+            "encode_seconds": round(encode_meter.thread_seconds + encode_meter.children_seconds, 3),
+            "ffmpeg_seconds": round(children_total, 3),
+        },
+        "processes_per_request": round(processes.count / max(1, requests_count), 1),
+        "peak_rss_mb": max_rss_mb(),
+    }
+
+
+def run_child(
+    server: FakeProviderServer, provider: str, scenario: str, requests_count: int, render_mode: str = "memory"
+) -> dict:
+    """在獨立子程序中執行單一情境，工作目錄為臨時目錄（temp_audio 不寫入專案）"""
+    environment = dict(os.environ)
+    environment.update(server.environment())
+    environment.update({
+        "TTS_CACHE_ENABLED": "0",
+        "TTS_RENDER_MODE": render_mode,
+        "TTS_RETRY_ATTEMPTS": "10",
+        **{f"TTS_RPM_{name.upper()}": "0" for name in PROVIDERS},
+    })
+    with tempfile.TemporaryDirectory() as workdir:
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", provider, scenario, str(requests_count)],
+            cwd=workdir,
+            env=environment,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+    if process.returncode != 0:
+        raise RuntimeError(f"{scenario}/{provider} 執行失敗:\n{process.stderr.decode(errors='ignore')[-2000:]}")
+    # api.py 會輸出日誌，結果位於最後一行
+    return json.loads(process.stdout.decode().strip().splitlines()[-1])
+
+
+def summarize(provider: str, scenario: str, result: dict, provider_requests: int, injected_errors: int) -> dict:
+    latencies = result.pop("latencies")
+    wall = result["wall_seconds"]
+    return {
+        "scenario": scenario,
+        "provider": provider,
+        "requests": len(latencies),
+        **{key: result[key] for key in ("segments_per_request", "script_chars", "output_mb")},
+        "latency_seconds": {
+            "p50": round(percentile(latencies, 0.5), 3),
+            "p90": round(percentile(latencies, 0.9), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "mean": round(sum(latencies) / len(latencies), 3),
+            "max": round(max(latencies), 3),
+        },
+        "scripts_per_second": round(len(latencies) / wall, 3),
+        "provider_requests": provider_requests,
+        "provider_requests_per_second": round(provider_requests / wall, 2),
+        "provider_errors_injected": injected_errors,
+        "failures": result["failures"],
+        "cpu_seconds": result["cpu"],
+        "processes_per_request": result["processes_per_request"],
+        "peak_rss_mb": result["peak_rss_mb"],
+    }
+
+
+def main():
+    if len(sys.argv) == 5 and sys.argv[1] == "--child":
+        print(json.dumps(run_scenario(sys.argv[2], sys.argv[3], int(sys.argv[4]))))
+        return
+
+    parser = argparse.ArgumentParser(description="端到端效能量測（本機假 provider）")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=["small", "medium"])
+    parser.add_argument("--providers", nargs="+", choices=PROVIDERS, default=PROVIDERS)
+    parser.add_argument("--requests", type=int, default=None, help="每個情境的請求次數（預設依情境而定）")
+    parser.add_argument("--latency", type=float, default=0.3, help="假 provider 平均延遲（秒）")
+    parser.add_argument("--jitter", type=float, default=0.1, help="延遲抖動（±秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="假 provider 回傳 429 的比例")
+    parser.add_argument("--seconds-per-char", type=float, default=0.25, help="每字符的音頻秒數")
+    parser.add_argument("--download-latency", type=float, default=0.0, help="台語 TTS 音頻下載延遲（秒）")
+    parser.add_argument("--render-mode", choices=["memory", "stream"], default="memory",
+                        help="組裝方式：memory（記憶體中組裝）或 stream（依序編碼並直接寫入文件）")
+    parser.add_argument("--output", help="將 JSON 結果寫入檔案")
+    args = parser.parse_args()
+
+    server = FakeProviderServer(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        seconds_per_char=args.seconds_per_char,
+        download_latency=args.download_latency,
+    ).start()
+
+    results = []
+    for scenario in args.scenarios:
+        for provider in args.providers:
+            requests_count = args.requests or SCENARIOS[scenario][2]
+            before = server.snapshot()
+            result = run_child(server, provider, scenario, requests_count, args.render_mode)
+            after = server.snapshot()
+            served = after.get(f"{provider}_requests", 0) - before.get(f"{provider}_requests", 0)
+            errors = after.get(f"{provider}_errors", 0) - before.get(f"{provider}_errors", 0)
+            results.append(summarize(provider, scenario, result, served, errors))
+            print(f"{scenario}/{provider}: p50 {results[-1]['latency_seconds']['p50']}s", file=sys.stderr)
+    server.shutdown()
+
+    report = json.dumps({
+        "config": {
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "error_rate": args.error_rate,
+            "seconds_per_char": args.seconds_per_char,
+            "download_latency": args.download_latency,
+            "render_mode": args.render_mode,
+        },
+        "results": results,
+    }, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+本機假 TTS provider（OpenAI speech、Gemini generateContent / streamGenerateContent、AWS Polly、台語 TTS）
+
+回應延遲、抖動、錯誤率與音頻長度皆可設定，供端到端效能量測使用，不需 API Key。
+音頻長度 = max(--min-seconds, 文本字符數 × --seconds-per-char)。
+台語 TTS 的音頻下載另有 --download-latency 延遲。
+Gemini 串流以 SSE 每 --stream-part-seconds 秒音頻送出一段，各段平均分攤延遲（最後一段與非串流同時完成）。
+
+單獨啟動後，將 api.py 指向此服務：
+    python benchmarks/fake_providers.py --port 8765 --latency 0.3
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 \\
+    GOOGLE_GEMINI_BASE_URL=http://127.0.0.1:8765 \\
+    AWS_ENDPOINT_URL_POLLY=http://127.0.0.1:8765 \\
+    TAI_TTS_URL=http://127.0.0.1:8765/tai/ \\
+    python api.py
+"""
+import argparse
+import base64
+import io
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from pydub import AudioSegment
+
+SAMPLE_RATE = 24000
+
+# OpenAI response_format → (ffmpeg 格式, 編碼器, Content-Type)
+OPENAI_FORMATS = {
+    "mp3": ("mp3", None, "audio/mpeg"),
+    "opus": ("opus", "libopus", "audio/ogg"),
+    "aac": ("adts", "aac", "audio/aac"),
+    "wav": ("wav", None, "audio/wav"),
+    "pcm": ("pcm", None, "audio/pcm"),
+}
+
+
+class FakeAudio:
+    """依長度產生並快取各格式的測試音頻（以 0.5 秒為單位取整，避免每次都重新編碼）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = {}
+
+    def pcm(self, seconds: float) -> bytes:
+        frames = int(SAMPLE_RATE * seconds)
+        t = np.arange(frames) / SAMPLE_RATE
+        rng = np.random.default_rng(frames)
+        wave = 0.3 * np.sin(2 * np.pi * 220 * t) + 0.02 * rng.standard_normal(frames)
+        return (wave * 32767).astype(np.int16).tobytes()
+
+    def get(self, audio_format: str, seconds: float) -> bytes:
+        seconds = max(0.5, round(seconds * 2) / 2)
+        key = (audio_format, seconds)
+        with self._lock:
+            data = self._cache.get(key)
+        if data is not None:
+            return data
+        pcm = self.pcm(seconds)
+        if audio_format == "pcm":
+            data = pcm
+        else:
+            segment = AudioSegment(data=pcm, sample_width=2, frame_rate=SAMPLE_RATE, channels=1)
+            output = io.BytesIO()
+            ffmpeg_format, codec, _ = OPENAI_FORMATS.get(audio_format, (audio_format, None, None))
+            segment.export(output, format=ffmpeg_format, codec=codec)
+            data = output.getvalue()
+        with self._lock:
+            self._cache[key] = data
+        return data
+
+
+class FakeProviderServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address=("127.0.0.1", 0),
+        latency: float = 0.3,
+        jitter: float = 0.1,
+        error_rate: float = 0.0,
+        retry_after: float = 0.1,
+        seconds_per_char: float = 0.25,
+        min_seconds: float = 1.0,
+        stream_part_seconds: float = 2.0,
+        download_latency: float = 0.0,
+    ):
+        super().__init__(address, FakeProviderHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.seconds_per_char = seconds_per_char
+        self.min_seconds = min_seconds
+        self.stream_part_seconds = stream_part_seconds
+        self.download_latency = download_latency
+        self.audio = FakeAudio()
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+        self.pending_downloads = {}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environment(self) -> dict:
+        """讓 api.py / app.py 指向此服務的環境變量"""
+        return {
+            "OPENAI_BASE_URL": f"{self.url}/v1",
+            "GOOGLE_GEMINI_BASE_URL": self.url,
+            "AWS_ENDPOINT_URL_POLLY": self.url,
+            "TAI_TTS_URL": f"{self.url}/tai/",
+        }
+
+    def record(self, name: str):
+        with self.stats_lock:
+            self.stats[name] += 1
+
+    def snapshot(self) -> dict:
+        with self.stats_lock:
+            return dict(self.stats)
+
+    def start(self) -> "FakeProviderServer":
+        threading.Thread(target=self.serve_forever, name="fake-providers", daemon=True).start()
+        return self
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        self._send(status, json.dumps(payload).encode("utf-8"), "application/json", headers)
+
+    def _simulate(self, provider: str, latency: float = None) -> bool:
+        """模擬延遲；依錯誤率回傳 429，回傳 False 表示已回應錯誤"""
+        server = self.server
+        latency = server.latency if latency is None else latency
+        time.sleep(max(0.0, latency + random.uniform(-server.jitter, server.jitter)))
+        if random.random() < server.error_rate:
+            server.record(f"{provider}_errors")
+            self._send_json(
+                429,
+                {"error": {"message": "rate limited", "code": 429, "status": "RESOURCE_EXHAUSTED"}},
+                {"Retry-After": str(server.retry_after), "x-amzn-ErrorType": "ThrottlingException"},
+            )
+            return False
+        server.record(f"{provider}_requests")
+        return True
+
+    def _send_gemini_stream(self, text: str):
+        """以 SSE 分段送出 PCM，第 1 段在 latency / 段數 後送出"""
+        server = self.server
+        audio = server.audio.get("pcm", self._seconds(text))
+        part_bytes = max(2, int(SAMPLE_RATE * server.stream_part_seconds) * 2)
+        parts = [audio[start:start + part_bytes] for start in range(0, len(audio), part_bytes)]
+        delay = server.latency / len(parts)
+        if not self._simulate("gemini", delay):
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for index, part in enumerate(parts):
+            if index:
+                time.sleep(delay)
+            event = json.dumps({"candidates": [{"content": {"role": "model", "parts": [{
+                "inlineData": {"mimeType": "audio/L16;codec=pcm;rate=24000", "data": base64.b64encode(part).decode()},
+            }]}}]})
+            chunk = f"data: {event}\r\n\r\n".encode("utf-8")
+            self.wfile.write(f"{len(chunk):X}\r\n".encode() + chunk + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _seconds(self, text: str) -> float:
+        return max(self.server.min_seconds, len(text) * self.server.seconds_per_char)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        payload = json.loads(body or b"{}")
+        path = self.path.split("?")[0]
+
+        if path == "/v1/audio/speech":
+            if self._simulate("openai"):
+                audio_format = payload.get("response_format", "mp3")
+                audio = self.server.audio.get(audio_format, self._seconds(payload.get("input", "")))
+                self._send(200, audio, OPENAI_FORMATS[audio_format][2])
+        elif path.startswith("/v1beta/models/") and path.endswith(":streamGenerateContent"):
+            self._send_gemini_stream("".join(
+                part.get("text", "")
+                for content in payload.get("contents", [])
+                for part in content.get("parts", [])
+            ))
+        elif path.startswith("/v1beta/models/") and path.endswith(":generateContent"):
+            if self._simulate("gemini"):
+                text = "".join(
+                    part.get("text", "")
+                    for content in payload.get("contents", [])
+                    for part in content.get("parts", [])
+                )
+                audio = self.server.audio.get("pcm", self._seconds(text))
+                self._send_json(200, {"candidates": [{"content": {"role": "model", "parts": [{
+                    "inlineData": {"mimeType": "audio/L16;codec=pcm;rate=24000", "data": base64.b64encode(audio).decode()},
+                }]}}]})
+        elif path == "/v1/speech":
+            if self._simulate("polly"):
+                text = payload.get("Text", "")
+                audio = self.server.audio.get("mp3", self._seconds(text))
+                self._send(200, audio, "audio/mpeg", {"x-amzn-RequestCharacters": str(len(text))})
+        elif path.rstrip("/") == "/tai":
+            if self._simulate("taiwanese"):
+                download_id = uuid.uuid4().hex
+                self.server.pending_downloads[download_id] = self.server.audio.get("wav", self._seconds(payload.get("text", "")))
+                self._send_json(200, {"audio_url": f"{self.server.url}/tai/audio/{download_id}.wav"})
+        else:
+            self._send_json(404, {"error": {"message": f"unknown path {path}"}})
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path.startswith("/tai/audio/"):
+            audio = self.server.pending_downloads.pop(path.rsplit("/", 1)[-1].split(".")[0], None)
+            if audio is not None:
+                time.sleep(self.server.download_latency)
+                self.server.record("taiwanese_downloads")
+                self._send(200, audio, "audio/wav")
+                return
+        self._send_json(404, {"error": {"message": f"unknown path {path}"}})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本機假 TTS provider")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.3, help="平均回應延遲（秒）")
+    parser.add_argument("--jitter", type=float, default=0.1, help="延遲抖動（±秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="回傳 429 的比例")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="429 回應的 Retry-After 秒數")
+    parser.add_argument("--seconds-per-char", type=float, default=0.25, help="每字符的音頻秒數")
+    parser.add_argument("--min-seconds", type=float, default=1.0, help="每段最短音頻秒數")
+    parser.add_argument("--download-latency", type=float, default=0.0, help="台語 TTS 音頻下載延遲（秒）")
+    parser.add_argument("--stream-part-seconds", type=float, default=2.0, help="Gemini 串流每段音頻秒數")
+    args = parser.parse_args()
+
+    server = FakeProviderServer(
+        (args.host, args.port),
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        retry_after=args.retry_after,
+        seconds_per_char=args.seconds_per_char,
+        min_seconds=args.min_seconds,
+        stream_part_seconds=args.stream_part_seconds,
+        download_latency=args.download_latency,
+    )
+    print(f"假 provider 服務已啟動: {server.url}")
+    for name, value in server.environment().items():
+        print(f"  {name}={value}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
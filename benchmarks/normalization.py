@@ -0,0 +1,139 @@
+"""
+音量處理效能與品質比較：pydub 固定增益（原本的 volume_boost）vs loudness.normalize_audio（gain / lufs）
+
+以合成的對話音頻（兩位說話者音量不同、部分片段含突波；不需 API Key、不需 ffmpeg）量測
+處理耗時、峰值記憶體，以及輸出的削波樣本數、整合響度、各片段響度差距與 true peak。
+
+用法:
+    python benchmarks/normalization.py
+    python benchmarks/normalization.py --minutes 60 --volume-boost 6 --json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from pydub import AudioSegment
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loudness import measure_loudness, normalize_audio  # noqa: E402
+
+SPEAKER_LEVELS_DB = (-20.0, -30.0)
+
+
+def make_dialogue(minutes: float, segment_seconds: float = 8.0, frame_rate: int = 24000) -> tuple:
+    """產生 (AudioSegment, 各片段起始 frame)：說話者 2 比說話者 1 小聲 10 dB，每 7 段有一段含突波"""
+    rng = np.random.default_rng(0)
+    total = int(minutes * 60 * frame_rate)
+    pieces = []
+    starts = []
+    position = 0
+    index = 0
+    while position < total:
+        frames = min(total - position, int(frame_rate * segment_seconds * rng.uniform(0.5, 1.5)))
+        t = np.arange(frames, dtype=np.float32) / frame_rate
+        pitch = rng.uniform(100, 250)
+        syllables = (np.sin(2 * np.pi * rng.uniform(2, 5) * t) > -0.3).astype(np.float32)
+        wave = (
+            0.6 * np.sin(2 * np.pi * pitch * t)
+            + 0.3 * np.sin(2 * np.pi * 2 * pitch * t + 1)
+            + 0.1 * rng.standard_normal(frames).astype(np.float32)
+        ) * syllables
+        rms = float(np.sqrt(np.mean(wave ** 2))) or 1.0
+        wave *= 10 ** (SPEAKER_LEVELS_DB[index % 2] / 20) / rms
+        if index % 7 == 3:
+            burst = slice(frames // 2, frames // 2 + frame_rate // 20)
+            wave[burst] *= 8
+        pieces.append((np.clip(wave, -1, 1 - 1 / 32768) * 32768).astype(np.int16))
+        starts.append(position)
+        position += frames
+        index += 1
+    audio = AudioSegment(data=np.concatenate(pieces).tobytes(), sample_width=2, frame_rate=frame_rate, channels=1)
+    return audio, starts
+
+
+def pydub_gain(audio: AudioSegment, volume_boost: float, starts: list) -> AudioSegment:
+    """原本的做法：在組裝後的 AudioSegment 上直接加 dB"""
+    return audio + volume_boost
+
+
+def numpy_gain(audio: AudioSegment, volume_boost: float, starts: list) -> AudioSegment:
+    return normalize_audio(audio, "gain", volume_boost)[0]
+
+
+def numpy_lufs(audio: AudioSegment, volume_boost: float, starts: list) -> AudioSegment:
+    return normalize_audio(audio, "lufs", segment_starts=starts)[0]
+
+
+def measure(function, audio: AudioSegment, volume_boost: float, starts: list) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(audio, volume_boost, starts)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples = np.frombuffer(result.raw_data, dtype=np.int16)
+    quality = measure_loudness(result, starts)
+    segments = [value for value in quality["segment_lufs"] if value is not None]
+    return {
+        "seconds": round(elapsed, 3),
+        "peak_mb": round(peak / 1024 / 1024, 1),
+        "clipped_samples": int(np.count_nonzero((samples == 32767) | (samples == -32768))),
+        "integrated_lufs": round(quality["integrated_lufs"], 2),
+        "segment_lufs_range": round(max(segments) - min(segments), 2),
+        "true_peak_dbtp": round(quality["true_peak_dbtp"], 2),
+    }
+
+
+def run(minutes: float, volume_boost: float) -> dict:
+    audio, starts = make_dialogue(minutes)
+    source = measure_loudness(audio, starts)
+    source_segments = [value for value in source["segment_lufs"] if value is not None]
+    return {
+        "audio_minutes": round(len(audio) / 60000, 1),
+        "segments": len(starts),
+        "volume_boost": volume_boost,
+        "input": {
+            "integrated_lufs": round(source["integrated_lufs"], 2),
+            "segment_lufs_range": round(max(source_segments) - min(source_segments), 2),
+            "true_peak_dbtp": round(source["true_peak_dbtp"], 2),
+        },
+        "pydub_gain": measure(pydub_gain, audio, volume_boost, starts),
+        "numpy_gain": measure(numpy_gain, audio, volume_boost, starts),
+        "numpy_lufs": measure(numpy_lufs, audio, volume_boost, starts),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="音量處理效能與品質比較")
+    parser.add_argument("--minutes", type=float, default=60.0, help="音頻長度（分鐘）")
+    parser.add_argument("--volume-boost", type=float, default=6.0, help="固定增益 (dB)")
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出")
+    args = parser.parse_args()
+
+    result = run(args.minutes, args.volume_boost)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+
+    source = result["input"]
+    print(
+        f"{result['audio_minutes']} 分鐘、{result['segments']} 段；輸入 {source['integrated_lufs']} LUFS，"
+        f"片段差距 {source['segment_lufs_range']} LU，true peak {source['true_peak_dbtp']} dBTP"
+    )
+    print(f"{'方法':<12} {'耗時(秒)':>8} {'峰值MB':>8} {'削波樣本':>10} {'LUFS':>8} {'片段差距LU':>10} {'dBTP':>7}")
+    for name in ("pydub_gain", "numpy_gain", "numpy_lufs"):
+        row = result[name]
+        print(
+            f"{name:<12} {row['seconds']:>8} {row['peak_mb']:>8} {row['clipped_samples']:>10} "
+            f"{row['integrated_lufs']:>8} {row['segment_lufs_range']:>10} {row['true_peak_dbtp']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+背景生成工作佇列
+
+長腳本的生成在獨立的執行緒池中執行，不佔用 uvicorn 事件迴圈；
+提供工作狀態、逐片段進度與預估剩餘時間查詢。
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv("TTS_JOB_WORKERS", "2"))
+JOB_QUEUE_DEPTH = int(os.getenv("TTS_JOB_QUEUE_DEPTH", "16"))
+JOB_RETENTION_SECONDS = float(os.getenv("TTS_JOB_RETENTION_SECONDS", str(24 * 60 * 60)))
+JOB_MAX_FINISHED = int(os.getenv("TTS_JOB_MAX_FINISHED", "1000"))
+
+
+class JobQueueFull(RuntimeError):
+    """排隊中的工作已達上限"""
+
+
+@dataclass
+class Job:
+    """單一生成工作的狀態（queued → running → succeeded / failed）"""
+
+    id: str
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    total_segments: Optional[int] = 0
+    completed_segments: int = 0
+    result: Any = None
+    error: Optional[str] = None
+    logs: list = field(default_factory=list)
+
+    def report_progress(self, completed: int, total: Optional[int]):
+        """由生成流程回報已完成片段數；腳本仍在規劃時片段總數未知，total 為 None"""
+        self.completed_segments = completed
+        self.total_segments = total
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        """依已完成片段的平均耗時估算剩餘時間；片段總數未知時為 None"""
+        if self.status != "running" or not self.started_at or not self.completed_segments:
+            return None
+        if self.total_segments is None:
+            return None
+        elapsed = time.time() - self.started_at
+        remaining = self.total_segments - self.completed_segments
+        return round(elapsed / self.completed_segments * remaining, 1)
+
+    def to_dict(self) -> dict:
+        if self.total_segments is None:
+            percent = None
+        else:
+            percent = round(self.completed_segments / self.total_segments * 100, 1) if self.total_segments else 0.0
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": {
+                "completed_segments": self.completed_segments,
+                "total_segments": self.total_segments,
+                "percent": percent,
+            },
+            "eta_seconds": self.eta_seconds,
+            "error": self.error,
+            "logs": self.logs,
+        }
+
+
+class JobManager:
+    """以固定數量 worker 執行工作，排隊深度有上限，完成的工作保留一段時間供查詢"""
+
+    def __init__(
+        self,
+        workers: int = JOB_WORKERS,
+        queue_depth: int = JOB_QUEUE_DEPTH,
+        retention_seconds: float = JOB_RETENTION_SECONDS,
+        max_finished: int = JOB_MAX_FINISHED,
+    ):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.retention_seconds = retention_seconds
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts-job")
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+
+    def _count(self, status: str) -> int:
+        return sum(1 for job in self._jobs.values() if job.status == status)
+
+    def _prune(self):
+        """移除過期或超出數量上限的已完成工作"""
+        expire_before = time.time() - self.retention_seconds
+        finished = [job for job in self._jobs.values() if job.finished_at is not None]
+        overflow = len(finished) - self.max_finished
+        for job in finished:
+            if job.finished_at < expire_before or overflow > 0:
+                del self._jobs[job.id]
+                overflow -= 1
+
+    def submit(self, function) -> Job:
+        """
+        提交工作，function(job) 的回傳值存入 job.result
+
+        排隊中的工作已達 queue_depth 時拋出 JobQueueFull。
+        """
+        with self._lock:
+            self._prune()
+            if self._count("queued") >= self.queue_depth:
+                raise JobQueueFull(f"排隊中的工作已達上限 ({self.queue_depth})")
+            job = Job(id=uuid.uuid4().hex)
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, function)
+        return job
+
+    def _run(self, job: Job, function):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = function(job)
+            job.status = "succeeded"
+        except Exception as e:
+            job.error = str(getattr(e, "detail", None) or e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def info(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_depth": self.queue_depth,
+                "queued": self._count("queued"),
+                "running": self._count("running"),
+            }
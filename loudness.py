@@ -0,0 +1,406 @@
+"""
+響度正規化（NumPy 向量化）
+
+取代直接在組裝後的 AudioSegment 上加固定 dB（響亮的片段會削波，偏小聲的 provider 輸出仍然偏小聲）：
+- lufs：依 ITU-R BS.1770 量測整體與各片段的整合響度，各片段以各自的增益拉到目標響度，
+  再以 4 倍超取樣估計 true peak，前瞻限幅到上限以下
+- gain：原本的固定增益（volume_boost dB），超出範圍的樣本直接削波
+- none：不處理
+
+先掃描一次 PCM 量測響度與峰值，再一次套用增益與限幅寫入輸出緩衝區；
+以 30 秒為單位分塊處理，浮點暫存的記憶體與音頻總長度無關。api.py 與 app.py 共用。
+"""
+import math
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from numpy.lib.stride_tricks import sliding_window_view
+from pydub import AudioSegment
+
+load_dotenv()
+
+NORMALIZE_MODES = ("lufs", "gain", "none")
+
+TARGET_LUFS = float(os.getenv("TTS_TARGET_LUFS", "-16"))
+TRUE_PEAK_DBTP = float(os.getenv("TTS_TRUE_PEAK_DBTP", "-1"))
+# 單一片段增益上限（dB），避免把幾乎靜音的片段放大成噪音
+MAX_GAIN_DB = 20.0
+
+# BS.1770：100ms 子區塊，每 4 個組成一個 400ms 量測區塊（重疊 75%）
+MEASURE_BLOCK_SECONDS = 0.1
+GATING_SUB_BLOCKS = 4
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+
+# 限幅：以 10ms 區塊計算增益，前後各 50ms 平滑，區塊內線性變化
+LIMITER_BLOCK_SECONDS = 0.01
+LIMITER_SMOOTHING_BLOCKS = 5
+
+# true peak：4 倍超取樣（每側 12 個 tap 的 Hann 窗 sinc 內插）；
+# 套用增益後取樣峰值仍低於上限 3 dB 以上的區塊，樣本間峰值不會超過上限，不必超取樣
+OVERSAMPLING = 4
+INTERPOLATION_TAPS = 12
+INTERSAMPLE_HEADROOM_DB = 3.0
+
+CHUNK_SECONDS = 30
+
+
+@dataclass
+class LoudnessReport:
+    """單次處理的量測結果與套用的增益"""
+
+    mode: str
+    input_lufs: Optional[float] = None
+    target_lufs: Optional[float] = None
+    segment_lufs: list = field(default_factory=list)
+    min_gain_db: float = 0.0
+    max_gain_db: float = 0.0
+    input_peak_db: Optional[float] = None
+    limited_blocks: int = 0
+    max_reduction_db: float = 0.0
+    clipped_samples: int = 0
+
+    def summary(self) -> str:
+        if self.mode == "none":
+            return "未調整"
+        if self.mode == "gain":
+            return f"固定增益 {self.max_gain_db:+.1f} dB，削波 {self.clipped_samples} 個樣本"
+        if self.input_lufs is None:
+            return "靜音，未調整"
+        return (
+            f"整合響度 {self.input_lufs:.1f} → {self.target_lufs:.1f} LUFS，"
+            f"片段增益 {self.min_gain_db:+.1f} ~ {self.max_gain_db:+.1f} dB，"
+            f"限幅 {self.limited_blocks} 個區塊（最多 {-self.max_reduction_db:.1f} dB）"
+        )
+
+
+def combine_reports(reports: list) -> LoudnessReport:
+    """合併逐片段處理的結果（串流組裝）；整合響度為各片段整合響度的能量平均（近似值）"""
+    combined = LoudnessReport(mode=reports[0].mode if reports else "none")
+    applied = [report for report in reports if report.mode == "gain" or report.input_lufs is not None]
+    if not applied:
+        return combined
+    combined.min_gain_db = min(report.min_gain_db for report in applied)
+    combined.max_gain_db = max(report.max_gain_db for report in applied)
+    combined.limited_blocks = sum(report.limited_blocks for report in applied)
+    combined.max_reduction_db = max(report.max_reduction_db for report in applied)
+    combined.clipped_samples = sum(report.clipped_samples for report in applied)
+    measured = [report for report in applied if report.input_lufs is not None]
+    if measured:
+        energy = np.mean([10 ** ((report.input_lufs + 0.691) / 10) for report in measured])
+        combined.input_lufs = round(float(to_lufs(energy)), 2)
+        combined.target_lufs = measured[0].target_lufs
+        combined.segment_lufs = [value for report in measured for value in report.segment_lufs]
+        combined.input_peak_db = max(report.input_peak_db for report in measured)
+    return combined
+
+
+def needs_processing(mode: str, volume_boost: float = 0) -> bool:
+    """是否需要解碼音頻做音量處理（不需要時單一 MP3 片段可直接輸出）"""
+    return mode == "lufs" or (mode == "gain" and bool(volume_boost))
+
+
+def to_lufs(energy):
+    with np.errstate(divide="ignore"):
+        return -0.691 + 10 * np.log10(energy)
+
+
+# ---- K 加權（BS.1770 預濾波器），在頻域套用 ----
+
+def k_weighting_filters(frame_rate: int) -> list:
+    """依取樣率計算 K 加權的兩個 biquad (b, a)；48kHz 時與 BS.1770 表列係數相同"""
+    # 高架濾波器（模擬頭部聲學效應）
+    f0, gain_db, q = 1681.974450955533, 3.999843853973347, 0.7071752369554196
+    k = math.tan(math.pi * f0 / frame_rate)
+    vh = 10 ** (gain_db / 20)
+    vb = vh ** 0.4996667741545416
+    a0 = 1 + k / q + k * k
+    shelf = (
+        [(vh + vb * k / q + k * k) / a0, 2 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0],
+        [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0],
+    )
+    # 高通濾波器（RLB 加權）
+    f0, q = 38.13547087602444, 0.5003270373238773
+    k = math.tan(math.pi * f0 / frame_rate)
+    a0 = 1 + k / q + k * k
+    high_pass = (
+        [1.0, -2.0, 1.0],
+        [1.0, 2 * (k * k - 1) / a0, (1 - k / q + k * k) / a0],
+    )
+    return [shelf, high_pass]
+
+
+def k_weighting_power(frame_rate: int, size: int) -> np.ndarray:
+    """
+    長度 size 的 rfft 各頻率的權重：sum(|X|² × 權重) 即 K 加權後的均方值
+
+    以濾波器的頻率響應取代時域濾波（忽略 100ms 區塊邊界的暫態），可一次對所有區塊做 FFT。
+    """
+    frequencies = np.fft.rfftfreq(size, 1 / frame_rate)
+    z = np.exp(-2j * np.pi * frequencies / frame_rate)
+    power = np.ones(len(frequencies))
+    for b, a in k_weighting_filters(frame_rate):
+        power *= np.abs((b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)) ** 2
+    # Parseval：直流與 Nyquist 以外的頻率各代表正負兩個頻率
+    factor = np.full(len(frequencies), 2.0)
+    factor[0] = 1.0
+    if size % 2 == 0:
+        factor[-1] = 1.0
+    return power * factor / (size * size)
+
+
+def integrated_loudness(energies: np.ndarray) -> Optional[float]:
+    """由 100ms 子區塊的 K 加權均方值計算門限後的整合響度（LUFS），靜音時回傳 None"""
+    if len(energies) == 0:
+        return None
+    if len(energies) < GATING_SUB_BLOCKS:
+        # 不足一個量測區塊時以整段為一個區塊
+        blocks = np.array([energies.mean()])
+    else:
+        blocks = np.convolve(energies, np.full(GATING_SUB_BLOCKS, 1 / GATING_SUB_BLOCKS), mode="valid")
+    blocks = blocks[to_lufs(blocks) > ABSOLUTE_GATE_LUFS]
+    if len(blocks) == 0:
+        return None
+    threshold = to_lufs(blocks.mean()) + RELATIVE_GATE_LU
+    blocks = blocks[to_lufs(blocks) > threshold]
+    return float(to_lufs(blocks.mean()))
+
+
+# ---- PCM 存取 ----
+
+def pcm_view(segment: AudioSegment) -> tuple:
+    """回傳 (樣本陣列 [frames, channels]，滿刻度值)，不複製資料"""
+    dtype = {2: np.int16, 4: np.int32}[segment.sample_width]
+    samples = np.frombuffer(segment.raw_data, dtype=dtype).reshape(-1, segment.channels)
+    return samples, float(2 ** (8 * segment.sample_width - 1))
+
+
+def scan(samples: np.ndarray, full_scale: float, frame_rate: int) -> tuple:
+    """
+    掃描一次 PCM，回傳 (100ms 子區塊的 K 加權均方值, 10ms 區塊的取樣峰值)
+
+    峰值為所有聲道中的最大絕對值，以滿刻度為 1.0。
+    """
+    measure_size = max(1, int(frame_rate * MEASURE_BLOCK_SECONDS))
+    limiter_size = max(1, int(frame_rate * LIMITER_BLOCK_SECONDS))
+    weights = k_weighting_power(frame_rate, measure_size)
+    frames = len(samples)
+    energies = np.zeros(frames // measure_size)
+    peaks = np.zeros(-(-frames // limiter_size))
+
+    chunk_frames = measure_size * int(CHUNK_SECONDS / MEASURE_BLOCK_SECONDS)
+    for start in range(0, frames, chunk_frames):
+        chunk = samples[start:start + chunk_frames].astype(np.float32) / full_scale
+
+        # 完整的 100ms 子區塊：一次對所有區塊做 FFT，依頻率加權求均方值（各聲道加總）
+        complete = len(chunk) // measure_size
+        if complete:
+            blocks = chunk[:complete * measure_size].reshape(complete, measure_size, -1)
+            spectrum = np.fft.rfft(blocks, axis=1)
+            power = spectrum.real ** 2 + spectrum.imag ** 2
+            first = start // measure_size
+            energies[first:first + complete] = np.einsum("bkc,k->b", power, weights)
+
+        # 10ms 區塊峰值；區塊可能跨越兩個 chunk，以 maximum 合併
+        magnitudes = np.abs(chunk).max(axis=1)
+        first_block = start // limiter_size
+        last_block = (start + len(chunk) - 1) // limiter_size
+        edges = np.arange(first_block, last_block + 1) * limiter_size - start
+        edges[0] = 0
+        block_peaks = np.maximum.reduceat(magnitudes, edges)
+        peaks[first_block:last_block + 1] = np.maximum(peaks[first_block:last_block + 1], block_peaks)
+
+    return energies, peaks
+
+
+# ---- true peak ----
+
+def interpolation_kernel() -> np.ndarray:
+    """超取樣各中間相位的內插係數，形狀 (2 × taps, OVERSAMPLING - 1)"""
+    offsets = np.arange(-INTERPOLATION_TAPS + 1, INTERPOLATION_TAPS + 1)
+    phases = np.arange(1, OVERSAMPLING) / OVERSAMPLING
+    distance = phases[None, :] - offsets[:, None]
+    window = 0.5 * (1 + np.cos(np.pi * distance / INTERPOLATION_TAPS))
+    return (np.sinc(distance) * window).astype(np.float32)
+
+
+def true_peaks(samples: np.ndarray, full_scale: float, blocks: np.ndarray, block_size: int) -> np.ndarray:
+    """以 4 倍超取樣估計指定 10ms 區塊的 true peak（含原始樣本）"""
+    kernel = interpolation_kernel()
+    offsets = np.arange(-INTERPOLATION_TAPS + 1, block_size + INTERPOLATION_TAPS)
+    result = np.zeros(len(blocks))
+    batch = max(1, int(CHUNK_SECONDS / LIMITER_BLOCK_SECONDS) // 10)
+    for start in range(0, len(blocks), batch):
+        selected = blocks[start:start + batch]
+        indices = np.clip(selected[:, None] * block_size + offsets[None, :], 0, len(samples) - 1)
+        gathered = samples[indices].astype(np.float32) / full_scale  # [區塊, 樣本, 聲道]
+        windows = sliding_window_view(gathered, 2 * INTERPOLATION_TAPS, axis=1)[:, :block_size]
+        interpolated = windows @ kernel  # [區塊, 樣本, 聲道, 相位]
+        result[start:start + len(selected)] = np.maximum(
+            np.abs(interpolated).max(axis=(1, 2, 3)),
+            np.abs(gathered[:, INTERPOLATION_TAPS - 1:INTERPOLATION_TAPS - 1 + block_size]).max(axis=(1, 2)),
+        )
+    return result
+
+
+def moving_min(values: np.ndarray, radius: int) -> np.ndarray:
+    padded = np.pad(values, radius, constant_values=np.inf)
+    return sliding_window_view(padded, 2 * radius + 1).min(axis=1)
+
+
+def moving_mean(values: np.ndarray, radius: int) -> np.ndarray:
+    padded = np.pad(values, radius, mode="edge")
+    return np.convolve(padded, np.full(2 * radius + 1, 1 / (2 * radius + 1)), mode="valid")
+
+
+def limiter_gains(desired: np.ndarray, peaks: np.ndarray, ceiling: float) -> np.ndarray:
+    """
+    各 10ms 區塊的最終增益：不超過期望增益，且區塊峰值乘上增益不超過上限
+
+    上限先取前後 LIMITER_SMOOTHING_BLOCKS 個區塊的移動最小值（提前壓低、延後恢復），
+    再以相同半徑做移動平均；平均的每一項都不大於該區塊的上限，平滑後仍滿足條件。
+    """
+    with np.errstate(divide="ignore"):
+        limits = np.where(peaks > 0, ceiling / peaks, np.inf)
+    smoothing = LIMITER_SMOOTHING_BLOCKS
+    envelope = moving_min(limits, smoothing)
+    finite = np.isfinite(envelope)
+    if finite.any():
+        envelope = np.where(finite, envelope, envelope[finite].max())
+        envelope = moving_mean(envelope, smoothing)
+    return np.minimum(desired, envelope)
+
+
+def apply_gains(samples: np.ndarray, full_scale: float, block_gains: np.ndarray, block_size: int) -> tuple:
+    """
+    逐樣本套用區塊增益，回傳 (輸出 bytearray, 削波樣本數)
+
+    區塊邊界的增益取兩側區塊增益的較小者，區塊內在兩端邊界間線性變化，
+    因此每個樣本的增益都不超過所在區塊的增益，增益變化也不會產生階躍。
+    直接寫入預先配置的輸出緩衝區，每個樣本只讀寫一次。
+    """
+    output = bytearray(samples.nbytes)
+    result = np.frombuffer(output, dtype=samples.dtype).reshape(samples.shape)
+    # 32-bit 樣本的滿刻度超出 float32 精度
+    work_dtype = np.float32 if samples.dtype.itemsize <= 2 else np.float64
+    constant = np.all(block_gains == block_gains[0])
+    edges = np.minimum(np.r_[block_gains[0], block_gains], np.r_[block_gains, block_gains[-1]]).astype(work_dtype)
+    ramp = np.arange(block_size, dtype=work_dtype) / block_size
+    low, high = -full_scale, full_scale - 1
+    clipped = 0
+    chunk_frames = block_size * int(CHUNK_SECONDS / LIMITER_BLOCK_SECONDS)
+    for start in range(0, len(samples), chunk_frames):
+        chunk = samples[start:start + chunk_frames]
+        if constant:
+            gains = work_dtype(block_gains[0])
+        else:
+            first = start // block_size
+            count = -(-len(chunk) // block_size)
+            left = edges[first:first + count]
+            right = edges[first + 1:first + count + 1]
+            gains = (left[:, None] + (right - left)[:, None] * ramp).reshape(-1)[:len(chunk), None]
+        scaled = chunk * gains
+        clipped += int(np.count_nonzero((scaled > high) | (scaled < low)))
+        np.clip(scaled, low, high, out=scaled)
+        result[start:start + len(chunk)] = np.rint(scaled)
+    return output, clipped
+
+
+def normalize_audio(
+    segment: AudioSegment,
+    mode: str = "lufs",
+    volume_boost: float = 0,
+    segment_starts: list = None,
+    target_lufs: float = TARGET_LUFS,
+    true_peak_dbtp: float = TRUE_PEAK_DBTP,
+) -> tuple:
+    """
+    依 mode 處理音量，回傳 (AudioSegment, LoudnessReport)
+
+    segment_starts 為各片段的起始 frame（例如 manifest 的 offset_frames），lufs 模式下各片段分別正規化；
+    未指定時整段視為一個片段。
+    """
+    if mode not in NORMALIZE_MODES:
+        raise ValueError(f"不支援的音量處理模式: {mode}")
+    report = LoudnessReport(mode=mode)
+    if not needs_processing(mode, volume_boost) or not segment.raw_data:
+        return segment, report
+    if segment.sample_width not in (2, 4):
+        segment = segment.set_sample_width(2)
+    samples, full_scale = pcm_view(segment)
+    block_size = max(1, int(segment.frame_rate * LIMITER_BLOCK_SECONDS))
+    block_count = -(-len(samples) // block_size)
+
+    if mode == "gain":
+        report.min_gain_db = report.max_gain_db = volume_boost
+        data, report.clipped_samples = apply_gains(
+            samples, full_scale, np.full(block_count, 10 ** (volume_boost / 20)), block_size
+        )
+        return segment._spawn(data), report
+
+    energies, peaks = scan(samples, full_scale, segment.frame_rate)
+    overall = integrated_loudness(energies)
+    if overall is None:
+        return segment, report
+    report.input_lufs = round(overall, 2)
+    report.target_lufs = target_lufs
+    report.input_peak_db = round(20 * math.log10(max(peaks.max(), 1e-10)), 2)
+
+    # 各片段的增益：可量測的片段拉到目標響度，太短或靜音的片段使用整體增益
+    starts = sorted(set([0, *(segment_starts or [])]))
+    measure_size = max(1, int(segment.frame_rate * MEASURE_BLOCK_SECONDS))
+    boundaries = [*starts[1:], len(samples)]
+    gains_db = []
+    for start, end in zip(starts, boundaries):
+        loudness = integrated_loudness(energies[-(-start // measure_size):end // measure_size])
+        report.segment_lufs.append(None if loudness is None else round(loudness, 2))
+        gain = target_lufs - (overall if loudness is None else loudness)
+        gains_db.append(min(MAX_GAIN_DB, max(-MAX_GAIN_DB, gain)))
+    report.min_gain_db = round(min(gains_db), 2)
+    report.max_gain_db = round(max(gains_db), 2)
+
+    block_starts = np.arange(block_count) * block_size
+    segment_index = np.searchsorted(np.array(starts), block_starts, side="right") - 1
+    desired = 10 ** (np.array(gains_db)[segment_index] / 20)
+
+    # 套用增益後可能接近上限的區塊才以超取樣估計 true peak
+    ceiling = 10 ** (true_peak_dbtp / 20)
+    candidates = np.flatnonzero(peaks * desired > ceiling * 10 ** (-INTERSAMPLE_HEADROOM_DB / 20))
+    if len(candidates):
+        peaks = peaks.copy()
+        peaks[candidates] = true_peaks(samples, full_scale, candidates, block_size)
+
+    block_gains = limiter_gains(desired, peaks, ceiling)
+    reduction = block_gains / desired
+    limited = reduction < 0.999
+    report.limited_blocks = int(np.count_nonzero(limited))
+    if report.limited_blocks:
+        report.max_reduction_db = round(float(-20 * np.log10(reduction.min())), 2)
+
+    data, report.clipped_samples = apply_gains(samples, full_scale, block_gains, block_size)
+    return segment._spawn(data), report
+
+
+def measure_loudness(segment: AudioSegment, segment_starts: list = None) -> dict:
+    """量測整合響度、各片段響度與整段的 true peak（不修改音頻，供效能量測與除錯使用）"""
+    if segment.sample_width not in (2, 4):
+        segment = segment.set_sample_width(2)
+    samples, full_scale = pcm_view(segment)
+    energies, _ = scan(samples, full_scale, segment.frame_rate)
+    measure_size = max(1, int(segment.frame_rate * MEASURE_BLOCK_SECONDS))
+    starts = sorted(set([0, *(segment_starts or [])]))
+    segments = [
+        integrated_loudness(energies[-(-start // measure_size):end // measure_size])
+        for start, end in zip(starts, [*starts[1:], len(samples)])
+    ]
+    block_size = max(1, int(segment.frame_rate * LIMITER_BLOCK_SECONDS))
+    blocks = np.arange(-(-len(samples) // block_size))
+    peak = true_peaks(samples, full_scale, blocks, block_size).max() if len(blocks) else 0.0
+    return {
+        "integrated_lufs": integrated_loudness(energies),
+        "segment_lufs": segments,
+        "true_peak_dbtp": 20 * math.log10(max(peak, 1e-10)),
+    }
@@ -0,0 +1,187 @@
+"""
+Prometheus 指標
+
+provider 請求延遲與結果、送出字元數、合成中的片段數、各處理階段耗時、輸出音頻長度與大小，
+以 provider 與 model 為標籤。api.py 由 GET /metrics 提供；app.py 設定 TTS_METRICS_PORT 時另開 HTTP 端點。
+記錄只是行程內的計數器更新（每次約數微秒），不影響請求路徑。
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from dotenv import load_dotenv
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest, start_http_server
+
+from render_trace import RenderTrace
+
+load_dotenv()
+
+# Gradio 介面的指標端點，0 表示不啟用
+METRICS_PORT = int(os.getenv("TTS_METRICS_PORT", "0"))
+
+REQUEST_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+RENDER_BUCKETS = (1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+PROVIDER_REQUEST_SECONDS = Histogram(
+    "tts_provider_request_seconds",
+    "單次 provider 請求耗時（不含速率限制與重試等待）",
+    ["provider", "model"],
+    buckets=REQUEST_BUCKETS,
+)
+PROVIDER_PHASE_SECONDS = Histogram(
+    "tts_provider_phase_seconds",
+    "兩階段 provider 各階段耗時：generate（請求生成）、download（下載音頻，不含等待下載名額）",
+    ["provider", "model", "phase"],
+    buckets=REQUEST_BUCKETS,
+)
+PROVIDER_REQUESTS = Counter(
+    "tts_provider_requests",
+    "provider 請求數；outcome 為 ok、throttled（429 與 AWS 節流）、server_error（5xx）或 error",
+    ["provider", "model", "outcome"],
+)
+PROVIDER_CHARACTERS = Counter(
+    "tts_provider_characters",
+    "送出給 provider 的字元數（含重試）",
+    ["provider", "model"],
+)
+SEGMENTS_IN_FLIGHT = Gauge(
+    "tts_segments_in_flight",
+    "快取未命中、正在向 provider 合成的片段數（含等待速率限制）",
+    ["provider", "model"],
+)
+JOBS = Gauge(
+    "tts_jobs",
+    "背景工作數；status 為 queued（排隊深度）或 running",
+    ["status"],
+)
+DIALOGUE_FALLBACKS = Counter(
+    "tts_dialogue_fallbacks",
+    "多說話者對話請求失敗、改為逐輪合成的次數",
+    ["provider", "model"],
+)
+STAGE_SECONDS = Histogram(
+    "tts_stage_seconds",
+    "處理階段耗時：parse、synthesize 與 decode（每片段）、assemble、normalize、encode（串流為每片段）、save",
+    ["stage", "provider", "model"],
+    buckets=STAGE_BUCKETS,
+)
+RENDER_SECONDS = Histogram(
+    "tts_render_seconds",
+    "一次生成的總耗時；entrypoint 為 api、stream、batch 或 gradio，status 為 ok、empty 或 error",
+    ["provider", "model", "entrypoint", "status"],
+    buckets=RENDER_BUCKETS,
+)
+FIRST_AUDIO_SECONDS = Histogram(
+    "tts_stream_first_audio_seconds",
+    "串流生成從收到請求到第一段音頻可輸出的時間",
+    ["provider", "model"],
+    buckets=REQUEST_BUCKETS,
+)
+AUDIO_SECONDS = Counter(
+    "tts_audio_seconds",
+    "輸出音頻總長度（秒）；直接輸出 provider 原始音頻時不解碼，不計入",
+    ["provider", "model"],
+)
+OUTPUT_BYTES = Counter(
+    "tts_output_bytes",
+    "輸出音頻大小",
+    ["provider", "model", "format"],
+)
+
+
+def record_provider_request(provider: str, model: Optional[str], seconds: float, outcome: str, characters: int = 0):
+    """記錄一次 provider 請求（rate_limit.call_with_retry 每次嘗試呼叫）"""
+    model = model or ""
+    PROVIDER_REQUEST_SECONDS.labels(provider, model).observe(seconds)
+    PROVIDER_REQUESTS.labels(provider, model, outcome).inc()
+    if characters:
+        PROVIDER_CHARACTERS.labels(provider, model).inc(characters)
+
+
+def record_provider_phase(provider: str, model: Optional[str], phase: str, seconds: float):
+    PROVIDER_PHASE_SECONDS.labels(provider, model or "", phase).observe(seconds)
+
+
+def segment_in_flight(provider: str, model: Optional[str]):
+    """合成中片段數的 context manager"""
+    return SEGMENTS_IN_FLIGHT.labels(provider, model or "").track_inprogress()
+
+
+class RenderMetrics:
+    """
+    一次生成的指標：標籤預先綁定，結束時以 finish 記錄總耗時與輸出
+
+    各階段耗時同時寫入 trace（RenderTrace），供生成日誌與 API 回應使用；profile=True 時開啟 cProfile 剖析。
+    """
+
+    def __init__(self, provider: str, model: Optional[str], entrypoint: str, profile: bool = False):
+        self.provider = provider
+        self.model = model or ""
+        self.entrypoint = entrypoint
+        self.started = time.perf_counter()
+        self.trace = RenderTrace(f"{entrypoint}-{provider}", profile=profile)
+
+    @contextmanager
+    def stage(self, name: str):
+        """計時處理階段，記錄到 Prometheus 與 trace"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            STAGE_SECONDS.labels(name, self.provider, self.model).observe(seconds)
+            self.trace.add(name, seconds)
+
+    def timed(self, name: str, iterable):
+        """逐項產出 iterable，取用各項的耗時（例如邊解析邊合成時的解析）累計為一次 name 階段"""
+        total = 0.0
+        items = iter(iterable)
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+                finally:
+                    total += time.perf_counter() - started
+                yield item
+        finally:
+            STAGE_SECONDS.labels(name, self.provider, self.model).observe(total)
+            self.trace.add(name, total)
+
+    def first_audio(self):
+        """記錄串流的首段音頻時間（time-to-first-audio）"""
+        seconds = time.perf_counter() - self.started
+        FIRST_AUDIO_SECONDS.labels(self.provider, self.model).observe(seconds)
+        self.trace.add("first_audio", seconds)
+
+    def finish(
+        self,
+        status: str = "ok",
+        audio_format: Optional[str] = None,
+        audio_bytes: int = 0,
+        audio_seconds: Optional[float] = None,
+    ):
+        RENDER_SECONDS.labels(self.provider, self.model, self.entrypoint, status).observe(
+            time.perf_counter() - self.started
+        )
+        if audio_bytes:
+            OUTPUT_BYTES.labels(self.provider, self.model, audio_format).inc(audio_bytes)
+        if audio_seconds:
+            AUDIO_SECONDS.labels(self.provider, self.model).inc(audio_seconds)
+
+
+def render_latest() -> tuple:
+    """回傳 (Prometheus 文字格式內容, content type)"""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port: int = METRICS_PORT) -> Optional[int]:
+    """在背景執行緒提供 /metrics（port 為 0 時不啟用），回傳使用的 port"""
+    if not port:
+        return None
+    start_http_server(port)
+    return port
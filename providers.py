@@ -0,0 +1,621 @@
+"""
+TTS provider 註冊表
+
+每個 provider 以一次 register_provider() 宣告其能力：單次輸入上限、原生輸出格式與取樣率、
+安全並行數、速率上限、每字符費用、可用模型與聲音、所需憑證。切分（text_chunker）、
+並行（synthesis / rate_limit）、解碼與費用估算都依此宣告決定；api.py 與 app.py 的選項、
+憑證檢查與介面也由註冊表產生，新增 provider 只需在此註冊。
+"""
+import os
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field, replace
+from typing import Callable, Optional
+
+import requests
+from dotenv import load_dotenv
+from google.genai import types
+from pydub import AudioSegment
+
+import metrics
+import rate_limit
+import synthesis
+import text_chunker
+from audio_cache import CacheStats, cache_key, segment_cache
+from audio_decode import submit_audio
+from rate_limit import call_with_retry, error_outcome, get_limiter, is_throttle
+from script_parser import speaker_slot
+from text_chunker import DIALOGUE_SPEAKER, parse_dialogue
+from tts_clients import get_gemini_client, get_http_session, get_openai_client, get_polly_client
+
+load_dotenv()
+
+GEMINI_SAMPLE_RATE = 24000
+
+TAI_TTS_URL = os.getenv("TAI_TTS_URL", "https://learn-language.tokyo/taigiTTS/taigi-text-to-speech")
+
+
+@dataclass(frozen=True)
+class Credential:
+    """provider 所需的一項憑證或連線設定"""
+
+    name: str                      # 傳給 synthesize 的鍵，例如 "api_key"
+    label: str                     # 介面與錯誤訊息顯示名稱
+    env: Optional[str] = None      # 未提供時讀取的環境變量
+    default: Optional[str] = None
+    secret: bool = True
+    required: bool = True
+
+
+@dataclass(frozen=True)
+class ProviderSpec:
+    """
+    provider 能力宣告
+
+    synthesize(text, voice, model, instructions, credentials) 回傳 audio_format 格式的音頻 bytes；
+    宣告 output_formats 的 provider 另可收到 audio_format 參數，回傳該格式的 bytes。
+    宣告 synthesize_dialogue(turns, voices, model, credentials) 的 provider 可在一次請求中合成
+    兩位說話者的多輪對話（turns 為 [(speaker, text), ...]，voices 依說話者首次出現的順序排列），
+    僅適用原生格式為 raw PCM 的 provider。
+    宣告 synthesize_stream(text, voice, model, instructions, credentials, on_part) 的 provider 可在音頻
+    生成途中以 on_part(bytes) 逐段交出原生格式音頻（raw PCM 需為完整樣本），結束時回傳完整音頻。
+    """
+
+    name: str
+    label: str
+    synthesize: Callable[..., bytes]
+    audio_format: str              # 原生輸出格式: "mp3" / "wav" / "raw"（16-bit 單聲道 PCM）
+    sample_rate: int
+    max_chars: int                 # 單次請求的文本長度上限
+    concurrency: int               # 預設同時請求數（可用 TTS_CONCURRENCY_<PROVIDER> 覆寫）
+    cost_per_char: float           # 美元 / 字符（粗估，用於日誌中的費用估算）
+    requests_per_minute: float = 0
+    characters_per_minute: float = 0
+    models: tuple = ()
+    default_model: Optional[str] = None
+    voices: tuple = ()
+    default_voices: tuple = (None, None)  # (speaker-1, speaker-2)
+    supports_instructions: bool = False
+    credentials: tuple = ()
+    # 可另外要求的輸出格式（audio_encode 的格式名稱）→ 取樣率
+    output_formats: dict = field(default_factory=dict)
+    synthesize_dialogue: Optional[Callable[..., bytes]] = None
+    dialogue_max_chars: int = 0    # 單次對話請求的文本長度上限（含說話者標籤）
+    synthesize_stream: Optional[Callable[..., bytes]] = None
+    # 先請求生成、再另行下載音頻的 provider：同時下載數（下載不佔用請求名額）
+    download_concurrency: int = 0
+    notes: str = ""
+
+    def native_sample_rate(self, audio_format: str) -> Optional[int]:
+        """provider 可直接輸出 audio_format（輸出格式名稱）時回傳取樣率，否則回傳 None"""
+        if audio_format in self.output_formats:
+            return self.output_formats[audio_format]
+        if audio_format == ("pcm" if self.audio_format == "raw" else self.audio_format):
+            return self.sample_rate
+        return None
+
+    def resolve_credentials(self, values: dict = None) -> dict:
+        """依 提供值 → 環境變量 → 預設值 的順序取得憑證"""
+        values = values or {}
+        resolved = {}
+        for credential in self.credentials:
+            value = values.get(credential.name)
+            if not value and credential.env:
+                value = os.getenv(credential.env)
+            resolved[credential.name] = value or credential.default
+        return resolved
+
+    def missing_credentials(self, values: dict = None) -> list:
+        """回傳缺少的必要憑證名稱"""
+        resolved = self.resolve_credentials(values)
+        return [c.label for c in self.credentials if c.required and not resolved.get(c.name)]
+
+
+_registry = {}
+
+
+def register_provider(spec: ProviderSpec) -> ProviderSpec:
+    """註冊 provider，並將切分上限、並行數與速率上限同步到對應模組"""
+    _registry[spec.name] = spec
+    text_chunker.PROVIDER_MAX_CHARS[spec.name] = spec.max_chars
+    if spec.synthesize_dialogue is not None:
+        text_chunker.PROVIDER_DIALOGUE_MAX_CHARS[spec.name] = spec.dialogue_max_chars or spec.max_chars
+    synthesis.DEFAULT_CONCURRENCY[spec.name] = spec.concurrency
+    synthesis.DEFAULT_DOWNLOAD_CONCURRENCY[spec.name] = spec.download_concurrency
+    rate_limit.DEFAULT_RATE_LIMITS[spec.name] = (spec.requests_per_minute, spec.characters_per_minute)
+    return spec
+
+
+def get_provider(name: str) -> ProviderSpec:
+    """取得 provider，不存在時拋出 KeyError"""
+    try:
+        return _registry[name]
+    except KeyError:
+        raise KeyError(f"不支援的 provider: {name}") from None
+
+
+def list_providers() -> list:
+    return list(_registry.values())
+
+
+def provider_names() -> list:
+    return list(_registry)
+
+
+def find_provider_by_label(label: str) -> ProviderSpec:
+    for spec in _registry.values():
+        if spec.label == label:
+            return spec
+    raise KeyError(f"不支援的 provider: {label}")
+
+
+@dataclass
+class RenderSettings:
+    """一次生成的 provider 設定：模型、兩位說話者的聲音與語氣、憑證，以及要求 provider 輸出的格式"""
+
+    provider: str
+    model: Optional[str] = None
+    voices: tuple = (None, None)
+    instructions: tuple = (None, None)
+    credentials: dict = field(default_factory=dict)
+    # None 為 provider 預設格式（spec.audio_format）
+    audio_format: Optional[str] = None
+    # 將連續對話輪次合併為一次多說話者請求（需 provider 宣告 synthesize_dialogue）
+    multi_speaker: bool = False
+    # 說話者 → 聲音（speaker-N 或具名說話者）；具名說話者須列在這裡才會被辨識，聲音為 None 時依順序使用兩組預設
+    voice_map: dict = field(default_factory=dict)
+
+    @property
+    def spec(self) -> ProviderSpec:
+        return get_provider(self.provider)
+
+    def resolved(self) -> "RenderSettings":
+        """以 provider 預設值補齊未指定的欄位"""
+        spec = self.spec
+        return RenderSettings(
+            provider=self.provider,
+            model=self.model or spec.default_model,
+            voices=tuple(voice or default for voice, default in zip(self.voices, spec.default_voices)),
+            instructions=self.instructions if spec.supports_instructions else (None, None),
+            credentials=spec.resolve_credentials(self.credentials),
+            audio_format=self.audio_format,
+            multi_speaker=self.multi_speaker and spec.synthesize_dialogue is not None,
+            voice_map=dict(self.voice_map),
+        )
+
+    def with_native_format(self, audio_format: str) -> "RenderSettings":
+        """要求 provider 直接輸出 audio_format（需為 spec.native_sample_rate 支援的格式）"""
+        spec = self.spec
+        if audio_format not in spec.output_formats or audio_format == spec.audio_format:
+            return replace(self, audio_format=None)
+        return replace(self, audio_format=audio_format)
+
+    @property
+    def source_format(self) -> str:
+        """provider 回傳的音頻格式"""
+        return self.audio_format or self.spec.audio_format
+
+    def for_speaker(self, speaker: str) -> tuple:
+        """
+        回傳 (voice, instructions)；voice_map 指定的聲音優先，其餘依 script_parser.speaker_slot 使用第一或第二組設定
+
+        多說話者片段的 voice 為兩位說話者的聲音以 + 連接，再附上聲音對應表（用於快取鍵與 manifest）。
+        """
+        if speaker == DIALOGUE_SPEAKER:
+            voices = [voice or "" for voice in self.voices]
+            voices.extend(f"{name}={voice or ''}" for name, voice in self.voice_map.items())
+            return "+".join(voices), None
+        index = speaker_slot(speaker, self.voice_map)
+        return self.voice_map.get(speaker) or self.voices[index], self.instructions[index]
+
+
+def fetch_segment_audio(
+    settings: RenderSettings,
+    speaker: str,
+    text: str,
+    cache_stats: CacheStats = None,
+    on_part: Callable[[bytes], None] = None,
+) -> bytes:
+    """
+    取得片段的原生格式音頻（先查快取，未命中才呼叫 provider）
+
+    指定 on_part 時，宣告 synthesize_stream 的 provider 在生成途中逐段呼叫 on_part；
+    其他情況（快取命中、不支援串流、多說話者片段）在取得完整音頻後呼叫一次。
+    """
+    spec = settings.spec
+    voice, instructions = settings.for_speaker(speaker)
+
+    options = {"audio_format": settings.audio_format} if settings.audio_format else {}
+    stream = (
+        on_part is not None and spec.synthesize_stream is not None
+        and speaker != DIALOGUE_SPEAKER and not options
+    )
+    streamed = False
+
+    def create() -> bytes:
+        nonlocal streamed
+        if cache_stats is not None:
+            cache_stats.record_characters(len(text))
+        with metrics.segment_in_flight(spec.name, settings.model):
+            if speaker == DIALOGUE_SPEAKER:
+                return synthesize_dialogue(settings, text, cache_stats)
+            if stream:
+                streamed = True
+                return spec.synthesize_stream(
+                    text, voice, settings.model, instructions, settings.credentials, on_part=on_part
+                )
+            return spec.synthesize(text, voice, settings.model, instructions, settings.credentials, **options)
+
+    data = segment_cache.get_or_create(
+        cache_key(spec.name, settings.model, voice, instructions, text, settings.audio_format),
+        create,
+        cache_stats,
+    )
+    if on_part is not None and not streamed:
+        on_part(data)
+    return data
+
+
+def synthesize_dialogue(settings: RenderSettings, text: str, cache_stats: CacheStats = None) -> bytes:
+    """
+    一次請求合成多說話者片段（text_chunker.plan_dialogue 的對話文本）
+
+    請求失敗或音頻不完整時改為逐輪以單一聲音合成（各輪仍經過片段快取），再直接串接 raw PCM；
+    節流（429）不改為逐輪，以免送出更多請求。
+    """
+    spec = settings.spec
+    turns = parse_dialogue(text)
+    # 依首次出現的順序列出各說話者的聲音
+    speakers = dict.fromkeys(speaker for speaker, _ in turns)
+    voices = tuple(settings.for_speaker(speaker)[0] for speaker in speakers)
+    try:
+        return spec.synthesize_dialogue(turns, voices, settings.model, settings.credentials)
+    except Exception as e:
+        if error_outcome(e) == "throttled":
+            raise
+        print(f"⚠️ {spec.label} 多說話者合成失敗，改為逐輪合成 {len(turns)} 輪: {e}")
+        metrics.DIALOGUE_FALLBACKS.labels(spec.name, settings.model or "").inc()
+        return b"".join(fetch_segment_audio(settings, speaker, turn, cache_stats) for speaker, turn in turns)
+
+
+def submit_segment_audio(provider: str, data: bytes, audio_format: str = None) -> Future:
+    """
+    依 provider 的原生格式（或另外要求的 audio_format）與取樣率排入解碼，回傳結果為 AudioSegment 的 Future
+
+    壓縮格式與同時排入的其他片段合併為一次 ffmpeg 呼叫，呼叫端不必等待解碼即可繼續合成下一個片段。
+    """
+    spec = get_provider(provider)
+    if audio_format and audio_format != spec.audio_format:
+        return submit_audio(data, audio_format, frame_rate=spec.native_sample_rate(audio_format))
+    return submit_audio(data, spec.audio_format, frame_rate=spec.sample_rate)
+
+
+def decode_segment_audio(provider: str, data: bytes, audio_format: str = None) -> AudioSegment:
+    """依 provider 的原生格式（或另外要求的 audio_format）與取樣率在記憶體中解碼"""
+    return submit_segment_audio(provider, data, audio_format).result()
+
+
+def estimate_cost(provider: str, characters: int) -> float:
+    return get_provider(provider).cost_per_char * characters
+
+
+# ---- 內建 provider ----
+
+def synthesize_openai(
+    text: str,
+    voice: str,
+    model: str,
+    instructions: str,
+    credentials: dict,
+    audio_format: str = "mp3",
+) -> bytes:
+    client = get_openai_client(credentials["api_key"])
+    api_params = {
+        "model": model,
+        "voice": voice,
+        "input": text,
+        "response_format": audio_format,
+    }
+    if instructions:
+        api_params["instructions"] = instructions
+
+    def request() -> bytes:
+        with client.audio.speech.with_streaming_response.create(**api_params) as response:
+            return b"".join(response.iter_bytes())
+
+    return call_with_retry("openai", request, len(text), model=model)
+
+
+def _gemini_config(voice: str) -> types.GenerateContentConfig:
+    return types.GenerateContentConfig(
+        response_modalities=["audio"],
+        speech_config=types.SpeechConfig(
+            voice_config=types.VoiceConfig(
+                prebuilt_voice_config=types.PrebuiltVoiceConfig(voice_name=voice)
+            )
+        ),
+    )
+
+
+def synthesize_gemini(text: str, voice: str, model: str, instructions: str, credentials: dict) -> bytes:
+    client = get_gemini_client(credentials["api_key"])
+    response = call_with_retry("gemini", lambda: client.models.generate_content(
+        model=model,
+        contents=[types.Content(role="user", parts=[types.Part.from_text(text=text)])],
+        config=_gemini_config(voice),
+    ), len(text), model=model)
+    return _gemini_pcm(response)
+
+
+def synthesize_gemini_stream(
+    text: str, voice: str, model: str, instructions: str, credentials: dict, on_part: Callable[[bytes], None]
+) -> bytes:
+    """
+    以 generate_content_stream 合成，每收到一段 PCM 即交給 on_part
+
+    已交出音頻後才失敗時不重試（重試會重複已送出的音頻），改拋出 RuntimeError。
+    """
+    client = get_gemini_client(credentials["api_key"])
+
+    def request() -> bytes:
+        pcm_data = bytearray()
+        sent = 0  # 已交出的 bytes（只交出完整的 16-bit 樣本）
+        try:
+            for chunk in client.models.generate_content_stream(
+                model=model,
+                contents=[types.Content(role="user", parts=[types.Part.from_text(text=text)])],
+                config=_gemini_config(voice),
+            ):
+                pcm_data += _gemini_pcm(chunk, required=False)
+                ready = len(pcm_data) - len(pcm_data) % 2
+                if ready > sent:
+                    on_part(bytes(pcm_data[sent:ready]))
+                    sent = ready
+        except Exception as e:
+            if sent:
+                raise RuntimeError(f"Gemini 串流在送出 {sent} bytes 後中斷: {e}") from e
+            raise
+        if not pcm_data:
+            raise RuntimeError("未能取得 Gemini 音頻輸出")
+        return bytes(pcm_data)
+
+    return call_with_retry("gemini", request, len(text), model=model)
+
+
+# 多說話者請求中的說話者名稱（需與提示中的標籤一致）
+GEMINI_SPEAKER_NAMES = ("Speaker1", "Speaker2")
+# 回傳音頻短於 字符數 / 此值 秒時視為被截斷（正常語速遠低於此）
+GEMINI_MAX_CHARS_PER_SECOND = 30
+
+
+def synthesize_gemini_dialogue(turns: list, voices: tuple, model: str, credentials: dict) -> bytes:
+    """
+    以 MultiSpeakerVoiceConfig 在一次請求中合成兩位說話者的多輪對話
+
+    voices 依說話者在 turns 中首次出現的順序排列；只有一位說話者時第二個聲音設定不會用到。
+    """
+    client = get_gemini_client(credentials["api_key"])
+    voices = (tuple(voices) * len(GEMINI_SPEAKER_NAMES))[:len(GEMINI_SPEAKER_NAMES)]
+    config = types.GenerateContentConfig(
+        response_modalities=["audio"],
+        speech_config=types.SpeechConfig(
+            multi_speaker_voice_config=types.MultiSpeakerVoiceConfig(
+                speaker_voice_configs=[
+                    types.SpeakerVoiceConfig(
+                        speaker=name,
+                        voice_config=types.VoiceConfig(
+                            prebuilt_voice_config=types.PrebuiltVoiceConfig(voice_name=voice)
+                        ),
+                    )
+                    for name, voice in zip(GEMINI_SPEAKER_NAMES, voices)
+                ]
+            )
+        ),
+    )
+    names = dict(zip(dict.fromkeys(speaker for speaker, _ in turns), GEMINI_SPEAKER_NAMES))
+    lines = [f"{names[speaker]}: {text}" for speaker, text in turns]
+    prompt = f"TTS the following conversation between {' and '.join(GEMINI_SPEAKER_NAMES)}:\n" + "\n".join(lines)
+    response = call_with_retry("gemini", lambda: client.models.generate_content(
+        model=model,
+        contents=[types.Content(role="user", parts=[types.Part.from_text(text=prompt)])],
+        config=config,
+    ), len(prompt), model=model)
+
+    pcm_data = _gemini_pcm(response)
+    characters = sum(len(text) for _, text in turns)
+    if len(pcm_data) / 2 / GEMINI_SAMPLE_RATE < characters / GEMINI_MAX_CHARS_PER_SECOND:
+        raise RuntimeError(f"Gemini 多說話者音頻不完整（{characters} 字符僅 {len(pcm_data)} bytes）")
+    return pcm_data
+
+
+def _gemini_pcm(response, required: bool = True) -> bytes:
+    """取出回應（或串流的一段）中的 PCM 音頻"""
+    pcm_data = b""
+    if response.candidates and response.candidates[0].content:
+        for part in response.candidates[0].content.parts or ():
+            if part.inline_data and part.inline_data.data:
+                pcm_data += part.inline_data.data
+    if not pcm_data and required:
+        raise RuntimeError("未能取得 Gemini 音頻輸出")
+    return pcm_data
+
+
+def synthesize_polly(text: str, voice: str, model: str, instructions: str, credentials: dict) -> bytes:
+    polly = get_polly_client(credentials["region"], credentials["access_key"], credentials["secret_key"])
+
+    def request() -> bytes:
+        response = polly.synthesize_speech(
+            Text=text,
+            OutputFormat="mp3",
+            VoiceId=voice,
+            Engine=model,
+        )
+        return response["AudioStream"].read()
+
+    return call_with_retry("polly", request, len(text), model=model)
+
+
+# 下載 WAV 時每次讀取的大小
+TAI_DOWNLOAD_CHUNK_BYTES = 64 * 1024
+# 下載失敗（連線錯誤或 5xx）且尚未交出任何音頻時的嘗試次數
+TAI_DOWNLOAD_ATTEMPTS = 3
+
+
+def synthesize_taiwanese(
+    text: str, voice: str, model: str, instructions: str, credentials: dict, on_part: Callable[[bytes], None] = None
+) -> bytes:
+    """
+    兩階段合成：POST 取得 audio_url（佔用請求名額與速率），再以下載名額下載 WAV
+
+    下載時已釋放請求名額，片段 N 下載的同時片段 N+1 的生成請求即可送出。
+    指定 on_part 時，下載的 WAV 每收到一塊就交出（供邊下載邊解碼）。兩階段耗時分別記錄到 metrics。
+    """
+    def request() -> str:
+        started = time.perf_counter()
+        try:
+            response = get_http_session().post(
+                TAI_TTS_URL,
+                json={"text": text, "model": model},
+                headers={"content-type": "application/json", "origin": "https://learn-language.tokyo"},
+                timeout=60,
+            )
+            response.raise_for_status()
+            result = response.json()
+        finally:
+            metrics.record_provider_phase("taiwanese", model, "generate", time.perf_counter() - started)
+        audio_url = result.get("audio_url")
+        if not audio_url:
+            raise RuntimeError(f"台語 TTS 回應中缺少 audio_url: {result}")
+        return audio_url
+
+    audio_url = call_with_retry("taiwanese", request, len(text), model=model)
+    emitted = False
+
+    def download() -> bytes:
+        nonlocal emitted
+        started = time.perf_counter()
+        try:
+            with get_http_session().get(audio_url, timeout=60, stream=True) as response:
+                response.raise_for_status()
+                audio_data = bytearray()
+                for chunk in response.iter_content(TAI_DOWNLOAD_CHUNK_BYTES):
+                    audio_data += chunk
+                    if on_part is not None:
+                        on_part(chunk)
+                        emitted = True
+                return bytes(audio_data)
+        finally:
+            metrics.record_provider_phase("taiwanese", model, "download", time.perf_counter() - started)
+
+    with get_limiter("taiwanese").download_slot():
+        for attempt in range(1, TAI_DOWNLOAD_ATTEMPTS + 1):
+            try:
+                return download()
+            except requests.RequestException as e:
+                retryable = isinstance(e, (requests.ConnectionError, requests.Timeout)) or is_throttle(e)
+                if emitted or attempt == TAI_DOWNLOAD_ATTEMPTS or not retryable:
+                    raise
+                time.sleep(0.5 * attempt)
+
+
+register_provider(ProviderSpec(
+    name="openai",
+    label="OpenAI TTS",
+    synthesize=synthesize_openai,
+    audio_format="mp3",
+    sample_rate=24000,
+    # input 上限 4096 字符，但 gpt-4o-mini-tts 另有 token 上限，中文保守取 1000
+    max_chars=1000,
+    concurrency=4,
+    cost_per_char=0.000015,  # tts-1 每百萬字符 $15
+    requests_per_minute=500,
+    models=("gpt-4o-mini-tts", "gpt-4o-audio-preview", "tts-1", "tts-1-hd"),
+    default_model="gpt-4o-mini-tts",
+    voices=("alloy", "echo", "fable", "onyx", "nova", "shimmer", "coral", "sage"),
+    default_voices=("onyx", "nova"),
+    supports_instructions=True,
+    credentials=(Credential("api_key", "OpenAI API Key", env="OPENAI_API_KEY"),),
+    # response_format 可直接輸出；pcm 為 24kHz 16-bit little-endian
+    output_formats={"mp3": 24000, "opus": 48000, "aac": 24000, "wav": 24000, "pcm": 24000},
+    notes="""
+OpenAI 聲音備註：
+- alloy: 中性平衡，對話感自然，通用場景。
+- echo: 低沉男聲，較穩重，適合旁白或正式說明。
+- fable: 溫暖敘事感，適合故事/有聲書。
+- onyx: 清晰沉穩男聲，較正式，適合說明/主持。
+- nova: 友好女聲，明亮自然，適合對話互動。
+- shimmer: 柔和女聲，親切溫暖，適合客服/陪伴。
+- coral: 活潑女聲，帶能量感，適合行銷/短視頻。
+- sage: 成熟男聲，穩健理性，適合新聞/解說。
+""",
+))
+
+register_provider(ProviderSpec(
+    name="gemini",
+    label="Gemini TTS",
+    synthesize=synthesize_gemini,
+    audio_format="raw",
+    sample_rate=GEMINI_SAMPLE_RATE,
+    max_chars=4000,  # TTS 模型輸入約 8k tokens，中文保守估計
+    synthesize_stream=synthesize_gemini_stream,
+    synthesize_dialogue=synthesize_gemini_dialogue,
+    # 一次對話請求受輸出音頻長度限制（約 16k 音頻 token ≈ 8 分鐘），中文約 4 字/秒，保守取 1500
+    dialogue_max_chars=1500,
+    concurrency=2,
+    cost_per_char=0.000125,  # 以 2.5 Pro TTS 音頻輸出 token 價格粗估
+    requests_per_minute=10,
+    models=("gemini-2.5-pro-preview-tts", "gemini-2.5-flash-preview-tts"),
+    default_model="gemini-2.5-pro-preview-tts",
+    voices=("Puck", "Charon", "Kore", "Fenrir", "Alnilam", "Aoede", "Algieba"),
+    default_voices=("Puck", "Aoede"),
+    credentials=(Credential("api_key", "Gemini API Key", env="GEMINI_API_KEY"),),
+    notes="""
+Gemini 聲音備註：
+- Puck: 自然、中音、對話感強，適合一般對話。中文咬字清楚，外國腔較少。
+- Charon: 低沉穩重、帶權威感，適合新聞播報/嚴肅公告/懸疑。
+- Fenrir: 高亢有活力、語速偏快，適合遊戲旁白或激動解說。講中文時語速有時忽快忽慢，除非要激動效果，建議避開。
+- Aoede: 建議女聲首選，中文咬字清楚、外國腔較少。
+- Alnilam/Algieba: 舊版常見的名稱；在 gemini-2.5 系列建議優先用 Puck/Aoede/Charon/Fenrir。
+
+中文建議：首選組合 Puck (男) + Aoede (女)；若中文朗讀為主且要穩定，避免使用 Fenrir。
+""",
+))
+
+register_provider(ProviderSpec(
+    name="polly",
+    label="AWS Polly",
+    synthesize=synthesize_polly,
+    audio_format="mp3",
+    sample_rate=24000,
+    max_chars=3000,  # SynthesizeSpeech 可計費字符上限
+    concurrency=4,
+    cost_per_char=0.000016,  # Neural 每百萬字符 $16
+    requests_per_minute=4800,
+    models=("neural",),
+    default_model="neural",
+    voices=("Zhiyu",),
+    default_voices=("Zhiyu", "Zhiyu"),
+    credentials=(
+        Credential("access_key", "AWS Access Key ID", env="AWS_ACCESS_KEY_ID"),
+        Credential("secret_key", "AWS Secret Access Key", env="AWS_SECRET_ACCESS_KEY"),
+        Credential("region", "AWS Region", env="AWS_REGION", default="ap-northeast-1", secret=False, required=False),
+    ),
+    notes="AWS Polly 中文目前僅女聲 Zhiyu，雙說話者將共用此聲音。需要 AWS Access Key / Secret / Region 才能使用。",
+))
+
+register_provider(ProviderSpec(
+    name="taiwanese",
+    label="Taiwanese TTS",
+    synthesize=synthesize_taiwanese,
+    synthesize_stream=synthesize_taiwanese,
+    audio_format="wav",
+    sample_rate=24000,
+    max_chars=1000,
+    concurrency=2,
+    download_concurrency=2,
+    cost_per_char=0.0,  # 公益服務
+    requests_per_minute=60,
+    models=("model6",),
+    default_model="model6",
+    notes="台語 TTS (Taiwanese) 目前僅單一女聲，無需 API Key，模型預設 model6。雙說話者將共用同一聲音。",
+))
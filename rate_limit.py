@@ -0,0 +1,312 @@
+"""
+各 provider 的速率限制、自適應並行度與重試
+
+- 令牌桶：限制每分鐘請求數與字符數
+- AIMD：遇到 429/5xx 時並行上限減半，成功時逐步加回，最高為 get_concurrency(provider)
+- 重試：429/5xx 以帶抖動的指數退避重試，回應有 Retry-After 時依其等待
+- 兩階段 provider 的下載：不佔用請求名額與速率，另以 get_download_concurrency(provider) 限制同時下載數
+
+狀態為整個進程共用，同一 provider 的所有並行請求共享同一組限制。api.py 與 app.py 共用。
+"""
+import email.utils
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+import metrics
+from synthesis import get_concurrency, get_download_concurrency
+
+load_dotenv()
+
+# 各 provider 預設的 (每分鐘請求數, 每分鐘字符數)，0 表示不限制；由 providers.register_provider 填入，
+# 可用環境變量 TTS_RPM_<PROVIDER>、TTS_CPM_<PROVIDER> 覆寫
+DEFAULT_RATE_LIMITS = {}
+
+RETRY_ATTEMPTS = int(os.getenv("TTS_RETRY_ATTEMPTS", "5"))
+RETRY_MAX_WAIT = float(os.getenv("TTS_RETRY_MAX_WAIT", "60"))
+# 同一波 429 只減半一次
+THROTTLE_COOLDOWN_SECONDS = 2.0
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+THROTTLE_ERROR_CODES = {"Throttling", "ThrottlingException", "TooManyRequestsException", "ServiceUnavailable"}
+
+
+def _env_number(name: str, default: float) -> float:
+    try:
+        return max(0.0, float(os.getenv(name, default)))
+    except (TypeError, ValueError):
+        return default
+
+
+class TokenBucket:
+    """每分鐘補充 per_minute 個令牌，容量為一分鐘的量；per_minute 為 0 時不限制"""
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self._tokens = per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, amount: float = 1) -> float:
+        """
+        取得 amount 個令牌，不足時等待，回傳等待秒數
+
+        先預扣令牌再等待（餘額可為負），後到的請求會排在前面請求之後。
+        """
+        if not self.per_minute or amount <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        rate = self.per_minute / 60
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * rate)
+            self._updated = now
+            self._tokens -= amount
+            wait = -self._tokens / rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def available(self) -> float:
+        with self._lock:
+            elapsed = time.monotonic() - self._updated
+            return min(self.capacity, self._tokens + elapsed * self.per_minute / 60)
+
+
+class AdaptiveConcurrency:
+    """AIMD 並行上限：節流時減半，每次成功加 1/上限（約每輪加 1）"""
+
+    def __init__(self, maximum: int, minimum: int = 1):
+        self.maximum = max(1, maximum)
+        self.minimum = min(minimum, self.maximum)
+        self.limit = float(self.maximum)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        with self._condition:
+            if self.limit < self.maximum:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+                self._condition.notify_all()
+
+    def on_throttle(self):
+        with self._condition:
+            now = time.monotonic()
+            if now - self._last_decrease >= THROTTLE_COOLDOWN_SECONDS:
+                self.limit = max(self.minimum, self.limit / 2)
+                self._last_decrease = now
+
+
+class ProviderLimiter:
+    """單一 provider 的令牌桶、自適應並行度與統計"""
+
+    def __init__(self, provider: str):
+        default_rpm, default_cpm = DEFAULT_RATE_LIMITS.get(provider, (0, 0))
+        self.provider = provider
+        self.requests = TokenBucket(_env_number(f"TTS_RPM_{provider.upper()}", default_rpm))
+        self.characters = TokenBucket(_env_number(f"TTS_CPM_{provider.upper()}", default_cpm))
+        self.concurrency = AdaptiveConcurrency(get_concurrency(provider))
+        self.downloads = threading.BoundedSemaphore(max(1, get_download_concurrency(provider)))
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self.successes = 0
+        self.throttled = 0
+        self.retries = 0
+        self.wait_seconds = 0.0
+
+    def record_retry(self, pause_seconds: float = None):
+        """記錄一次重試；有 Retry-After 時暫停此 provider 的新請求"""
+        with self._lock:
+            self.retries += 1
+            if pause_seconds:
+                self._paused_until = max(self._paused_until, time.monotonic() + pause_seconds)
+
+    @contextmanager
+    def slot(self, characters: int = 0):
+        """取得令牌與並行名額後執行請求，並依結果調整並行上限"""
+        with self._lock:
+            paused = self._paused_until - time.monotonic()
+        waited = 0.0
+        if paused > 0:
+            time.sleep(paused)
+            waited += paused
+        waited += self.requests.take(1)
+        waited += self.characters.take(characters)
+        self.concurrency.acquire()
+        try:
+            yield
+        except Exception as e:
+            if is_throttle(e):
+                self.concurrency.on_throttle()
+                with self._lock:
+                    self.throttled += 1
+            raise
+        else:
+            self.concurrency.on_success()
+            with self._lock:
+                self.successes += 1
+        finally:
+            self.concurrency.release()
+            with self._lock:
+                self.wait_seconds += waited
+
+    @contextmanager
+    def download_slot(self):
+        """取得下載名額（不佔用請求名額，也不計入速率限制）"""
+        with self.downloads:
+            yield
+
+    def info(self) -> dict:
+        with self._lock:
+            return {
+                "concurrency_limit": int(self.concurrency.limit),
+                "concurrency_max": self.concurrency.maximum,
+                "in_flight": self.concurrency.in_flight,
+                "requests_per_minute": self.requests.per_minute,
+                "characters_per_minute": self.characters.per_minute,
+                "successes": self.successes,
+                "throttled": self.throttled,
+                "retries": self.retries,
+                "wait_seconds": round(self.wait_seconds, 2),
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    with _limiters_lock:
+        limiter = _limiters.get(provider)
+        if limiter is None:
+            limiter = ProviderLimiter(provider)
+            _limiters[provider] = limiter
+        return limiter
+
+
+def limiter_info() -> dict:
+    """各 provider 目前的限制與統計（/health 使用）"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.provider: limiter.info() for limiter in limiters}
+
+
+def _status_code(error: Exception):
+    """從 openai / google-genai / botocore / requests 的例外取得 HTTP 狀態碼"""
+    for attribute in ("status_code", "code"):
+        value = getattr(error, attribute, None)
+        if isinstance(value, int):
+            return value
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        return response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return getattr(response, "status_code", None)
+
+
+def _headers(error: Exception):
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        return response.get("ResponseMetadata", {}).get("HTTPHeaders") or {}
+    return getattr(response, "headers", None) or {}
+
+
+def is_throttle(error: Exception) -> bool:
+    """429、5xx 或 AWS 節流錯誤"""
+    response = getattr(error, "response", None)
+    if isinstance(response, dict) and response.get("Error", {}).get("Code") in THROTTLE_ERROR_CODES:
+        return True
+    return _status_code(error) in RETRYABLE_STATUS
+
+
+def error_outcome(error: Exception) -> str:
+    """指標用的失敗分類：throttled（429 與 AWS 節流）、server_error（5xx）或 error"""
+    response = getattr(error, "response", None)
+    if isinstance(response, dict) and response.get("Error", {}).get("Code") in THROTTLE_ERROR_CODES:
+        return "throttled"
+    status = _status_code(error)
+    if status == 429:
+        return "throttled"
+    if isinstance(status, int) and status >= 500:
+        return "server_error"
+    return "error"
+
+
+def retry_after(error: Exception):
+    """讀取 Retry-After（秒數或 HTTP 日期）或 retry-after-ms，沒有時回傳 None"""
+    headers = _headers(error)
+    try:
+        value = headers.get("retry-after-ms")
+        if value is not None:
+            return max(0.0, float(value) / 1000)
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            date = email.utils.parsedate_to_datetime(value)
+            return max(0.0, date.timestamp() - time.time())
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+_backoff = wait_random_exponential(multiplier=0.5, max=RETRY_MAX_WAIT)
+
+
+def _retry_wait(retry_state) -> float:
+    """有 Retry-After 時依其等待並加上少量抖動，否則使用帶抖動的指數退避"""
+    delay = retry_after(retry_state.outcome.exception())
+    if delay is None:
+        return _backoff(retry_state)
+    return min(RETRY_MAX_WAIT, delay + random.uniform(0, 1))
+
+
+def call_with_retry(provider: str, function, characters: int = 0, model: str = None):
+    """
+    在 provider 的速率與並行限制內呼叫 function()，遇到節流或暫時性錯誤時重試
+
+    等待重試期間不佔用並行名額；Retry-After 會暫停該 provider 的所有新請求。
+    每次嘗試的耗時與結果以 provider、model 為標籤記錄到 metrics。
+    """
+    limiter = get_limiter(provider)
+
+    def before_sleep(retry_state):
+        limiter.record_retry(retry_after(retry_state.outcome.exception()))
+
+    for attempt in Retrying(
+        retry=retry_if_exception(is_throttle),
+        stop=stop_after_attempt(max(1, RETRY_ATTEMPTS)),
+        wait=_retry_wait,
+        before_sleep=before_sleep,
+        reraise=True,
+    ):
+        with attempt:
+            with limiter.slot(characters):
+                started = time.perf_counter()
+                try:
+                    result = function()
+                except Exception as e:
+                    metrics.record_provider_request(
+                        provider, model, time.perf_counter() - started, error_outcome(e), characters
+                    )
+                    raise
+                metrics.record_provider_request(provider, model, time.perf_counter() - started, "ok", characters)
+                return result
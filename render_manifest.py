@@ -0,0 +1,193 @@
+"""
+增量重新生成的 render manifest
+
+每個輸出音頻旁保存一份 JSON manifest，記錄各片段的雜湊（與片段快取鍵相同，涵蓋 provider、模型、
+聲音、語氣與文本）、說話者、聲音設定，以及片段在輸出音頻中的位置與長度。
+重新生成時將新腳本的片段與上次的 manifest 比對，未變更的片段優先從片段快取取得原始音頻，
+快取已淘汰時才從上次輸出切出；只有新增或修改的片段才呼叫 provider。api.py 與 app.py 共用。
+"""
+import json
+import os
+from collections import defaultdict, deque
+from dataclasses import asdict, dataclass, field, fields
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import Callable, Optional
+
+from pydub import AudioSegment
+
+from audio_cache import cache_key, segment_cache
+from audio_decode import PCM_SAMPLE_RATE, decode_audio
+from providers import RenderSettings
+
+MANIFEST_VERSION = 1
+
+
+@dataclass
+class ManifestEntry:
+    """單一片段的雜湊、聲音設定與在輸出音頻中的位置（以 frame 為單位）"""
+
+    key: str
+    speaker: str
+    provider: str
+    model: Optional[str]
+    voice: Optional[str]
+    instructions: Optional[str]
+    characters: int
+    offset_frames: int = 0
+    # None 表示延伸到音頻結尾（單一片段直接輸出、未解碼時無法得知長度）
+    frames: Optional[int] = None
+    reused: bool = False
+
+
+@dataclass
+class RenderManifest:
+    """
+    一次輸出的所有片段
+
+    normalize 為輸出時的音量處理模式；volume_boost 為 gain 模式已套用的增益，
+    lufs 模式輸出的片段已在目標響度，切出後再次正規化結果不變，不需還原。
+    """
+
+    entries: list = field(default_factory=list)
+    frame_rate: Optional[int] = None
+    normalize: str = "gain"
+    volume_boost: float = 0
+    audio_format: str = "mp3"
+    version: int = MANIFEST_VERSION
+
+    @property
+    def reused_segments(self) -> int:
+        return sum(1 for entry in self.entries if entry.reused)
+
+    @property
+    def regenerated_segments(self) -> int:
+        return len(self.entries) - self.reused_segments
+
+    def summary(self) -> str:
+        return f"重用 {self.reused_segments} 段，重新生成 {self.regenerated_segments} 段"
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        # 附上秒數方便閱讀，載入時忽略
+        if self.frame_rate:
+            for entry in data["entries"]:
+                entry["offset_seconds"] = round(entry["offset_frames"] / self.frame_rate, 3)
+                if entry["frames"] is not None:
+                    entry["duration_seconds"] = round(entry["frames"] / self.frame_rate, 3)
+        data["reused_segments"] = self.reused_segments
+        data["regenerated_segments"] = self.regenerated_segments
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RenderManifest":
+        entry_fields = {f.name for f in fields(ManifestEntry)}
+        return cls(
+            entries=[
+                ManifestEntry(**{key: value for key, value in entry.items() if key in entry_fields})
+                for entry in data.get("entries", [])
+            ],
+            frame_rate=data.get("frame_rate"),
+            normalize=data.get("normalize", "gain"),
+            volume_boost=data.get("volume_boost") or 0,
+            audio_format=data.get("audio_format", "mp3"),
+            version=data.get("version", MANIFEST_VERSION),
+        )
+
+    def save(self, path):
+        """先寫入臨時文件再原子替換（相同內容的輸出共用 manifest，可能同時寫入）"""
+        path = Path(path)
+        with NamedTemporaryFile("w", dir=path.parent, delete=False, suffix=".part", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=1)
+        os.replace(f.name, path)
+
+    @classmethod
+    def load(cls, path) -> "RenderManifest":
+        return cls.from_dict(json.loads(Path(path).read_text(encoding="utf-8")))
+
+
+def manifest_path(audio_path) -> Path:
+    """音頻文件對應的 manifest 路徑（同目錄、同檔名，副檔名為 .json）"""
+    return Path(audio_path).with_suffix(".json")
+
+
+def manifest_entry(speaker: str, text: str, settings: RenderSettings) -> ManifestEntry:
+    """單一 (說話者, 文本) 片段的 manifest 項目，位置待組裝後填入"""
+    voice, instructions = settings.for_speaker(speaker)
+    return ManifestEntry(
+        key=cache_key(settings.provider, settings.model, voice, instructions, text),
+        speaker=speaker,
+        provider=settings.provider,
+        model=settings.model,
+        voice=voice,
+        instructions=instructions,
+        characters=len(text),
+    )
+
+
+def plan_manifest(segments: list, settings: RenderSettings, volume_boost: float = 0) -> RenderManifest:
+    """依規劃好的 (說話者, 文本) 片段建立 manifest，位置待組裝後由 record_offsets 填入"""
+    entries = [manifest_entry(speaker, text, settings) for speaker, text in segments]
+    return RenderManifest(entries=entries, volume_boost=volume_boost or 0)
+
+
+def load_previous_render(audio_path) -> Optional[tuple]:
+    """載入上次輸出的 (manifest, 解碼後的 AudioSegment)；文件不存在或版本不符時回傳 None"""
+    audio_path = Path(audio_path)
+    path = manifest_path(audio_path)
+    if not audio_path.is_file() or not path.is_file():
+        return None
+    manifest = RenderManifest.load(path)
+    if manifest.version != MANIFEST_VERSION:
+        return None
+    # PCM 輸出無標頭，取樣率以 manifest 記錄為準
+    frame_rate = manifest.frame_rate or PCM_SAMPLE_RATE
+    return manifest, decode_audio(audio_path.read_bytes(), manifest.audio_format, frame_rate=frame_rate)
+
+
+def segment_reuser(previous: Optional[tuple]) -> Callable[[ManifestEntry], Optional[AudioSegment]]:
+    """
+    回傳 reuse(entry)：依雜湊將片段對應到上次的輸出並標記為重用，需要從上次輸出切出時回傳切出的 AudioSegment
+
+    片段依腳本順序逐一傳入（可邊規劃邊比對）；同一雜湊出現多次時依出現順序配對，因此插入、刪除與搬移片段都能重用。
+    仍在片段快取中的片段不切出（由快取取得原始音頻，避免有損格式重複編碼），回傳 None。
+    切出的音頻已扣除上次的音量增益，與新生成的片段一同組裝後再套用本次增益。
+    """
+    if previous is None:
+        return lambda entry: None
+    previous_manifest, previous_audio = previous
+    available = defaultdict(deque)
+    for entry in previous_manifest.entries:
+        available[entry.key].append(entry)
+
+    scale = previous_audio.frame_rate / previous_manifest.frame_rate if previous_manifest.frame_rate else 1
+    frame_width = previous_audio.frame_width
+
+    def reuse(entry: ManifestEntry) -> Optional[AudioSegment]:
+        candidates = available.get(entry.key)
+        if not candidates:
+            return None
+        match = candidates.popleft()
+        entry.reused = True
+        if segment_cache.contains(entry.key):
+            return None
+        start = round(match.offset_frames * scale) * frame_width
+        end = None if match.frames is None else start + round(match.frames * scale) * frame_width
+        segment = previous_audio._spawn(previous_audio.raw_data[start:end])
+        if previous_manifest.volume_boost:
+            segment = segment - previous_manifest.volume_boost
+        return segment
+
+    return reuse
+
+
+def record_offsets(manifest: RenderManifest, segments: list):
+    """以組裝前（已統一格式）的片段填入各片段的位置與長度"""
+    offset = 0
+    for entry, segment in zip(manifest.entries, segments):
+        frames = len(segment.raw_data) // segment.frame_width
+        entry.offset_frames = offset
+        entry.frames = frames
+        offset += frames
+    if segments:
+        manifest.frame_rate = segments[0].frame_rate
@@ -0,0 +1,157 @@
+"""
+單次生成的各階段耗時與選用的 cProfile 剖析
+
+RenderTrace 記錄解析、各片段合成、解碼、組裝、音量處理、編碼與保存的耗時，
+產生日誌摘要、結構化資料與 Server-Timing 標頭。開啟剖析時，生成執行緒與各片段 worker
+分別以 cProfile 記錄後合併，存成 .prof（可用 snakeviz 等工具開啟）與文字摘要。
+api.py 與 app.py 共用。
+"""
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from functools import wraps
+from pathlib import Path
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROFILE_DIR = os.getenv("TTS_PROFILE_DIR", "./profiles")
+# 只保留最新的剖析結果，避免佔滿磁碟
+PROFILE_MAX_FILES = int(os.getenv("TTS_PROFILE_MAX_FILES", "20"))
+# 文字摘要列出的函數數量（依累計時間排序）
+PROFILE_TOP_FUNCTIONS = 40
+
+STAGE_LABELS = {
+    "parse": "解析",
+    "synthesize": "合成",
+    "decode": "解碼",
+    "first_audio": "首段音頻",
+    "assemble": "組裝",
+    "normalize": "音量",
+    "encode": "編碼",
+    "save": "保存",
+}
+
+# 同一執行緒只啟用一個 profiler（單執行緒合成時 worker 在生成執行緒內執行）
+_profiling = threading.local()
+
+
+def format_seconds(seconds: float) -> str:
+    return f"{seconds * 1000:.0f}ms" if seconds < 1 else f"{seconds:.2f}s"
+
+
+class RenderTrace:
+    """單次生成的階段耗時（執行緒安全）；profile=True 時以 profiled() 包裝的函數會被剖析"""
+
+    def __init__(self, name: str = "render", profile: bool = False):
+        self.name = name
+        self.profile = profile
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stages = {}  # 名稱 → [總秒數, 次數, 最長秒數]，依首次出現順序
+        self._profiles = []
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            stage = self._stages.setdefault(name, [0.0, 0, 0.0])
+            stage[0] += seconds
+            stage[1] += 1
+            stage[2] = max(stage[2], seconds)
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def profiled(self, function):
+        """回傳在 cProfile 下執行 function 的包裝；未開啟剖析時原樣回傳"""
+        if not self.profile:
+            return function
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if getattr(_profiling, "active", False):
+                return function(*args, **kwargs)
+            profiler = cProfile.Profile()
+            _profiling.active = True
+            profiler.enable()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.disable()
+                _profiling.active = False
+                with self._lock:
+                    self._profiles.append(profiler)
+
+        return wrapper
+
+    def as_dict(self) -> dict:
+        """結構化耗時（API 回應使用）"""
+        with self._lock:
+            stages = {
+                name: {"seconds": round(total, 4), "count": count, "max_seconds": round(longest, 4)}
+                for name, (total, count, longest) in self._stages.items()
+            }
+        return {"stages": stages, "total_seconds": round(self.elapsed, 4)}
+
+    def summary(self) -> str:
+        """單行摘要；多次執行的階段（各片段合成、解碼）列出次數、累計與最長耗時"""
+        parts = []
+        with self._lock:
+            stages = list(self._stages.items())
+        for name, (total, count, longest) in stages:
+            label = STAGE_LABELS.get(name, name)
+            if count > 1:
+                parts.append(f"{label} {count} 次 共 {format_seconds(total)}（最長 {format_seconds(longest)}）")
+            else:
+                parts.append(f"{label} {format_seconds(total)}")
+        parts.append(f"總計 {format_seconds(self.elapsed)}")
+        return "｜".join(parts)
+
+    def server_timing(self) -> str:
+        """Server-Timing 標頭（毫秒；多次執行的階段為累計值）"""
+        with self._lock:
+            stages = [(name, total) for name, (total, _, _) in self._stages.items()]
+        stages.append(("total", self.elapsed))
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages)
+
+    def save_profile(self, directory: str = PROFILE_DIR) -> Optional[Path]:
+        """合併各執行緒的剖析結果，存成 .prof 與 .txt，回傳 .prof 路徑；沒有剖析資料時回傳 None"""
+        with self._lock:
+            profiles, self._profiles = self._profiles, []
+        if not profiles:
+            return None
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        stem = f"{time.strftime('%Y%m%d-%H%M%S')}-{self.name}-{os.urandom(3).hex()}"
+
+        stats = pstats.Stats(*profiles)
+        path = directory / f"{stem}.prof"
+        stats.dump_stats(path)
+        report = io.StringIO()
+        pstats.Stats(*profiles, stream=report).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+        (directory / f"{stem}.txt").write_text(f"{self.summary()}\n{report.getvalue()}", encoding="utf-8")
+
+        prune_profiles(directory)
+        return path
+
+    def report(self) -> list:
+        """生成日誌的結尾：耗時摘要，開啟剖析時附上剖析文件位置"""
+        lines = [f"[耗時] {self.summary()}"]
+        if self.profile:
+            path = self.save_profile()
+            if path is not None:
+                lines.append(f"[剖析] {path}（文字摘要: {path.with_suffix('.txt')}）")
+        return lines
+
+
+def prune_profiles(directory, max_files: int = PROFILE_MAX_FILES):
+    """只保留最新的 max_files 份剖析結果（.prof 與同名 .txt）"""
+    profiles = sorted(Path(directory).glob("*.prof"), key=lambda path: path.stat().st_mtime, reverse=True)
+    for path in profiles[max_files:]:
+        path.unlink(missing_ok=True)
+        path.with_suffix(".txt").unlink(missing_ok=True)
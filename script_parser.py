@@ -0,0 +1,149 @@
+"""
+逐行讀取腳本的說話者解析
+
+腳本可為字串、文件物件或任意逐行產出的 iterable，以 generator 逐行解析，不會一次展開成行列表；
+相同說話者的連續文本合併後才產出，過長的合併文本在句子邊界提前產出，記憶體用量與腳本大小無關。
+說話者標記為 speaker-N（任意編號，冒號可為全形）或呼叫端指定的具名說話者（例如聲音對應表的鍵），
+沒有標記的行屬於 speaker-1。api.py 與 app.py 共用。
+"""
+import re
+
+from text_chunker import DIALOGUE_SPEAKER, last_sentence_end
+
+DEFAULT_SPEAKER = "speaker-1"
+# 同一說話者的合併文本超過此長度時，在最後一個句子邊界之前的部分先行產出
+MERGE_MAX_CHARS = 100000
+# 具名說話者的名稱長度上限
+SPEAKER_NAME_MAX_CHARS = 64
+
+_SPEAKER_LABEL = re.compile(r"speaker-(\d+)\s*[:：]", re.IGNORECASE)
+_NAME_SEPARATOR = re.compile(r"[:：]")
+_INVALID_NAME = re.compile(r"[:：\r\n]")
+
+
+def iter_lines(script):
+    """逐行產出腳本內容；字串不會先以 splitlines 展開，bytes 以 UTF-8 解碼"""
+    if isinstance(script, str):
+        start = 0
+        while start < len(script):
+            end = script.find("\n", start)
+            if end < 0:
+                end = len(script)
+            yield script[start:end]
+            start = end + 1
+        return
+    for line in script:
+        yield line.decode("utf-8") if isinstance(line, bytes) else line
+
+
+def speaker_number(speaker: str):
+    """speaker-N 的編號；具名說話者為 None"""
+    match = _SPEAKER_LABEL.fullmatch(f"{speaker}:")
+    return int(match.group(1)) if match else None
+
+
+def normalize_speaker(name: str) -> str:
+    """Speaker-03 之類的寫法統一為 speaker-3，具名說話者原樣回傳"""
+    number = speaker_number(name)
+    return name if number is None else f"speaker-{number}"
+
+
+def speaker_slot(speaker: str, names=()) -> int:
+    """
+    說話者使用的聲音 / 語氣組（0 或 1）
+
+    speaker-N 奇數為第一組、偶數為第二組；具名說話者依在 names 中的順序輪流，未列出的使用第二組。
+    """
+    number = speaker_number(speaker)
+    if number is not None:
+        return (number - 1) % 2
+    named = [name for name in names if speaker_number(name) is None]
+    return named.index(speaker) % 2 if speaker in named else 1
+
+
+def parse_line(line: str, speakers=frozenset()) -> tuple:
+    """解析一行（已去除前後空白），回傳 (speaker, text)；speakers 為可辨識的具名說話者"""
+    match = _SPEAKER_LABEL.match(line)
+    if match:
+        return f"speaker-{int(match.group(1))}", line[match.end():].strip()
+    if speakers:
+        separator = _NAME_SEPARATOR.search(line)
+        if separator and line[:separator.start()].strip() in speakers:
+            return line[:separator.start()].strip(), line[separator.end():].strip()
+    return DEFAULT_SPEAKER, line
+
+
+def parse_script(script, speakers=(), merge_max_chars: int = MERGE_MAX_CHARS):
+    """
+    逐行解析腳本，依序產出合併後的 (speaker, text)
+
+    相同說話者的連續行以空格合併；合併文本超過 merge_max_chars 時，最後一個句子之前的部分先行產出，
+    讓下游在整份腳本解析完之前就能開始合成。
+    """
+    speakers = frozenset(speakers)
+    current_speaker = None
+    pieces = []
+    length = 0
+
+    for line in iter_lines(script):
+        line = line.strip()
+        if not line:
+            continue
+        speaker, text = parse_line(line, speakers)
+        if not text:
+            continue
+
+        # 說話者變了，產出之前的文本
+        if speaker != current_speaker and pieces:
+            yield current_speaker, " ".join(pieces)
+            pieces = []
+            length = 0
+        current_speaker = speaker
+        pieces.append(text)
+        length += len(text) + 1
+
+        if length > merge_max_chars:
+            # 從最後一行往前找句末，保留其後（可能未完）的句子；找不到或未完的句子過長時全部產出，由下游依子句切分
+            head, tail = pieces, []
+            tail_chars = 0
+            for index in range(len(pieces) - 1, -1, -1):
+                end = last_sentence_end(pieces[index])
+                if end:
+                    head = pieces[:index] + [pieces[index][:end]]
+                    tail = [piece for piece in [pieces[index][end:].strip(), *pieces[index + 1:]] if piece]
+                    break
+                tail_chars += len(pieces[index]) + 1
+                if tail_chars > merge_max_chars // 2:
+                    break
+            yield speaker, " ".join(head).strip()
+            pieces = tail
+            length = sum(len(piece) + 1 for piece in tail)
+
+    if pieces:
+        yield current_speaker, " ".join(pieces)
+
+
+def check_voice_map(voice_map: dict) -> dict:
+    """檢查說話者 → 聲音對應表的鍵（不可為空、不可含冒號或換行），不合法時拋出 ValueError；回傳正規化後的對應表"""
+    for name in voice_map:
+        if not isinstance(name, str) or not name.strip() or _INVALID_NAME.search(name):
+            raise ValueError(f"說話者名稱不可為空或包含冒號、換行: {name!r}")
+        if name.strip() == DIALOGUE_SPEAKER:
+            raise ValueError(f"{DIALOGUE_SPEAKER} 為保留名稱，不可作為說話者名稱")
+        if len(name) > SPEAKER_NAME_MAX_CHARS:
+            raise ValueError(f"說話者名稱超過 {SPEAKER_NAME_MAX_CHARS} 字符: {name[:20]}...")
+    return {normalize_speaker(name.strip()): voice for name, voice in voice_map.items()}
+
+
+def parse_voice_map(text: str) -> dict:
+    """解析每行一組的 "名稱=聲音"（Gradio 介面的聲音對應欄位），空行略過；格式錯誤時拋出 ValueError"""
+    voice_map = {}
+    for line in iter_lines(text or ""):
+        line = line.strip()
+        if not line:
+            continue
+        name, separator, voice = line.partition("=")
+        if not separator:
+            raise ValueError(f"聲音對應格式應為 名稱=聲音: {line}")
+        voice_map[name.strip()] = voice.strip() or None
+    return check_voice_map(voice_map)
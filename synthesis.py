@@ -0,0 +1,182 @@
+"""
+腳本片段並行合成工具
+
+以有上限的執行緒池同時送出多個片段的 TTS 請求，並依原始腳本順序回傳結果，
+api.py 與 app.py 共用。
+"""
+import os
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+
+# 各 provider 預設同時請求數（由 providers.register_provider 填入），可用環境變量 TTS_CONCURRENCY_<PROVIDER> 覆寫
+DEFAULT_CONCURRENCY = {}
+# 兩階段 provider（先請求生成、再下載音頻）的同時下載數，可用 TTS_DOWNLOAD_CONCURRENCY_<PROVIDER> 覆寫
+DEFAULT_DOWNLOAD_CONCURRENCY = {}
+# 每個 worker 預先排入的片段數：片段來自 generator 時只預先取用這麼多，限制待產出結果的記憶體
+SEGMENT_LOOKAHEAD = max(1, int(os.getenv("TTS_SEGMENT_LOOKAHEAD", "4")))
+
+_DONE = object()
+
+
+class SegmentSynthesisError(RuntimeError):
+    """某個片段合成失敗，index 為 1 起算的片段序號"""
+
+    def __init__(self, index: int, cause: Exception):
+        self.index = index
+        self.cause = cause
+        super().__init__(f"片段 {index} 生成失敗: {cause}")
+
+
+def get_concurrency(provider: str) -> int:
+    """取得 provider 的同時請求上限"""
+    value = os.getenv(f"TTS_CONCURRENCY_{provider.upper()}")
+    if value is None:
+        value = os.getenv("TTS_CONCURRENCY", DEFAULT_CONCURRENCY.get(provider, 1))
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return DEFAULT_CONCURRENCY.get(provider, 1)
+
+
+def get_download_concurrency(provider: str) -> int:
+    """取得 provider 的同時下載上限；沒有獨立下載階段的 provider 為 0"""
+    default = DEFAULT_DOWNLOAD_CONCURRENCY.get(provider, 0)
+    try:
+        return max(0, int(os.getenv(f"TTS_DOWNLOAD_CONCURRENCY_{provider.upper()}", default)))
+    except ValueError:
+        return default
+
+
+def get_worker_count(provider: str) -> int:
+    """
+    片段 worker 執行緒數：同時請求數加上同時下載數
+
+    下載階段不佔用請求名額，多出的 worker 讓片段 N 下載時，片段 N+1 的生成請求已可送出。
+    """
+    return get_concurrency(provider) + get_download_concurrency(provider)
+
+
+def get_lookahead(max_workers: int) -> int:
+    """同時排入（合成中或已完成待產出）的片段數上限"""
+    return max(1, max_workers) * SEGMENT_LOOKAHEAD
+
+
+def iter_in_order(worker, items, max_workers: int):
+    """
+    並行執行 worker(index, item)，依 items 原始順序逐一產出結果。
+
+    第 N 個結果一完成就會產出，不必等待後續片段；items 可為 generator，只會預先取用
+    get_lookahead(max_workers) 個項目，解析與合成可同時進行，待產出的結果也不會無限累積。
+    任一片段失敗或呼叫端提前關閉 generator 時，取消尚未開始的片段。失敗時拋出帶有片段序號的 SegmentSynthesisError。
+    """
+    items = iter(items)
+    head = list(islice(items, 2))
+    if max_workers <= 1 or len(head) <= 1:
+        for index, item in enumerate(chain(head, items), 1):
+            try:
+                result = worker(index, item)
+            except SegmentSynthesisError:
+                raise
+            except Exception as e:
+                raise SegmentSynthesisError(index, e) from e
+            yield result
+        return
+
+    items = enumerate(chain(head, items), 1)
+    lookahead = get_lookahead(max_workers)
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts-segment")
+    futures = deque()
+
+    def submit():
+        while len(futures) < lookahead:
+            entry = next(items, _DONE)
+            if entry is _DONE:
+                return
+            index, item = entry
+            futures.append((index, pool.submit(worker, index, item)))
+
+    try:
+        submit()
+        while futures:
+            index, future = futures.popleft()
+            try:
+                result = future.result()
+            except SegmentSynthesisError:
+                raise
+            except Exception as e:
+                raise SegmentSynthesisError(index, e) from e
+            submit()
+            yield result
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def map_in_order(worker, items, max_workers: int) -> list:
+    """
+    並行執行 worker(index, item)，並依 items 原始順序回傳結果。
+
+    任一片段失敗時取消尚未開始的片段，並拋出帶有片段序號的 SegmentSynthesisError。
+    """
+    return list(iter_in_order(worker, items, max_workers))
+
+
+def iter_parts_in_order(worker, items, max_workers: int):
+    """
+    並行執行 worker(index, item, emit)，worker 以 emit(part) 逐段交出結果；依 items 原始順序產出 (index, part)。
+
+    目前輪到的片段每交出一段就立即產出，後續片段先行合成並緩衝；片段結束時產出 (index, None)。
+    items 可為 generator，與 iter_in_order 相同只預先取用 get_lookahead(max_workers) 個項目。
+    任一片段失敗或呼叫端提前關閉 generator 時，取消尚未開始的片段，並丟棄進行中片段之後交出的結果。
+    失敗時拋出帶有片段序號的 SegmentSynthesisError。
+    """
+    items = enumerate(items, 1)
+    lookahead = get_lookahead(max_workers)
+    closed = False
+
+    def run(index: int, item, parts: queue.Queue):
+        def emit(part):
+            if not closed:
+                parts.put(part)
+
+        try:
+            worker(index, item, emit)
+        except SegmentSynthesisError as e:
+            parts.put(e)
+        except BaseException as e:
+            error = SegmentSynthesisError(index, e)
+            error.__cause__ = e
+            parts.put(error)
+        else:
+            parts.put(_DONE)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="tts-segment")
+    pending = deque()
+
+    def submit():
+        while len(pending) < lookahead:
+            entry = next(items, _DONE)
+            if entry is _DONE:
+                return
+            index, item = entry
+            parts = queue.Queue()
+            pending.append((index, parts))
+            pool.submit(run, index, item, parts)
+
+    try:
+        submit()
+        while pending:
+            index, parts = pending.popleft()
+            submit()
+            while True:
+                part = parts.get()
+                if part is _DONE:
+                    break
+                if isinstance(part, SegmentSynthesisError):
+                    raise part
+                yield index, part
+            yield index, None
+    finally:
+        closed = True
+        pool.shutdown(wait=False, cancel_futures=True)
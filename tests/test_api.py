@@ -0,0 +1,33 @@
+"""/generate-audio 的錯誤回應"""
+import pytest
+from fastapi.testclient import TestClient
+
+import api
+from audio_store import AudioStore
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    store = AudioStore(str(tmp_path), janitor_seconds=3600)
+    monkeypatch.setattr(api, "audio_store", store)
+    yield TestClient(api.app)
+    store.stop()
+
+
+@pytest.mark.parametrize("render_mode", ["memory", "stream"])
+def test_segment_failure_keeps_its_status_and_detail(client, monkeypatch, tmp_path, render_mode):
+    def fetch_segment_audio(settings, speaker, text, cache_stats=None):
+        raise RuntimeError("provider down")
+
+    monkeypatch.setattr(api, "fetch_segment_audio", fetch_segment_audio)
+    response = client.post("/generate-audio", json={
+        "script": "speaker-1: 你好。\nspeaker-2: 再見。",
+        "provider": "openai",
+        "api_key": "sk-test",
+        "render_mode": render_mode,
+    })
+    assert response.status_code == 500
+    # generate_audio_from_script 拋出的 HTTPException 原樣回傳，不再包一層「生成音頻時發生錯誤」
+    assert response.json()["detail"] == "無法生成音頻: 片段 1 生成失敗: provider down"
+    assert not list(tmp_path.glob("*.part"))
+
@@ -0,0 +1,177 @@
+"""audio_cache 的單一生成（single-flight）、記憶體 LRU 與磁碟層"""
+import threading
+
+import pytest
+
+import audio_cache
+from audio_cache import CacheStats, SegmentCache, cache_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SegmentCache(cache_dir=str(tmp_path), memory_bytes=30, disk_bytes=1024, max_age_seconds=3600, enabled=True)
+
+
+def test_cache_key_ignores_whitespace_differences():
+    assert cache_key("openai", "m", "v", None, "你好，  世界\n") == cache_key("openai", "m", "v", "", "你好， 世界")
+    assert cache_key("openai", "m", "v", None, "你好") != cache_key("openai", "m", "v2", None, "你好")
+    assert cache_key("openai", "m", "v", None, "你好") != cache_key("openai", "m", "v", None, "你好", "opus")
+
+
+# ---- single-flight ----
+
+def test_concurrent_requests_for_same_key_create_once(cache):
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def create():
+        calls.append(threading.get_ident())
+        started.set()
+        release.wait(5)
+        return b"audio"
+
+    stats = CacheStats()
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_create("k", create, stats)))
+        for _ in range(4)
+    ]
+    threads[0].start()
+    assert started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    # 讓其他執行緒在生成期間送出請求（較晚到的執行緒會命中記憶體層，結果相同）
+    threading.Event().wait(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert results == [b"audio"] * 4
+    assert (stats.misses, stats.memory_hits) == (1, 3)
+    assert cache._inflight == {}
+
+
+def test_failed_creation_reaches_waiters_and_is_not_cached(cache):
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise RuntimeError("provider down")
+
+    errors = []
+
+    def request():
+        try:
+            cache.get_or_create("k", failing)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    first = threading.Thread(target=request)
+    first.start()
+    assert started.wait(5)
+    second = threading.Thread(target=request)
+    second.start()
+    threading.Event().wait(0.2)
+    release.set()
+    first.join(5)
+    second.join(5)
+
+    assert errors == ["provider down"] * 2
+    assert cache.get("k") is None
+    assert cache.get_or_create("k", lambda: b"retry") == b"retry"
+
+
+# ---- 記憶體 LRU ----
+
+def test_memory_lru_evicts_least_recently_used_at_size_limit(cache):
+    for key in ("a", "b", "c"):
+        cache.put(key, key.encode() * 10)
+    assert list(cache._memory) == ["a", "b", "c"]
+    assert cache._memory_size == 30
+
+    # 讀取 a 之後 b 成為最久未使用
+    assert cache.get("a") == b"a" * 10
+    cache.put("d", b"d" * 10)
+    assert list(cache._memory) == ["c", "a", "d"]
+    assert cache._memory_size == 30
+
+    # 超過記憶體上限的項目只寫入磁碟
+    cache.put("big", b"x" * 31)
+    assert "big" not in cache._memory
+    assert cache.get("big") == b"x" * 31
+
+
+def test_evicted_entry_is_served_from_disk(cache):
+    for key in ("a", "b", "c", "d"):
+        cache.put(key, key.encode() * 10)
+    assert "a" not in cache._memory
+
+    stats = CacheStats()
+    assert cache.get("a", stats) == b"a" * 10
+    assert (stats.memory_hits, stats.disk_hits) == (0, 1)
+    # 從磁碟讀出後放回記憶體層
+    assert cache.get("a", stats) == b"a" * 10
+    assert (stats.memory_hits, stats.disk_hits) == (1, 1)
+
+
+# ---- 磁碟層 ----
+
+def test_cleared_memory_falls_back_to_disk(cache, tmp_path):
+    cache.put("k", b"audio")
+    with cache._lock:
+        cache._memory.clear()
+        cache._memory_size = 0
+
+    stats = CacheStats()
+    assert cache.get_or_create("k", lambda: pytest.fail("不應重新生成"), stats) == b"audio"
+    assert (stats.disk_hits, stats.misses) == (1, 0)
+
+    # 重新啟動（新的快取物件）時由磁碟重建索引
+    restarted = SegmentCache(cache_dir=str(tmp_path), memory_bytes=30, disk_bytes=1024, enabled=True)
+    assert restarted.contains("k")
+    assert restarted.get("k") == b"audio"
+    assert restarted.stats.disk_hits == 1
+
+
+def test_disk_entries_expire_by_age(cache, clock, monkeypatch):
+    monkeypatch.setattr(audio_cache, "time", clock)
+    cache.put("k", b"audio")
+    with cache._lock:
+        cache._memory.clear()
+        cache._memory_size = 0
+
+    clock.advance(3599)
+    assert cache.contains("k")
+    clock.advance(2)
+    assert not cache.contains("k")
+    assert cache.get("k") is None
+    assert not cache._path("k").exists()
+
+
+def test_disk_evicts_least_recently_accessed_over_size(tmp_path, clock, monkeypatch):
+    monkeypatch.setattr(audio_cache, "time", clock)
+    cache = SegmentCache(cache_dir=str(tmp_path), memory_bytes=0, disk_bytes=25, max_age_seconds=3600, enabled=True)
+    cache.put("a", b"a" * 10)
+    clock.advance(1)
+    cache.put("b", b"b" * 10)
+    clock.advance(1)
+    assert cache.get("a") == b"a" * 10
+    clock.advance(1)
+    cache.put("c", b"c" * 10)
+
+    assert sorted(cache._disk_index) == ["a", "c"]
+    assert cache._disk_size == 20
+    assert not cache._path("b").exists()
+
+
+def test_disabled_cache_always_creates(tmp_path):
+    cache = SegmentCache(cache_dir=str(tmp_path), enabled=False)
+    calls = []
+    for _ in range(2):
+        cache.get_or_create("k", lambda: calls.append(1) or b"audio")
+    assert len(calls) == 2
+    assert not any(tmp_path.iterdir())
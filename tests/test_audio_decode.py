@@ -0,0 +1,80 @@
+"""audio_decode 的合併解碼：結果與逐一解碼相同，且全程經管線、不寫入臨時文件"""
+import os
+import subprocess
+import tempfile
+
+import numpy as np
+import pytest
+from pydub import AudioSegment
+from pydub.exceptions import CouldntDecodeError
+
+import audio_decode
+
+CODECS = {"mp3": ("mp3", "libmp3lame"), "opus": ("ogg", "libopus"), "aac": ("adts", "aac")}
+
+
+def encode(audio_format: str, frame_rate: int, channels: int, seconds: float) -> bytes:
+    """以 ffmpeg 將正弦波編碼為指定格式"""
+    t = np.arange(int(frame_rate * seconds)) / frame_rate
+    pcm = (np.sin(2 * np.pi * 440 * t) * 8000).astype("<i2")
+    if channels == 2:
+        pcm = np.repeat(pcm, 2)
+    muxer, codec = CODECS[audio_format]
+    command = [
+        AudioSegment.converter, "-v", "error",
+        "-f", "s16le", "-ar", str(frame_rate), "-ac", str(channels), "-i", "pipe:0",
+        "-c:a", codec, "-f", muxer, "pipe:1",
+    ]
+    return subprocess.run(command, input=pcm.tobytes(), capture_output=True, check=True).stdout
+
+
+@pytest.fixture(scope="module")
+def items():
+    return [
+        (encode("mp3", 24000, 1, 1.3), "mp3"),
+        (encode("mp3", 44100, 2, 0.7), "mp3"),
+        (encode("opus", 48000, 1, 0.9), "opus"),
+        (encode("aac", 24000, 1, 1.1), "aac"),
+        # 約 6 MB 的 PCM 輸出，超過管線緩衝區
+        (encode("mp3", 44100, 2, 40), "mp3"),
+    ]
+
+
+@pytest.fixture
+def no_temp_files(monkeypatch):
+    def forbidden(*args, **kwargs):
+        raise AssertionError("解碼不應寫入臨時文件")
+
+    for name in ("mkstemp", "mkdtemp", "TemporaryDirectory", "NamedTemporaryFile", "TemporaryFile"):
+        monkeypatch.setattr(tempfile, name, forbidden)
+
+
+def test_batch_matches_single_decode(items, no_temp_files):
+    expected = [audio_decode.decode_with_ffmpeg(data, audio_format) for data, audio_format in items]
+    decoded = audio_decode.decode_batch(items)
+    assert len(decoded) == len(items)
+    for segment, single in zip(decoded, expected):
+        assert (segment.frame_rate, segment.channels, segment.sample_width) == (
+            single.frame_rate, single.channels, single.sample_width
+        )
+        assert segment.raw_data == single.raw_data
+
+
+def test_batch_does_not_leak_file_descriptors(items):
+    before = len(os.listdir("/proc/self/fd"))
+    for _ in range(5):
+        audio_decode.decode_batch(items[:4])
+    with pytest.raises(CouldntDecodeError):
+        audio_decode.decode_batch([items[0], (b"not audio" * 100, "mp3")])
+    assert len(os.listdir("/proc/self/fd")) == before
+
+
+def test_batch_decoder_isolates_undecodable_audio(items):
+    futures = [
+        audio_decode.submit_audio(*items[0]),
+        audio_decode.submit_audio(b"not audio" * 100, "mp3"),
+        audio_decode.submit_audio(*items[3]),
+    ]
+    assert futures[0].result().raw_data == audio_decode.decode_with_ffmpeg(*items[0]).raw_data
+    assert isinstance(futures[1].exception(), CouldntDecodeError)
+    assert futures[2].result().raw_data == audio_decode.decode_with_ffmpeg(*items[3]).raw_data
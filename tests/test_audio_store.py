@@ -0,0 +1,142 @@
+"""audio_store 的內容定址保存、對外提供的檔名與 janitor 依保留期限及 LRU 淘汰"""
+import threading
+
+import pytest
+
+import audio_store
+from audio_store import AudioStore, content_hash
+
+
+@pytest.fixture
+def fake_time(monkeypatch, clock):
+    monkeypatch.setattr(audio_store, "time", clock)
+    return clock
+
+
+def make_store(directory, **options) -> AudioStore:
+    """janitor 啟動時先整理並清理一次，等它完成後才開始測試（之後一小時內不再執行）"""
+    options.setdefault("max_bytes", 1024)
+    options.setdefault("max_age_seconds", 3600)
+    store = AudioStore(str(directory), janitor_seconds=3600, suffixes={".mp3", ".wav"}, **options)
+    store.start()
+    for _ in range(500):
+        if store.last_sweep is not None:
+            break
+        threading.Event().wait(0.01)
+    assert store.last_sweep is not None
+    return store
+
+
+@pytest.fixture
+def store(tmp_path, fake_time):
+    store = make_store(tmp_path)
+    yield store
+    store.stop()
+
+
+def indexed(store: AudioStore) -> list:
+    with store._lock:
+        return [name for (name,) in store._connect().execute("SELECT name FROM outputs ORDER BY accessed")]
+
+
+def test_is_output_only_accepts_managed_file_names(store):
+    name = store.save(b"audio", "mp3").name
+    assert store.is_output(name)
+    assert store.is_output("0123.wav")
+    # 索引、manifest、寫入中的暫存文件與未納入管理的副檔名
+    for file_name in ("index.sqlite3", name.replace(".mp3", ".json"), "tmpabc.part", "notes.txt", "noext"):
+        assert not store.is_output(file_name)
+    # 路徑穿越與子目錄
+    for file_name in (f"../{name}", f"sub/{name}", "/etc/passwd.mp3"):
+        assert not store.is_output(file_name)
+
+
+def test_save_is_content_addressed_and_deduplicated(store, fake_time):
+    path = store.save(b"audio", "mp3")
+    assert path.name == f"{content_hash(b'audio')}.mp3"
+    assert path.read_bytes() == b"audio"
+
+    fake_time.advance(10)
+    assert store.save(b"audio", "mp3") == path
+    assert store.info()["entries"] == 1
+    assert not list(store.directory.glob("*.part"))
+
+
+def test_save_writes_outside_the_store_lock(store, monkeypatch):
+    writes = []
+    original = audio_store.NamedTemporaryFile
+
+    def checked(*args, **kwargs):
+        writes.append(store._lock.locked())
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(audio_store, "NamedTemporaryFile", checked)
+    store.save(b"x" * 100, "mp3")
+    assert writes == [False]
+
+
+def test_save_rewrites_output_evicted_after_the_existence_check(store, monkeypatch):
+    path = store.save(b"audio", "mp3")
+    commit = store._commit
+
+    def evict_first(*args):
+        # 模擬 janitor 在存在檢查與登記之間刪除文件
+        monkeypatch.setattr(store, "_commit", commit)
+        with store._lock:
+            store._remove(path.name)
+        return commit(*args)
+
+    monkeypatch.setattr(store, "_commit", evict_first)
+    assert store.save(b"audio", "mp3") == path
+    assert path.read_bytes() == b"audio"
+    assert indexed(store) == [path.name]
+
+
+def test_sweep_removes_outputs_past_max_age(store, fake_time):
+    old = store.save(b"old", "mp3")
+    old.with_suffix(".json").write_text("{}")
+    fake_time.advance(3000)
+    recent = store.save(b"recent", "mp3")
+    fake_time.advance(601)
+
+    assert store.sweep() == 1
+    assert not old.exists() and not old.with_suffix(".json").exists()
+    assert recent.exists()
+    assert indexed(store) == [recent.name]
+
+
+def test_sweep_evicts_least_recently_accessed_over_max_bytes(tmp_path, fake_time):
+    store = make_store(tmp_path, max_bytes=250)
+    paths = {}
+    for name in ("a", "b", "c"):
+        paths[name] = store.save(name.encode() * 100, "mp3")
+        fake_time.advance(1)
+    # 存取 a 之後 b 成為最久未使用
+    store.touch(paths["a"].name)
+    fake_time.advance(1)
+
+    assert store.sweep() == 1
+    assert not paths["b"].exists()
+    assert indexed(store) == [paths["c"].name, paths["a"].name]
+    assert store.info()["bytes"] == 200
+    store.stop()
+
+
+def test_janitor_reconciles_and_sweeps_on_start(tmp_path, fake_time):
+    store = make_store(tmp_path)
+    expired = store.save(b"expired", "mp3")
+    kept = store.save(b"kept", "mp3")
+    store.stop()
+    # 索引建立前就存在的輸出以修改時間補登
+    unindexed = tmp_path / "legacy.wav"
+    unindexed.write_bytes(b"legacy")
+    with store._lock:
+        store._connect().execute(
+            "UPDATE outputs SET accessed = ? WHERE name = ?", (fake_time.time() - 7200, expired.name)
+        )
+
+    restarted = make_store(tmp_path)
+    assert not expired.exists()
+    assert kept.exists() and unindexed.exists()
+    assert sorted(indexed(restarted)) == sorted([kept.name, unindexed.name])
+    restarted.stop()
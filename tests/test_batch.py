@@ -0,0 +1,71 @@
+"""批次生成的跨腳本去重：共用的片段只呼叫一次 provider，各腳本的輸出都包含該片段"""
+import numpy as np
+import pytest
+from pydub import AudioSegment
+
+import api
+from audio_store import AudioStore
+from batch import plan_batch
+from providers import RenderSettings
+
+FRAME_RATE = 24000
+SETTINGS = RenderSettings(provider="openai", model="tts", voices=("alloy", "nova"))
+SHARED = "speaker-1: 歡迎收聽本週的節目。"
+SCRIPTS = [
+    f"{SHARED}\nspeaker-2: 今天聊聊天氣。",
+    f"speaker-2: 先說說新聞。\n{SHARED}",
+]
+
+
+def pcm(text: str) -> bytes:
+    """以文本決定取樣值與長度的假 provider 音頻"""
+    value = 100 + sum(text.encode()) % 1000
+    return np.full(2400 + 10 * len(text), value, dtype="<i2").tobytes()
+
+
+@pytest.fixture
+def provider(monkeypatch, tmp_path):
+    texts = []
+
+    def fetch_segment_audio(settings, speaker, text, cache_stats=None):
+        texts.append(text)
+        return pcm(text)
+
+    def decode_segment_audio(provider_name, data, audio_format=None):
+        return AudioSegment(data, frame_rate=FRAME_RATE, sample_width=2, channels=1)
+
+    monkeypatch.setattr(api, "fetch_segment_audio", fetch_segment_audio)
+    monkeypatch.setattr(api, "decode_segment_audio", decode_segment_audio)
+    store = AudioStore(str(tmp_path), janitor_seconds=3600)
+    monkeypatch.setattr(api, "audio_store", store)
+    yield texts
+    store.stop()
+
+
+def test_plan_batch_deduplicates_shared_segments():
+    plan = plan_batch([[("speaker-1", "a"), ("speaker-2", "b")], [("speaker-2", "c"), ("speaker-1", "a")]], SETTINGS)
+    assert plan.unique == [("speaker-1", "a"), ("speaker-2", "b"), ("speaker-2", "c")]
+    assert plan.keys == [[0, 1], [2, 0]]
+    assert plan.uses == [2, 1, 1]
+    assert (plan.total_segments, plan.ready_after(0), plan.ready_after(1)) == (4, 1, 2)
+
+    # 聲音不同的說話者說同一句話仍是不同片段
+    plan = plan_batch([[("speaker-1", "a")], [("speaker-2", "a")]], SETTINGS)
+    assert len(plan.unique) == 2
+
+
+def test_shared_line_is_synthesized_once_and_used_by_both_scripts(provider):
+    results, summary = api.generate_batch(SCRIPTS, SETTINGS, normalize="none", audio_format="wav")
+
+    assert sorted(provider) == sorted(["歡迎收聽本週的節目。", "今天聊聊天氣。", "先說說新聞。"])
+    assert provider.count("歡迎收聽本週的節目。") == 1
+    assert (summary["segments"], summary["unique_segments"], summary["provider_calls_saved"]) == (4, 3, 1)
+
+    expected = [
+        pcm("歡迎收聽本週的節目。") + pcm("今天聊聊天氣。"),
+        pcm("先說說新聞。") + pcm("歡迎收聽本週的節目。"),
+    ]
+    for result, data in zip(results, expected):
+        assert result["status"] == "success"
+        output = AudioSegment.from_wav(str(api.audio_store.path(result["file_name"])))
+        assert output.raw_data == data
@@ -0,0 +1,77 @@
+"""loudness 的 BS.1770 響度量測與 true peak 限幅，以已知響度的參考訊號驗證"""
+import numpy as np
+import pytest
+from pydub import AudioSegment
+
+from loudness import OVERSAMPLING, measure_loudness, normalize_audio
+
+# int16 取整可能讓峰值超出上限約 0.002 dB
+QUANTIZATION_DB = 0.01
+
+
+def sine(frequency: float, peak_dbfs: float, seconds: float = 5, channels: int = 1,
+         frame_rate: int = 48000, phase: float = 0) -> AudioSegment:
+    t = np.arange(int(frame_rate * seconds)) / frame_rate
+    samples = np.rint(10 ** (peak_dbfs / 20) * 32767 * np.sin(2 * np.pi * frequency * t + phase)).astype("<i2")
+    return AudioSegment(
+        np.repeat(samples, channels).tobytes(), frame_rate=frame_rate, sample_width=2, channels=channels
+    )
+
+
+def oversampled_peak_db(segment: AudioSegment) -> float:
+    """以頻域補零做 4 倍超取樣（帶限內插）量測峰值，與 loudness 的內插濾波器無關"""
+    samples = np.frombuffer(bytes(segment.raw_data), dtype="<i2").reshape(-1, segment.channels) / 32768
+    upsampled = np.fft.irfft(np.fft.rfft(samples, axis=0), len(samples) * OVERSAMPLING, axis=0) * OVERSAMPLING
+    return 20 * np.log10(np.abs(upsampled).max())
+
+
+# EBU Tech 3341：1 kHz 正弦波，兩聲道峰值 -23 dBFS 時為 -23 LUFS；單聲道少 3.01 LU
+@pytest.mark.parametrize("frame_rate", [48000, 44100, 24000])
+@pytest.mark.parametrize("channels, peak_dbfs, expected", [(2, -23, -23.0), (2, -3, -3.0), (1, -20, -23.01)])
+def test_1khz_sine_measures_reference_loudness(frame_rate, channels, peak_dbfs, expected):
+    segment = sine(1000, peak_dbfs, channels=channels, frame_rate=frame_rate)
+    assert measure_loudness(segment)["integrated_lufs"] == pytest.approx(expected, abs=0.5)
+    _, report = normalize_audio(segment, "lufs", target_lufs=-16)
+    assert report.input_lufs == pytest.approx(expected, abs=0.5)
+
+
+def test_lufs_mode_reaches_target_loudness():
+    segment = sine(1000, -30, channels=2)
+    normalized, report = normalize_audio(segment, "lufs", target_lufs=-16, true_peak_dbtp=-1)
+    assert report.limited_blocks == 0
+    assert measure_loudness(normalized)["integrated_lufs"] == pytest.approx(-16, abs=0.5)
+
+
+def test_silence_is_left_unchanged():
+    silence = AudioSegment.silent(duration=1000, frame_rate=48000)
+    normalized, report = normalize_audio(silence, "lufs")
+    assert normalized.raw_data == silence.raw_data
+    assert report.input_lufs is None
+
+
+@pytest.mark.parametrize("ceiling", [-1.0, -2.0])
+def test_limiter_keeps_oversampled_peak_below_ceiling(ceiling):
+    # fs/4 的 45° 正弦波：樣本只到峰值的 0.707，樣本間峰值高出 3 dB
+    intersample = sine(12000, -12, seconds=2, phase=np.pi / 4)
+    speech = sine(997, -6, seconds=2) + sine(220, -3, seconds=1)
+    segment = intersample + speech
+    assert oversampled_peak_db(intersample) > intersample.max_dBFS + 2.9
+
+    # 各片段分別拉到 0 LUFS：正弦波的樣本峰值約 -3 dBFS，只看樣本峰值不會限幅，樣本間峰值卻超過上限
+    normalized, report = normalize_audio(
+        segment, "lufs", segment_starts=[0, len(intersample.raw_data) // 2], target_lufs=0, true_peak_dbtp=ceiling
+    )
+    assert report.limited_blocks > 0
+    assert report.clipped_samples == 0
+    assert oversampled_peak_db(normalized) <= ceiling + QUANTIZATION_DB
+    assert measure_loudness(normalized)["true_peak_dbtp"] <= ceiling + QUANTIZATION_DB
+
+
+def test_gain_mode_applies_fixed_gain_and_counts_clipping():
+    segment = sine(1000, -12)
+    boosted, report = normalize_audio(segment, "gain", volume_boost=6)
+    assert oversampled_peak_db(boosted) == pytest.approx(-6, abs=0.05)
+    assert report.clipped_samples == 0
+
+    _, report = normalize_audio(segment, "gain", volume_boost=18)
+    assert report.clipped_samples > 0
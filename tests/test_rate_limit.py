@@ -0,0 +1,210 @@
+"""rate_limit 的令牌桶、AIMD 並行上限與 429 重試（以假時鐘取代 time，不實際等待）"""
+import email.utils
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limit
+from rate_limit import AdaptiveConcurrency, TokenBucket, call_with_retry, get_limiter, is_throttle, retry_after
+
+PROVIDER = "fake"
+
+
+class HTTPError(Exception):
+    """仿 openai / requests 例外：帶 status_code 與 response.headers"""
+
+    def __init__(self, status_code: int, headers: dict = None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+@pytest.fixture(autouse=True)
+def fake_time(monkeypatch, clock):
+    monkeypatch.setattr(rate_limit, "time", clock)
+    # tenacity 的重試等待經 tenacity.nap.sleep 呼叫 time.sleep
+    monkeypatch.setattr("tenacity.nap.time", clock)
+    # Retry-After 的抖動固定為 0.25 秒
+    monkeypatch.setattr(rate_limit, "random", SimpleNamespace(uniform=lambda low, high: 0.25))
+    monkeypatch.setattr(rate_limit, "_limiters", {})
+    monkeypatch.setattr(rate_limit, "RETRY_ATTEMPTS", 5)
+    monkeypatch.setenv(f"TTS_CONCURRENCY_{PROVIDER.upper()}", "8")
+    monkeypatch.setenv(f"TTS_RPM_{PROVIDER.upper()}", "0")
+    monkeypatch.setenv(f"TTS_CPM_{PROVIDER.upper()}", "0")
+    return clock
+
+
+def calls(*outcomes):
+    """依序回傳或拋出 outcomes 的函式，呼叫次數記錄在 .count"""
+    def function():
+        outcome = outcomes[function.count]
+        function.count += 1
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    function.count = 0
+    return function
+
+
+# ---- 令牌桶 ----
+
+def test_token_bucket_allows_a_minute_of_burst_then_blocks(clock):
+    bucket = TokenBucket(60)
+    assert [bucket.take() for _ in range(60)] == [0.0] * 60
+    assert clock.sleeps == []
+
+    # 每秒補充 1 個令牌，第 61 個請求等待 1 秒
+    assert bucket.take() == pytest.approx(1.0)
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+
+def test_token_bucket_refills_up_to_capacity(clock):
+    bucket = TokenBucket(120)
+    bucket.take(120)
+    clock.advance(15)
+    assert bucket.available() == pytest.approx(30)
+    assert bucket.take(30) == 0.0
+    assert bucket.take(4) == pytest.approx(2.0)
+
+    # 閒置再久也只補滿一分鐘的量
+    clock.advance(3600)
+    assert bucket.available() == pytest.approx(120)
+
+
+def test_token_bucket_caps_large_requests_and_zero_is_unlimited(clock):
+    # 單次超過容量的請求（例如很長的片段）只扣到容量為止，不會永遠等待
+    bucket = TokenBucket(100)
+    assert bucket.take(500) == 0.0
+    assert bucket.take(50) == pytest.approx(30.0)
+
+    unlimited = TokenBucket(0)
+    assert all(unlimited.take(1000) == 0.0 for _ in range(100))
+
+
+# ---- AIMD 並行上限 ----
+
+def test_throttle_halves_limit_once_per_cooldown(clock):
+    concurrency = AdaptiveConcurrency(8)
+    concurrency.on_throttle()
+    assert concurrency.limit == 4
+    # 同一波 429 只減半一次
+    concurrency.on_throttle()
+    assert concurrency.limit == 4
+
+    clock.advance(rate_limit.THROTTLE_COOLDOWN_SECONDS)
+    concurrency.on_throttle()
+    assert concurrency.limit == 2
+    for _ in range(3):
+        clock.advance(rate_limit.THROTTLE_COOLDOWN_SECONDS)
+        concurrency.on_throttle()
+    assert concurrency.limit == 1
+
+
+def test_success_recovers_limit_additively(clock):
+    concurrency = AdaptiveConcurrency(8)
+    concurrency.on_throttle()
+    assert concurrency.limit == 4
+
+    # 每次成功加 1/上限，約每輪（上限個成功）加 1
+    steps = []
+    successes = 0
+    while concurrency.limit < 8:
+        before = int(concurrency.limit)
+        concurrency.on_success()
+        successes += 1
+        if int(concurrency.limit) != before:
+            steps.append(int(concurrency.limit))
+    assert steps == [5, 6, 7, 8]
+    # 上限從 n 加到 n+1 需要 n 到 n+1 次成功
+    assert sum(range(4, 8)) <= successes <= sum(range(5, 9))
+    concurrency.on_success()
+    assert concurrency.limit == 8
+
+
+def test_acquire_blocks_at_limit():
+    concurrency = AdaptiveConcurrency(2)
+    concurrency.on_throttle()
+    assert int(concurrency.limit) == 1
+    concurrency.acquire()
+
+    acquired = threading.Event()
+
+    def second():
+        concurrency.acquire()
+        acquired.set()
+
+    thread = threading.Thread(target=second, daemon=True)
+    thread.start()
+    assert not acquired.wait(0.1)
+    concurrency.release()
+    assert acquired.wait(2)
+    concurrency.release()
+    thread.join(2)
+    assert concurrency.in_flight == 0
+
+
+# ---- 重試 ----
+
+def test_retry_after_is_honored(clock):
+    function = calls(HTTPError(429, {"retry-after": "3"}), "ok")
+    assert call_with_retry(PROVIDER, function, characters=10) == "ok"
+    assert function.count == 2
+    # 等待 Retry-After 加上抖動，期間該 provider 的新請求也暫停，不另外等待
+    assert clock.sleeps == [pytest.approx(3.25)]
+
+    limiter = get_limiter(PROVIDER)
+    assert (limiter.retries, limiter.throttled, limiter.successes) == (1, 1, 1)
+    # 429 時減半為 4，重試成功後加 1/4
+    assert limiter.concurrency.limit == pytest.approx(4.25)
+
+
+def test_retry_after_pauses_other_requests(clock):
+    limiter = get_limiter(PROVIDER)
+    limiter.record_retry(5)
+    with limiter.slot():
+        pass
+    assert clock.sleeps == [pytest.approx(5)]
+
+
+def test_retry_after_formats(clock):
+    assert retry_after(HTTPError(429, {"retry-after": "7"})) == 7
+    assert retry_after(HTTPError(429, {"retry-after-ms": "1500"})) == 1.5
+    date = email.utils.formatdate(clock.time() + 10, usegmt=True)
+    assert retry_after(HTTPError(503, {"retry-after": date})) == pytest.approx(10)
+    assert retry_after(HTTPError(429)) is None
+    assert retry_after(HTTPError(429, {"retry-after": "soon"})) is None
+
+
+def test_throttle_without_retry_after_uses_backoff(clock, monkeypatch):
+    monkeypatch.setattr(rate_limit, "RETRY_ATTEMPTS", 3)
+    function = calls(HTTPError(503), HTTPError(503), HTTPError(503))
+    with pytest.raises(HTTPError):
+        call_with_retry(PROVIDER, function)
+    assert function.count == 3
+    assert len(clock.sleeps) == 2
+    assert all(0 <= seconds <= rate_limit.RETRY_MAX_WAIT for seconds in clock.sleeps)
+    assert get_limiter(PROVIDER).retries == 2
+
+
+@pytest.mark.parametrize("error", [ValueError("bad input"), HTTPError(400), HTTPError(401), HTTPError(404)])
+def test_non_retryable_errors_are_not_retried(clock, error):
+    function = calls(error, "ok")
+    with pytest.raises(type(error)):
+        call_with_retry(PROVIDER, function)
+    assert function.count == 1
+    assert clock.sleeps == []
+    limiter = get_limiter(PROVIDER)
+    assert (limiter.retries, limiter.throttled) == (0, 0)
+    assert limiter.concurrency.limit == 8
+
+
+def test_aws_throttling_error_is_retryable():
+    error = Exception("throttled")
+    error.response = {
+        "Error": {"Code": "ThrottlingException"},
+        "ResponseMetadata": {"HTTPStatusCode": 400, "HTTPHeaders": {"retry-after": "2"}},
+    }
+    assert is_throttle(error)
+    assert retry_after(error) == 2
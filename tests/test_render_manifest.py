@@ -0,0 +1,137 @@
+"""render_manifest 的增量重新生成：片段依雜湊配對、從上次輸出切出正確的取樣範圍"""
+from concurrent.futures import Future
+
+import numpy as np
+import pytest
+from pydub import AudioSegment
+
+import api
+import render_manifest
+from audio_cache import SegmentCache
+from providers import RenderSettings
+from render_manifest import ManifestEntry, RenderManifest, manifest_path, segment_reuser
+
+FRAME_RATE = 24000
+SETTINGS = RenderSettings(provider="openai", model="tts", voices=("alloy", "nova"))
+SCRIPT = "\n".join(f"speaker-{index % 2 + 1}: 第{index}句話，內容相當豐富。" for index in range(6))
+
+
+def tone(value: int, frames: int, frame_rate: int = FRAME_RATE) -> AudioSegment:
+    """每個取樣值都是 value 的片段，切出的範圍可由取樣值辨識"""
+    return AudioSegment(
+        np.full(frames, value, dtype="<i2").tobytes(), frame_rate=frame_rate, sample_width=2, channels=1
+    )
+
+
+def samples(segment: AudioSegment) -> np.ndarray:
+    return np.frombuffer(bytes(segment.raw_data), dtype="<i2").astype(int)
+
+
+def entry(key: str, offset_frames: int = 0, frames: int = None) -> ManifestEntry:
+    return ManifestEntry(
+        key=key, speaker="speaker-1", provider="openai", model=None, voice=None, instructions=None,
+        characters=1, offset_frames=offset_frames, frames=frames,
+    )
+
+
+@pytest.fixture(autouse=True)
+def no_segment_cache(monkeypatch, tmp_path):
+    # 片段快取中沒有任何片段，重用的片段一律從上次輸出切出
+    monkeypatch.setattr(render_manifest, "segment_cache", SegmentCache(cache_dir=str(tmp_path), enabled=False))
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    """以文本決定取樣值與長度的假 provider，回傳呼叫過的文本列表"""
+    texts = []
+
+    def fetch_segment_audio(settings, speaker, text, cache_stats=None):
+        texts.append(text)
+        value = 100 + sum(text.encode()) % 1000
+        return tone(value, 2400 + 10 * len(text)).raw_data
+
+    def submit_segment_audio(provider_name, data, audio_format=None):
+        future = Future()
+        future.set_result(AudioSegment(data, frame_rate=FRAME_RATE, sample_width=2, channels=1))
+        return future
+
+    monkeypatch.setattr(api, "fetch_segment_audio", fetch_segment_audio)
+    monkeypatch.setattr(api, "submit_segment_audio", submit_segment_audio)
+    return texts
+
+
+def render(script, tmp_path, name, previous_audio=None, volume_boost=6):
+    audio, _, manifest = api.generate_audio_from_script(
+        script, SETTINGS, volume_boost=volume_boost, previous_audio=previous_audio, audio_format="wav"
+    )
+    path = tmp_path / f"{name}.wav"
+    path.write_bytes(audio)
+    manifest.save(manifest_path(path))
+    return path, manifest
+
+
+def test_rerender_regenerates_only_the_edited_line(provider, tmp_path):
+    first_path, first = render(SCRIPT, tmp_path, "first")
+    assert len(provider) == 6
+    assert (first.reused_segments, first.regenerated_segments) == (0, 6)
+
+    provider.clear()
+    edited = SCRIPT.replace("第3句話", "第三句話")
+    second_path, second = render(edited, tmp_path, "second", previous_audio=str(first_path))
+    assert provider == ["第三句話，內容相當豐富。"]
+    assert (second.reused_segments, second.regenerated_segments) == (5, 1)
+    assert [entry.reused for entry in second.entries] == [True, True, True, False, True, True]
+
+    # 切出的片段扣除上次增益後再次套用，結果與完整重新生成相同（增益的取整誤差在 1 以內）
+    full_path, _ = render(edited, tmp_path, "full")
+    rerendered = samples(AudioSegment.from_wav(second_path))
+    expected = samples(AudioSegment.from_wav(full_path))
+    assert rerendered.shape == expected.shape
+    assert np.abs(rerendered - expected).max() <= 1
+
+
+def test_reuse_slices_exact_sample_ranges_with_frame_rate_scale_and_gain():
+    # 上次輸出的 manifest 以 24 kHz 記錄位置，輸出格式（例如 opus）解碼後為 48 kHz
+    previous_manifest = RenderManifest(
+        entries=[entry("a", 0, 100), entry("b", 100, 250), entry("c", 350)],
+        frame_rate=24000,
+        volume_boost=6,
+        audio_format="opus",
+    )
+    previous_audio = tone(1000, 200, 48000) + tone(2000, 500, 48000) + tone(3000, 300, 48000)
+    previous_samples = samples(previous_audio)
+    reuse = segment_reuser((previous_manifest, previous_audio))
+
+    # 位置乘以 2 換算為 48 kHz 的 frame；最後一段延伸到結尾；切出後扣除上次的 6 dB
+    for key, start, end in (("b", 200, 700), ("a", 0, 200), ("c", 700, 1000)):
+        new = entry(key)
+        segment = reuse(new)
+        assert new.reused
+        assert segment.frame_rate == 48000
+        expected = previous_samples[start:end] * 10 ** (-6 / 20)
+        assert samples(segment).shape == expected.shape
+        assert np.abs(samples(segment) - expected).max() <= 1
+
+
+def test_duplicate_hashes_are_matched_in_order():
+    previous_manifest = RenderManifest(
+        entries=[entry("dup", 0, 10), entry("x", 10, 10), entry("dup", 20, 10)], frame_rate=FRAME_RATE
+    )
+    reuse = segment_reuser((previous_manifest, tone(1, 10) + tone(2, 10) + tone(3, 10)))
+
+    # 同一雜湊依出現順序配對上次的第 1 次、第 2 次出現；第 3 次沒有可重用的片段
+    first, second, third = entry("dup"), entry("dup"), entry("dup")
+    assert samples(reuse(first)).tolist() == [1] * 10
+    assert samples(reuse(second)).tolist() == [3] * 10
+    assert reuse(third) is None
+    assert (first.reused, second.reused, third.reused) == (True, True, False)
+
+
+def test_entries_still_in_segment_cache_are_reused_without_slicing(monkeypatch, tmp_path):
+    cache = SegmentCache(cache_dir=str(tmp_path / "cache"), enabled=True)
+    cache.put("a", b"audio")
+    monkeypatch.setattr(render_manifest, "segment_cache", cache)
+    reuse = segment_reuser((RenderManifest(entries=[entry("a", 0, 10)], frame_rate=FRAME_RATE), tone(1, 10)))
+    new = entry("a")
+    assert reuse(new) is None
+    assert new.reused
@@ -0,0 +1,179 @@
+"""text_chunker 的句子切分、長度上限與片段規劃"""
+import re
+import unicodedata
+
+import pytest
+
+import text_chunker
+from text_chunker import plan_dialogue, plan_segments, split_sentences, split_text
+
+ZWJ_FAMILY = "👨‍👩‍👧"
+
+
+def squash(text: str) -> str:
+    """去除空白後比較（切分時區塊前後的空白會被去除）"""
+    return re.sub(r"\s+", "", text)
+
+
+def assert_chunks(text: str, chunks: list, limit: int):
+    assert chunks
+    assert all(0 < len(chunk) <= limit for chunk in chunks)
+    assert squash("".join(chunks)) == squash(text)
+
+
+@pytest.fixture
+def provider_limits(monkeypatch):
+    monkeypatch.setitem(text_chunker.PROVIDER_MAX_CHARS, "test", 120)
+    monkeypatch.setitem(text_chunker.PROVIDER_DIALOGUE_MAX_CHARS, "test", 300)
+    return "test"
+
+
+# ---- 句子切分 ----
+
+def test_chinese_full_width_punctuation():
+    text = "今天天氣很好。你要出門嗎？當然！我們走吧；「好啊。」他說"
+    assert split_sentences(text) == ["今天天氣很好。", "你要出門嗎？", "當然！", "我們走吧；", "「好啊。」", "他說"]
+
+
+def test_english_abbreviations_and_decimals():
+    text = "Use tools, e.g. hammers. Mr. Smith paid 3.14 dollars in the U.S. today! Really? J. K. Rowling agrees."
+    assert split_sentences(text) == [
+        "Use tools, e.g. hammers. ",
+        "Mr. Smith paid 3.14 dollars in the U.S. today! ",
+        "Really? ",
+        "J. K. Rowling agrees.",
+    ]
+
+
+def test_abbreviation_before_newline_still_ends_sentence():
+    assert split_sentences("See the appendix, etc.\nNext line") == ["See the appendix, etc.\n", "Next line"]
+
+
+def test_mixed_chinese_and_english():
+    text = "我們用 Python 3.11 測試 API。Then it works! 結果很好，e.g. 速度變快。"
+    assert split_sentences(text) == ["我們用 Python 3.11 測試 API。", "Then it works! ", "結果很好，e.g. 速度變快。"]
+
+
+def test_last_sentence_end_skips_abbreviations():
+    text = "第一句。Then see Dr. Lee"
+    assert text_chunker.last_sentence_end(text) == len("第一句。")
+
+
+# ---- 區塊切分 ----
+
+def test_short_text_is_single_chunk():
+    assert split_text("  你好。  ", 100) == ["你好。"]
+    assert split_text("   ", 100) == []
+
+
+def test_chinese_chunks_end_on_sentence_boundary():
+    text = "".join(f"這是第{i}句話，內容相當豐富。" for i in range(200))
+    chunks = split_text(text, 300)
+    assert_chunks(text, chunks, 300)
+    assert all(chunk.endswith("。") for chunk in chunks)
+
+
+def test_english_chunks_are_balanced():
+    text = " ".join(f"This is sentence number {i} and it has some words." for i in range(60))
+    chunks = split_text(text, 200)
+    assert_chunks(text, chunks, 200)
+    assert all(chunk.endswith(".") for chunk in chunks)
+    lengths = [len(chunk) for chunk in chunks]
+    assert min(lengths) >= 0.8 * max(lengths)
+
+
+def test_mixed_text_chunks():
+    text = "".join(f"我們今天用 Python {i}.5 版測試 API，效果很好！Then we move on. " for i in range(80))
+    chunks = split_text(text, 500)
+    assert_chunks(text, chunks, 500)
+    lengths = [len(chunk) for chunk in chunks]
+    assert min(lengths) >= 0.8 * max(lengths)
+
+
+def test_target_chars_increases_chunk_count():
+    text = "".join(f"第{i}句。" for i in range(100))
+    assert len(split_text(text, 1000, target_chars=100)) == 5
+    assert len(split_text(text, 1000)) == 1
+
+
+def test_long_sentence_splits_on_clauses_then_whitespace():
+    clauses = "，".join(f"第{i}個子句" for i in range(100)) + "。"
+    chunks = split_text(clauses, 120)
+    assert_chunks(clauses, chunks, 120)
+    assert all(chunk.endswith(("，", "。")) for chunk in chunks)
+
+    words = " ".join(f"word{i}" for i in range(300))
+    chunks = split_text(words, 100)
+    assert_chunks(words, chunks, 100)
+    assert all(re.fullmatch(r"word\d+", word) for chunk in chunks for word in chunk.split())
+
+
+def test_hard_split_without_punctuation():
+    chunks = split_text("a" * 2500, 1000)
+    assert [len(chunk) for chunk in chunks] == [834, 834, 832]
+
+
+@pytest.mark.parametrize("limit", [7, 100, 333, 1000])
+def test_hard_split_keeps_combining_marks(limit):
+    text = "é" * 1500
+    chunks = split_text(text, limit)
+    assert_chunks(text, chunks, limit)
+    assert not any(unicodedata.combining(chunk[0]) for chunk in chunks)
+
+
+@pytest.mark.parametrize("limit", [50, 333, 1000])
+def test_hard_split_keeps_zwj_sequences(limit):
+    text = ZWJ_FAMILY * 500
+    chunks = split_text(text, limit)
+    assert_chunks(text, chunks, limit)
+    assert all(chunk.startswith("👨") and chunk.endswith("👧") for chunk in chunks)
+
+
+@pytest.mark.parametrize("limit", [50, 467, 1000])
+def test_hard_split_keeps_modifiers_and_flags(limit):
+    thumbs = "👍🏽" * 800
+    chunks = split_text(thumbs, limit)
+    assert_chunks(thumbs, chunks, limit)
+    assert all(len(chunk) % 2 == 0 and chunk.startswith("👍") for chunk in chunks)
+
+    flags = "🇹🇼" * 700
+    chunks = split_text(flags, limit)
+    assert_chunks(flags, chunks, limit)
+    assert all(len(chunk) % 2 == 0 for chunk in chunks)
+
+
+# ---- 片段規劃 ----
+
+def test_plan_segments_respects_provider_limit(provider_limits):
+    segments = [
+        ("speaker-1", "".join(f"這是第{i}句話。" for i in range(100))),
+        ("speaker-2", "Short reply."),
+        ("speaker-1", " ".join(f"Sentence {i} is here, e.g. an example." for i in range(40))),
+        ("speaker-2", "x" * 500),
+        ("speaker-1", ZWJ_FAMILY * 100),
+    ]
+    planned = plan_segments(segments, provider_limits)
+    assert all(len(text) <= 120 for _, text in planned)
+    # 切出的區塊依原順序排列，同一片段的區塊連續
+    runs = [speaker for index, (speaker, _) in enumerate(planned) if index == 0 or planned[index - 1][0] != speaker]
+    assert runs == [speaker for speaker, _ in segments]
+    assert squash("".join(text for _, text in planned)) == squash("".join(text for _, text in segments))
+
+
+def test_plan_segments_uses_default_limit_for_unknown_provider():
+    planned = plan_segments([("speaker-1", "字" * 2500)], "unknown")
+    assert all(len(text) <= text_chunker.DEFAULT_MAX_CHARS for _, text in planned)
+    assert len(planned) == 3
+
+
+def test_plan_dialogue_respects_limits(provider_limits):
+    segments = [(f"speaker-{i % 3 + 1}", f"第{i}輪的對話內容。" * (i % 5 + 1)) for i in range(30)]
+    planned = plan_dialogue(segments, provider_limits)
+    for speaker, text in planned:
+        if speaker == text_chunker.DIALOGUE_SPEAKER:
+            assert len(text) <= 300
+            turns = text_chunker.parse_dialogue(text)
+            assert len({turn_speaker for turn_speaker, _ in turns}) <= text_chunker.DIALOGUE_MAX_SPEAKERS
+            assert all(len(f"{turn_speaker}: {turn}") <= 120 for turn_speaker, turn in turns)
+        else:
+            assert len(text) <= 120
@@ -0,0 +1,309 @@
+"""
+依句子邊界切分文本的片段規劃工具
+
+在中英文句末標點處切分，並遵守各 provider 的輸入長度上限；同一段落切出的區塊
+長度盡量平均，讓並行合成時不會被單一過長區塊拖慢。api.py 與 app.py 共用。
+"""
+import math
+import re
+import unicodedata
+
+# 各 provider 單次請求的文本長度上限（字符），由 providers.register_provider 填入
+PROVIDER_MAX_CHARS = {}
+DEFAULT_MAX_CHARS = 1000
+# 支援多說話者對話合成的 provider 單次對話請求的文本長度上限（含說話者標籤）
+PROVIDER_DIALOGUE_MAX_CHARS = {}
+
+# 多說話者片段的 speaker；文本為每行一輪的 "speaker-N: 文本"
+DIALOGUE_SPEAKER = "dialogue"
+# 單一多說話者片段的說話者數上限
+DIALOGUE_MAX_SPEAKERS = 2
+
+# 句末：中文標點直接切分；英文句點等需後接空白或結尾，避免切開 3.14 之類
+_SENTENCE_END = re.compile(
+    r"(?:[。！？；…]+|[.!?;]+(?=\s|$))[」』”’）)\]\"']*\s*"
+    r"|\n+"
+)
+# 句點前的英文縮寫（e.g.、Mr.、U.S. 與單一字母的姓名縮寫）不是句末，見 _is_abbreviation
+_ABBREVIATION_WORD = re.compile(r"(?<![A-Za-z.])[A-Za-z]+(?:\.[A-Za-z]+)*\Z")
+ABBREVIATIONS = frozenset({
+    "mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "no", "fig", "vol", "approx", "inc", "ltd", "co",
+    "e.g", "i.e", "cf", "al", "u.s", "u.k", "a.m", "p.m",
+})
+# 區塊結尾不能是這些字元：零寬連接符會把前後的字元連成一個 emoji
+_JOINERS = frozenset("\u200d")
+# 子句：逗號、頓號、冒號
+_CLAUSE_END = re.compile(r"[，、：,:]+[」』”’）)\]\"']*\s*")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _is_abbreviation(text: str, match: re.Match) -> bool:
+    """句末 match 是否為英文縮寫後的單一句點（後接換行時仍視為句末）"""
+    start = match.start()
+    if text[start] != "." or text[start + 1:start + 2] in (".", "!", "?", ";") or "\n" in match.group():
+        return False
+    word = _ABBREVIATION_WORD.search(text, max(0, start - 12), start)
+    if word is None:
+        return False
+    word = word.group().lower()
+    return len(word) == 1 or word in ABBREVIATIONS
+
+
+def _sentence_ends(text: str):
+    """依序產出各句末 match（略過英文縮寫）"""
+    for match in _SENTENCE_END.finditer(text):
+        if text[match.start()] != "." or not _is_abbreviation(text, match):
+            yield match
+
+
+def _split_keep(text: str, pattern: re.Pattern) -> list:
+    """依 pattern 切分並保留分隔符，各片段串接後等於原文"""
+    matches = _sentence_ends(text) if pattern is _SENTENCE_END else pattern.finditer(text)
+    pieces = []
+    start = 0
+    for match in matches:
+        end = match.end()
+        if end > start:
+            pieces.append(text[start:end])
+            start = end
+    if start < len(text):
+        pieces.append(text[start:])
+    return pieces
+
+
+def _is_cluster_continuation(char: str) -> bool:
+    """組合字元、變體選擇符、零寬連接符、膚色修飾符不能作為區塊開頭"""
+    return (
+        unicodedata.category(char) in ("Mn", "Mc", "Me", "Cf")
+        or "\U0001f3fb" <= char <= "\U0001f3ff"
+    )
+
+
+def _is_regional_indicator(char: str) -> bool:
+    return "\U0001f1e6" <= char <= "\U0001f1ff"
+
+
+def _splits_cluster(text: str, end: int) -> bool:
+    """在 end 切開是否會拆散字元組合（下一字元接在前面、前一字元把前後連起來，或切開國旗的兩個區域指示符）"""
+    if _is_cluster_continuation(text[end]) or text[end - 1] in _JOINERS:
+        return True
+    if _is_regional_indicator(text[end]) and _is_regional_indicator(text[end - 1]):
+        # 連續的區域指示符兩兩成對，前面有奇數個時 end 落在一對中間
+        start = end - 1
+        while start > 0 and _is_regional_indicator(text[start - 1]):
+            start -= 1
+        return (end - start) % 2 == 1
+    return False
+
+
+def _hard_split(text: str, max_chars: int) -> list:
+    """沒有任何標點或空白可用時，按平均長度切分，但不切開字元組合（單一組合超過上限時才切開）"""
+    step = math.ceil(len(text) / math.ceil(len(text) / max_chars))
+    pieces = []
+    start = 0
+    while len(text) - start > max_chars:
+        end = start + step
+        while end > start + 1 and _splits_cluster(text, end):
+            end -= 1
+        if end == start + 1 and _splits_cluster(text, end):
+            end = start + step
+        pieces.append(text[start:end])
+        start = end
+    pieces.append(text[start:])
+    return pieces
+
+
+def _split_oversized(piece: str, max_chars: int) -> list:
+    """將超過上限的句子依子句、空白、最後按長度切分，回傳不超過上限的小片段（由 _pack_balanced 合併）"""
+    if len(piece) <= max_chars:
+        return [piece]
+    for pattern in (_CLAUSE_END, _WHITESPACE):
+        parts = _split_keep(piece, pattern)
+        if len(parts) > 1:
+            result = []
+            for part in parts:
+                result.extend(_split_oversized(part, max_chars))
+            return result
+    return _hard_split(piece, max_chars)
+
+
+def _pack(pieces: list, max_chars: int, target_chars: float) -> list:
+    """依序合併片段，單塊不超過 max_chars，達到 target_chars 即換下一塊"""
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if current and (len(current) + len(piece) > max_chars or len(current) >= target_chars):
+            chunks.append(current)
+            current = ""
+        current += piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _count_chunks(lengths: list, max_chars: int) -> int:
+    """依序合併時，單塊不超過 max_chars 所需的最少塊數"""
+    count = 0
+    current = 0
+    for length in lengths:
+        if current and current + length > max_chars:
+            count += 1
+            current = 0
+        current += length
+    return count + (1 if current else 0)
+
+
+def _pack_near(pieces: list, max_chars: int, target_chars: float) -> list:
+    """依序合併片段，單塊不超過 max_chars，切點選在最接近 target_chars 整數倍位置的片段邊界"""
+    chunks = []
+    start = 0
+    size = 0
+    position = 0
+    for index, piece in enumerate(pieces):
+        length = len(piece)
+        # 加入這個片段後的結尾比不加入時離下一個平均切點更遠（或超過上限）就先換塊
+        if size and (size + length > max_chars or position + length / 2 >= (len(chunks) + 1) * target_chars):
+            chunks.append("".join(pieces[start:index]))
+            start = index
+            size = 0
+        size += length
+        position += length
+    if size:
+        chunks.append("".join(pieces[start:]))
+    return chunks
+
+
+def _pack_balanced(pieces: list, max_chars: int, chunk_count: int) -> list:
+    """
+    將片段合併為至多 chunk_count 塊（放不下時為 max_chars 下的最少塊數），並讓最長的一塊盡量短
+
+    先以二分搜尋找出能放進這麼多塊的最小上限，再於該上限內把切點放在最接近平均位置的片段邊界，
+    最後一塊不會特別短或特別長。
+    """
+    lengths = [len(piece) for piece in pieces]
+    total = sum(lengths)
+    chunk_count = max(chunk_count, _count_chunks(lengths, max_chars))
+    low, high = max(max(lengths), math.ceil(total / chunk_count)), max_chars
+    while low < high:
+        middle = (low + high) // 2
+        if _count_chunks(lengths, middle) <= chunk_count:
+            high = middle
+        else:
+            low = middle + 1
+    chunks = _pack_near(pieces, low, total / chunk_count)
+    return chunks if len(chunks) <= chunk_count else _pack(pieces, low, low)
+
+
+def split_sentences(text: str) -> list:
+    """依中英文句末標點與換行切分句子（保留標點）"""
+    return [piece for piece in _split_keep(text, _SENTENCE_END) if piece.strip()]
+
+
+def last_sentence_end(text: str) -> int:
+    """最後一個句末標點（含其後的引號與空白）之後的位置；沒有句末時為 0"""
+    end = 0
+    for match in _sentence_ends(text):
+        end = match.end()
+    return end
+
+
+def split_text(text: str, max_chars: int = DEFAULT_MAX_CHARS, target_chars: int = None) -> list:
+    """
+    將文本切成不超過 max_chars 的區塊，盡量在句子邊界切分且各區塊長度平均
+
+    target_chars 可指定偏好的區塊長度（例如為了提高並行度），實際仍不超過 max_chars。
+    """
+    text = text.strip()
+    if not text:
+        return []
+    limit = max(1, min(max_chars, target_chars or max_chars))
+    if len(text) <= limit:
+        return [text]
+
+    pieces = []
+    for sentence in split_sentences(text):
+        pieces.extend(_split_oversized(sentence, max_chars))
+
+    # 以平均長度為目標分配，避免最後一塊特別短或特別長
+    chunks = [chunk.strip() for chunk in _pack_balanced(pieces, max_chars, math.ceil(len(text) / limit))]
+    return [chunk for chunk in chunks if chunk]
+
+
+def get_max_chars(provider: str) -> int:
+    """取得 provider 單次請求的文本長度上限"""
+    return PROVIDER_MAX_CHARS.get(provider, DEFAULT_MAX_CHARS)
+
+
+def iter_plan_segments(segments, provider: str, max_chars: int = None, target_chars: int = None):
+    """
+    將 script_parser.parse_script 的 (speaker, text) 片段切成符合 provider 上限的合成單位，逐一產出
+
+    過長的片段會拆成多個同一說話者的連續片段，順序不變，可直接交給並行合成；
+    segments 可為 generator，邊解析邊切分。
+    """
+    limit = max_chars or get_max_chars(provider)
+    for speaker, text in segments:
+        for chunk in split_text(text, limit, target_chars):
+            yield speaker, chunk
+
+
+def plan_segments(segments, provider: str, max_chars: int = None, target_chars: int = None) -> list:
+    """iter_plan_segments 的列表版本"""
+    return list(iter_plan_segments(segments, provider, max_chars, target_chars))
+
+
+def format_dialogue(turns: list) -> str:
+    """[(speaker, text), ...] → 每行一輪的對話文本"""
+    return "\n".join(f"{speaker}: {text}" for speaker, text in turns)
+
+
+def parse_dialogue(text: str) -> list:
+    """format_dialogue 的反向轉換"""
+    turns = []
+    for line in text.split("\n"):
+        speaker, _, turn = line.partition(": ")
+        turns.append((speaker, turn))
+    return turns
+
+
+def iter_plan_dialogue(segments, provider: str, max_chars: int = None):
+    """
+    將連續的對話輪次合併為多說話者片段 (DIALOGUE_SPEAKER, 對話文本)，每段不超過 max_chars，逐一產出
+
+    單輪過長時先依句子邊界切分；每段最多 DIALOGUE_MAX_SPEAKERS 位說話者，出現第三位時換下一段。
+    只有一輪的片段維持一般的 (speaker, text)，由單一聲音合成。segments 可為 generator。
+    """
+    limit = max_chars or PROVIDER_DIALOGUE_MAX_CHARS.get(provider) or get_max_chars(provider)
+    turn_limit = min(limit, get_max_chars(provider))
+
+    group = []
+    speakers = set()
+    length = 0
+
+    def flush():
+        if len(group) == 1:
+            yield group[0]
+        elif group:
+            yield DIALOGUE_SPEAKER, format_dialogue(group)
+        group.clear()
+        speakers.clear()
+
+    for speaker, text in segments:
+        label_chars = len(f"{speaker}: ")
+        for chunk in split_text(text, max(1, turn_limit - label_chars)):
+            line_chars = label_chars + len(chunk) + 1  # 含換行
+            if group and (
+                length + line_chars > limit
+                or (speaker not in speakers and len(speakers) >= DIALOGUE_MAX_SPEAKERS)
+            ):
+                yield from flush()
+                length = 0
+            group.append((speaker, chunk))
+            speakers.add(speaker)
+            length += line_chars
+    yield from flush()
+
+
+def plan_dialogue(segments, provider: str, max_chars: int = None) -> list:
+    """iter_plan_dialogue 的列表版本"""
+    return list(iter_plan_dialogue(segments, provider, max_chars))
@@ -0,0 +1,135 @@
+"""
+TTS provider 客戶端註冊表
+
+依 (provider, 憑證, 區域) 重用已建立的客戶端與其 keep-alive 連線池，
+避免每個片段都重新建立客戶端與 TLS 連線。api.py 與 app.py 共用。
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import boto3
+import requests
+from botocore.config import Config as BotoConfig
+from dotenv import load_dotenv
+from google import genai
+from openai import OpenAI
+from requests.adapters import HTTPAdapter
+
+load_dotenv()
+
+CLIENT_POOL_SIZE = int(os.getenv("TTS_CLIENT_POOL_SIZE", "32"))
+CLIENT_IDLE_SECONDS = float(os.getenv("TTS_CLIENT_IDLE_SECONDS", "600"))
+HTTP_POOL_CONNECTIONS = int(os.getenv("TTS_HTTP_POOL_CONNECTIONS", "16"))
+
+
+def _fingerprint(secret: str) -> str:
+    """憑證只以雜湊值作為鍵的一部分，不在註冊表中保存明文"""
+    if not secret:
+        return ""
+    return hashlib.sha256(secret.encode("utf-8")).hexdigest()[:16]
+
+
+class ClientRegistry:
+    """有容量上限、閒置逾時的執行緒安全客戶端註冊表"""
+
+    def __init__(self, max_size: int = CLIENT_POOL_SIZE, idle_seconds: float = CLIENT_IDLE_SECONDS):
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._clients = OrderedDict()  # key -> [client, last_used]
+        self.created = 0
+        self.reused = 0
+
+    def _expire(self, now: float):
+        # 被淘汰的客戶端可能仍有其他執行緒在使用，只移除參照，交由 GC 關閉連線
+        for key in [k for k, (_, used) in self._clients.items() if now - used > self.idle_seconds]:
+            del self._clients[key]
+        while len(self._clients) > self.max_size:
+            self._clients.popitem(last=False)
+
+    def get(self, key: tuple, factory):
+        """取得 key 對應的客戶端，不存在時以 factory() 建立"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._clients.get(key)
+            if entry is not None:
+                entry[1] = now
+                self._clients.move_to_end(key)
+                self.reused += 1
+                return entry[0]
+            # 在鎖內建立，boto3 預設 session 建立客戶端並非執行緒安全
+            client = factory()
+            self._clients[key] = [client, now]
+            self.created += 1
+            self._expire(now)
+            return client
+
+    def info(self) -> dict:
+        with self._lock:
+            return {
+                "clients": len(self._clients),
+                "created": self.created,
+                "reused": self.reused,
+            }
+
+
+client_registry = ClientRegistry()
+
+
+def get_openai_client(api_key: str) -> OpenAI:
+    """取得共用的 OpenAI 客戶端（內建 httpx 連線池；重試交由 rate_limit 處理）"""
+    return client_registry.get(
+        ("openai", _fingerprint(api_key), None),
+        lambda: OpenAI(api_key=api_key, max_retries=0),
+    )
+
+
+def get_gemini_client(api_key: str) -> genai.Client:
+    """取得共用的 Gemini 客戶端"""
+    return client_registry.get(
+        ("gemini", _fingerprint(api_key), None),
+        lambda: genai.Client(api_key=api_key),
+    )
+
+
+def get_polly_client(region: str, access_key: str = None, secret_key: str = None):
+    """取得共用的 AWS Polly 客戶端，未提供金鑰時使用預設憑證鏈"""
+    def create():
+        client_kwargs = {
+            "region_name": region,
+            # 重試交由 rate_limit 處理，節流錯誤才能即時調降並行度
+            "config": BotoConfig(
+                max_pool_connections=HTTP_POOL_CONNECTIONS,
+                retries={"total_max_attempts": 1},
+            ),
+        }
+        if access_key and secret_key:
+            client_kwargs.update(
+                aws_access_key_id=access_key,
+                aws_secret_access_key=secret_key,
+            )
+        return boto3.session.Session().client("polly", **client_kwargs)
+
+    return client_registry.get(
+        ("polly", f"{access_key or ''}:{_fingerprint(secret_key)}", region),
+        create,
+    )
+
+
+def get_http_session() -> requests.Session:
+    """取得共用的 keep-alive HTTP session（台語 TTS 使用）"""
+    def create():
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=HTTP_POOL_CONNECTIONS,
+            pool_maxsize=HTTP_POOL_CONNECTIONS,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    return client_registry.get(("http", "", None), create)